@@ -1,19 +1,66 @@
 jQuery(function($) {
     $(document).ready(function() {
-        $(".copy_data").unbind('click');
-        $(".copy_data").click(function(ev) {
+        // Modal HTML already fetched, keyed by the copy's data-form URL.
+        var modalCache = {};
+
+        function idFromUrl(url) {
+            var match = /\/(\d+)\/?$/.exec(url || "");
+            return match ? match[1] : null;
+        }
+
+        // Fetch every modal for the copies listed on the page in one request,
+        // so that opening one needs no round trip.
+        function prefetchModals() {
+            var batchUrl = $("#copyModal").data("batch");
+            if (!batchUrl) {
+                return;
+            }
+            var ids = {};
+            $(".copy_data").each(function() {
+                var url = $(this).data("form");
+                var id = idFromUrl(url);
+                if (id && !(url in modalCache)) {
+                    ids[id] = url;
+                }
+            });
+            var keys = Object.keys(ids).slice(0, 100);
+            if (!keys.length) {
+                return;
+            }
+            $.getJSON(batchUrl, {ids: keys.join(",")}, function(data) {
+                $.each(data.modals, function(id, html) {
+                    modalCache[ids[id]] = html;
+                });
+            });
+        }
+
+        function showModal() {
+            $("#copyModal").modal('show');
+            $(document).click(function(event) {
+                if (! $(event.target).closest(".modal-dialog").length) {
+                	$("#copyModal").modal('hide');
+                }
+            });
+        }
+
+        // Delegated so rows appended by infinite_scroll.js open the modal too.
+        $(document).off('click', '.copy_data');
+        $(document).on('click', '.copy_data', function(ev) {
             ev.preventDefault();
             var url=$(this).data("form");
-            $("#copyModal").load(url, function() {
-                $("#copyModal").modal('show');
-                $(document).click(function(event) {
-                    if (! $(event.target).closest(".modal-dialog").length) {
-                    	$("#copyModal").modal('hide');
-                    }
+            if (url in modalCache) {
+                $("#copyModal").html(modalCache[url]);
+                showModal();
+            } else {
+                $("#copyModal").load(url, function(html) {
+                    modalCache[url] = html;
+                    showModal();
                 });
-            });
+            }
             return false;
         });
+        $(document).on('census:rows-added', prefetchModals);
+        prefetchModals();
 
         var copy_cen = '';
         var pathlist = window.location.pathname
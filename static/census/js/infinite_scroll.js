@@ -0,0 +1,41 @@
+// Infinite scroll for keyset-paginated copy tables.
+// When the pager's "Next" link comes into view, the next page is fetched as JSON
+// (?format=json) and its rows are appended to the table named by data-rows.
+// Without JavaScript the pager's Previous / Next links work as plain links.
+jQuery(function($) {
+    var $pager = $(".pager[data-rows]");
+    if (!$pager.length) {
+        return;
+    }
+    var $rows = $($pager.data("rows"));
+    var loading = false;
+
+    function loadNext() {
+        var $next = $pager.find(".pager-next");
+        if (loading || !$next.length) {
+            return;
+        }
+        loading = true;
+        var url = $next.attr("href");
+        url += (url.indexOf("?") === -1 ? "?" : "&") + "format=json";
+        $.getJSON(url, function(data) {
+            $rows.append(data.rows);
+            $(document).trigger("census:rows-added");
+            if (data.next_url) {
+                $next.attr("href", data.next_url);
+            } else {
+                $next.remove();
+            }
+        }).always(function() {
+            loading = false;
+        });
+    }
+
+    $(window).on("scroll", function() {
+        var $next = $pager.find(".pager-next");
+        if ($next.length &&
+                $(window).scrollTop() + $(window).height() > $next.offset().top - 200) {
+            loadNext();
+        }
+    });
+});
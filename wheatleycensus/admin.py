@@ -2,26 +2,66 @@
 # Registers models with the Django admin interface and customizes their display.
 # Organized by model category for clarity and maintainability.
 
+from django import forms
 from django.contrib import admin
-from . import models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from import_export.admin import ImportExportMixin
+from . import copy_collections, models, resources
+from .pagination import EstimatedCountPaginator
+
+
+def _count_of(queryset, field):
+    """Correlated subquery counting the rows of `queryset` whose `field` is the outer row."""
+    counted = (queryset.filter(**{field: OuterRef('pk')}).order_by()
+               .values(field).annotate(n=Count('pk')).values('n'))
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+# =====================
+# Large-table Admin Defaults
+# =====================
+
+# Changelists over tables that grow with the census: estimated totals instead of
+# COUNT(*) over the whole table, and no second count for the unfiltered total.
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 # =====================
 # Inline Admin Classes
 # =====================
 
-# ProvenanceRecord inline for use in ProvenanceName and Copy admin
+# ProvenanceRecord inline for use in Copy admin
 class ProvenanceRecordInline(admin.TabularInline):
     model = models.ProvenanceRecord
     extra = 1
     fields = ('provenance_name',)
+    autocomplete_fields = ('provenance_name',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('provenance_name')
+
+# ProvenanceRecord inline for use in ProvenanceName admin (the copies a name owned)
+class ProvenanceNameRecordInline(admin.TabularInline):
+    model = models.ProvenanceRecord
+    extra = 1
+    fields = ('copy',)
+    autocomplete_fields = ('copy',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('copy__issue')
 
 # Copy inline for use in Issue and Edition admin
 class CopyInline(admin.TabularInline):
     model = models.Copy
     extra = 1
     fields = ('wc_number','issue','location','shelfmark','verification','signed_by_author')
+    autocomplete_fields = ('issue','location')
     ordering = ('wc_number',)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('issue__edition__title', 'location')
+
 # Issue inline for use in Edition admin
 class IssueInline(admin.TabularInline):
     model = models.Issue
@@ -38,6 +78,26 @@ class EditionInline(admin.TabularInline):
     inlines = [IssueInline]
     ordering = ('edition_number',)
 
+# Curated collection memberships for use in Copy admin; rule-based collections
+# are maintained automatically and are not shown here.
+class CuratedCollectionForm(forms.ModelForm):
+    collection = forms.ChoiceField(choices=copy_collections.CURATED_CHOICES)
+
+    class Meta:
+        model = models.CopyCollection
+        fields = ('collection',)
+
+class CuratedCollectionInline(admin.TabularInline):
+    model = models.CopyCollection
+    form = CuratedCollectionForm
+    extra = 0
+    verbose_name = "Curated collection"
+    verbose_name_plural = "Curated collections"
+
+    def get_queryset(self, request):
+        curated = [slug for slug, _ in copy_collections.CURATED_CHOICES]
+        return super().get_queryset(request).filter(collection__in=curated)
+
 # =====================
 # Location Admin
 # =====================
@@ -51,17 +111,22 @@ class LocationAdmin(admin.ModelAdmin):
 # Provenance Admin
 # =====================
 @admin.register(models.ProvenanceName)
-class ProvenanceNameAdmin(admin.ModelAdmin):
+class ProvenanceNameAdmin(ImportExportMixin, LargeTableAdmin):
+    resource_classes = (resources.ProvenanceNameResource,)
     list_display  = ('name','start_century','end_century','gender','viaf')
     search_fields = ('name',)
     list_filter   = ('start_century','end_century','gender')
-    inlines       = (ProvenanceRecordInline,)
+    inlines       = (ProvenanceNameRecordInline,)
 
 @admin.register(models.ProvenanceRecord)
-class ProvenanceRecordAdmin(admin.ModelAdmin):
+class ProvenanceRecordAdmin(ImportExportMixin, LargeTableAdmin):
+    resource_classes = (resources.ProvenanceRecordResource,)
     list_display  = ('provenance_name','copy')
     search_fields = ('provenance_name__name','copy__wc_number')
-    list_filter   = ('provenance_name',)
+    # Filtering by owner gender rather than listing every provenance name in the sidebar
+    list_filter   = ('provenance_name__gender',)
+    list_select_related = ('provenance_name','copy__issue')
+    autocomplete_fields = ('provenance_name','copy')
 
 # =====================
 # Bibliographic Admin (Title, Edition, Issue, Copy)
@@ -72,36 +137,52 @@ class TitleAdmin(admin.ModelAdmin):
     search_fields = ('title',)
     inlines       = (EditionInline,)
 
+    def get_queryset(self, request):
+        # Counts come from the changelist query itself, not two queries per row
+        return super().get_queryset(request).annotate(
+            edition_total=_count_of(models.Edition.objects.all(), 'title'),
+            copy_total=_count_of(models.Copy.objects.all(), 'issue__edition__title'),
+        )
+
     def edition_count(self,obj):
         """Return the number of editions for this title."""
-        return obj.edition_set.count()
+        return obj.edition_total
     edition_count.short_description = "Editions"
+    edition_count.admin_order_field = 'edition_total'
 
     def copy_count(self,obj):
         """Return the number of copies for this title."""
-        return models.Copy.objects.filter(issue__edition__title=obj).count()
+        return obj.copy_total
     copy_count.short_description = "Copies"
+    copy_count.admin_order_field = 'copy_total'
 
 @admin.register(models.Edition)
 class EditionAdmin(admin.ModelAdmin):
     list_display  = ('title','edition_number','edition_format')
     search_fields = ('title__title',)
     list_filter   = ('edition_format',)
+    list_select_related = ('title',)
+    autocomplete_fields = ('title',)
     inlines       = (IssueInline,)
 
 @admin.register(models.Issue)
-class IssueAdmin(admin.ModelAdmin):
+class IssueAdmin(LargeTableAdmin):
     list_display  = ('edition','year','start_date','end_date','bibliographic_data')  # new
     search_fields = ('edition__title__title','year')
     list_filter   = ('year',)
+    list_select_related = ('edition__title',)
+    autocomplete_fields = ('edition',)
     inlines       = (CopyInline,)
 
 @admin.register(models.Copy)
-class CopyAdmin(admin.ModelAdmin):
+class CopyAdmin(ImportExportMixin, LargeTableAdmin):
+    resource_classes = (resources.CopyResource,)
     list_display  = ('wc_number','issue','location','shelfmark','verification','signed_by_author')
     search_fields = ('wc_number','issue__edition__title__title','location__name_of_library_collection')
     list_filter   = ('verification','fragment','from_estc')
-    inlines       = (ProvenanceRecordInline,)
+    list_select_related = ('issue__edition__title','location')
+    autocomplete_fields = ('issue','location','created_by')
+    inlines       = (ProvenanceRecordInline, CuratedCollectionInline)
     list_per_page = 25
 
 # =====================
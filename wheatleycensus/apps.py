@@ -10,3 +10,8 @@ class WheatleycensusConfig(AppConfig):
     Used by Django to identify and configure the app.
     """
     name = 'wheatleycensus'
+
+    def ready(self):
+        # Connect model signal handlers (search index and cache maintenance) and the
+        # database connection hooks.
+        from . import db, signals, snapshot  # noqa: F401
@@ -0,0 +1,132 @@
+# wheatleycensus/autocomplete.py
+# In-process prefix index behind the /autofill/location/ and /autofill/provenance/ endpoints.
+# Each index keeps a sorted array of normalized keys (the whole name plus every word
+# of it), so a lookup is a binary search followed by a short scan; no database access.
+#
+# Indexes are built lazily on first use. Writes in this process update them in place
+# (see signals.py) and bump a data version; other processes notice the new version
+# and rebuild from a single query on their next lookup. The version check reads
+# the cached data versions (versioning.py), so a warm lookup makes no queries; at
+# most one lookup per VERSION_MAX_AGE re-reads the versions themselves.
+
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from . import versioning
+from .models import Location, ProvenanceName
+
+# Number of suggestions returned per lookup.
+DEFAULT_LIMIT = 10
+# Upper bound on keys examined for very short, very common prefixes.
+MAX_SCAN = 5000
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces."""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return ' '.join(''.join(ch if ch.isalnum() else ' ' for ch in text).split())
+
+
+class PrefixIndex:
+    """Ranked prefix lookup over the names of one model field."""
+
+    def __init__(self, model, field, namespace):
+        self.model = model
+        self.field = field
+        self.namespace = namespace
+        self.version = None
+        self._names = {}   # pk -> display name
+        self._keys = []    # sorted (normalized key, is_word, pk): the whole name and each later word
+        self._lock = threading.RLock()
+
+    # --- building ---
+    @staticmethod
+    def _entry_keys(pk, name):
+        norm = normalize(name)
+        if not norm:
+            return []
+        keys = {(norm, False, pk)}
+        keys.update((word, True, pk) for word in norm.split()[1:])
+        return sorted(keys)
+
+    def _build(self):
+        version = versioning.get_version(self.namespace)
+        names = dict(self.model.objects.exclude(**{f'{self.field}__isnull': True})
+                     .values_list('pk', self.field))
+        keys = sorted(k for pk, name in names.items() for k in self._entry_keys(pk, name))
+        with self._lock:
+            self._names, self._keys, self.version = names, keys, version
+
+    def _ensure_current(self):
+        if self.version != versioning.get_version(self.namespace):
+            self._build()
+
+    # --- incremental maintenance ---
+    def _discard(self, pk):
+        name = self._names.pop(pk, None)
+        for key in self._entry_keys(pk, name):
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def update(self, pk, name):
+        """Add or replace one entry after a save in this process."""
+        with self._lock:
+            current = self.version == versioning.get_version(self.namespace)
+            if current:
+                self._discard(pk)
+                if name:
+                    self._names[pk] = name
+                    for key in self._entry_keys(pk, name):
+                        insort(self._keys, key)
+            versioning.bump_version(self.namespace)
+            if current:
+                self.version = versioning.get_version(self.namespace)
+
+    def remove(self, pk):
+        """Drop one entry after a delete in this process."""
+        self.update(pk, None)
+
+    # --- lookup ---
+    def search(self, query, limit=DEFAULT_LIMIT):
+        """Return up to `limit` display names matching `query`, best first."""
+        words = normalize(query).split()
+        if not words:
+            return []
+        self._ensure_current()
+        with self._lock:
+            # Rank 0: the whole name starts with the query.
+            # Rank 1: some word of the name starts with the first query word.
+            best = {}
+            for rank, prefix in ((0, ' '.join(words)), (1, words[0])):
+                i = bisect_left(self._keys, (prefix,))
+                end = min(len(self._keys), i + MAX_SCAN)
+                while i < end and self._keys[i][0].startswith(prefix):
+                    _, is_word, pk = self._keys[i]
+                    if rank or not is_word:
+                        best[pk] = min(rank, best.get(pk, rank))
+                    i += 1
+            ranked = []
+            for pk, rank in best.items():
+                name = self._names[pk]
+                if rank and len(words) > 1:
+                    # Every query word must start some word of the name.
+                    name_words = normalize(name).split()
+                    if not all(any(w.startswith(q) for w in name_words) for q in words):
+                        continue
+                ranked.append((rank, len(name), name.casefold(), name))
+        ranked.sort()
+        matches, seen = [], set()
+        for *_, name in ranked:
+            if name not in seen:
+                seen.add(name)
+                matches.append(name)
+                if len(matches) == limit:
+                    break
+        return matches
+
+
+locations = PrefixIndex(Location, 'name_of_library_collection', 'autocomplete-location')
+provenance_names = PrefixIndex(ProvenanceName, 'name', 'autocomplete-provenance')
@@ -0,0 +1,121 @@
+# wheatleycensus/copy_collections.py
+# Registry of the browse collections offered by search (?field=collection&value=<slug>).
+# Membership is precomputed in the CopyCollection table, so browsing a collection or
+# counting it is one indexed lookup instead of joins through the provenance tables.
+#
+# A collection with a `rule` (a Q over Copy) is maintained automatically: signals.py
+# calls refresh() for the affected copies whenever a Copy, ProvenanceRecord or
+# ProvenanceName is saved. A collection without a rule is curated by hand in the
+# admin. To add a collection, add an entry to COLLECTIONS; for a rule-based one, run
+# `python manage.py refresh_collections` once to fill it.
+
+from django.apps import apps as django_apps
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from . import versioning
+
+
+class Collection:
+    """One browse collection."""
+
+    def __init__(self, slug, label, display, rule=None):
+        self.slug = slug
+        self.label = label        # autocomplete label
+        self.display = display    # search results heading
+        self.rule = rule
+
+    @property
+    def curated(self):
+        return self.rule is None
+
+
+COLLECTIONS = [
+    Collection(
+        'earlyprovenance', 'With known early provenance (before 1700)',
+        'Copies with known early provenance (before 1700)',
+        Q(provenance_records__provenance_name__start_century='17')),
+    Collection(
+        'womanowner', 'With a known woman owner', 'Copies with a known woman owner',
+        Q(provenance_records__provenance_name__gender='F')),
+    Collection(
+        'earlywomanowner', 'With a known woman owner before 1800',
+        'Copies with a known woman owner before 1800',
+        # Both conditions in one Q so they apply to the same owner.
+        Q(provenance_records__provenance_name__gender='F',
+          provenance_records__provenance_name__start_century__in=('17', '18'))),
+    Collection(
+        'marginalia', 'Includes marginalia', 'Copies that include marginalia',
+        Q(marginalia__isnull=False) & ~Q(marginalia='')),
+    Collection(
+        'earlysammelband', 'In an early sammelband', 'Copies in an early sammelband'),
+]
+BY_SLUG = {c.slug: c for c in COLLECTIONS}
+CURATED_CHOICES = [(c.slug, c.label) for c in COLLECTIONS if c.curated]
+
+
+def get(slug):
+    """Return the Collection for a slug, or None."""
+    return BY_SLUG.get(slug)
+
+
+def members(queryset, slug):
+    """Restrict a Copy queryset to the members of a collection."""
+    return queryset.filter(collection_memberships__collection=slug)
+
+
+# ------------------------------------------------------------------------------
+# Maintenance
+# ------------------------------------------------------------------------------
+def refresh(copy_ids=None, using='default', apps=None):
+    """
+    Bring rule-based memberships up to date for the given copies (all copies when
+    copy_ids is None). `apps` is the app registry to take models from; migrations
+    pass their historical one.
+    """
+    apps = apps or django_apps
+    Copy = apps.get_model('wheatleycensus', 'Copy')
+    CopyCollection = apps.get_model('wheatleycensus', 'CopyCollection')
+    if copy_ids is not None:
+        copy_ids = [int(pk) for pk in copy_ids]
+        if not copy_ids:
+            return
+
+    changed = False
+    for collection in COLLECTIONS:
+        if collection.curated:
+            continue
+        wanted = Copy.objects.using(using).filter(collection.rule)
+        current = CopyCollection.objects.using(using).filter(collection=collection.slug)
+        if copy_ids is not None:
+            wanted = wanted.filter(pk__in=copy_ids)
+            current = current.filter(copy_id__in=copy_ids)
+        wanted = set(wanted.values_list('pk', flat=True).distinct())
+        present = set(current.values_list('copy_id', flat=True))
+        stale = sorted(present - wanted)
+        for i in range(0, len(stale), 500):
+            current.filter(copy_id__in=stale[i:i + 500]).delete()
+        if wanted - present:
+            CopyCollection.objects.using(using).bulk_create(
+                [CopyCollection(collection=collection.slug, copy_id=pk) for pk in wanted - present],
+                batch_size=1000, ignore_conflicts=True)
+        changed = changed or present != wanted
+    if changed:
+        versioning.bump_version('collections')
+
+
+# ------------------------------------------------------------------------------
+# Counts
+# ------------------------------------------------------------------------------
+def counts():
+    """Return {slug: number of canonical (verified or unverified) copies}, cached."""
+    CopyCollection = django_apps.get_model('wheatleycensus', 'CopyCollection')
+
+    def compute():
+        rows = (CopyCollection.objects.filter(copy__verification__in=('U', 'V'))
+                .values_list('collection').annotate(n=Count('id')))
+        found = dict(rows)
+        return {c.slug: found.get(c.slug, 0) for c in COLLECTIONS}
+
+    key = versioning.versioned_key('collections', 'counts', versioning.get_version('copies'))
+    return cache.get_or_set(key, compute, versioning.CACHE_TIMEOUT)
@@ -0,0 +1,86 @@
+# wheatleycensus/db.py
+# Connection handling for the remote, pooled Postgres database (see DATABASES in
+# settings.py).
+#
+# retry_on_disconnect re-runs a read-only view when its database connection was
+# dropped under it (pooler restart, idle timeout, network blip): the dead
+# connection is closed, Django opens a fresh one on the next query, and the view
+# runs again, at most RETRY_ATTEMPTS more times. Errors on a connection that is
+# still usable (bad SQL, timeouts, constraint violations) are never retried, and
+# neither is anything inside a transaction.
+#
+# pool_stats() reports the psycopg pool of each pooled alias; it and the
+# connection and retry counters are exported on /metrics/.
+
+import logging
+import time
+from functools import wraps
+
+from django.db import InterfaceError, OperationalError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRY_ATTEMPTS = 1
+# Seconds to wait before retry n (n = 1, 2, ...): RETRY_BACKOFF * n.
+RETRY_BACKOFF = 0.05
+RETRY_METHODS = ('GET', 'HEAD')
+
+
+def _lost(connection):
+    """Whether `connection` was opened and can no longer be used."""
+    return connection.connection is not None and not connection.is_usable()
+
+
+def _drop_lost_connections():
+    """Close every connection that has gone away; return their aliases."""
+    if any(c.in_atomic_block for c in connections.all(initialized_only=True)):
+        return []
+    lost = [c for c in connections.all(initialized_only=True) if _lost(c)]
+    for connection in lost:
+        connection.close()
+    return [c.alias for c in lost]
+
+
+def retry_on_disconnect(view):
+    """Decorate a read-only view to run again after a dropped database connection."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return view(request, *args, **kwargs)
+            except (OperationalError, InterfaceError) as exc:
+                if request.method not in RETRY_METHODS or attempt >= RETRY_ATTEMPTS:
+                    raise
+                aliases = _drop_lost_connections()
+                if not aliases:
+                    raise
+                attempt += 1
+                for alias in aliases:
+                    metrics.increment('wheatleycensus_db_retries_total', alias)
+                logger.warning("Database connection lost in %s (%s); retrying", view.__name__, exc)
+                time.sleep(RETRY_BACKOFF * attempt)
+
+    return wrapper
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    metrics.increment('wheatleycensus_db_connections_total', connection.alias)
+
+
+def pool_stats():
+    """{alias: {statistic: value}} for every database using a psycopg connection pool."""
+    stats = {}
+    for alias in connections:
+        if not connections.settings[alias].get('OPTIONS', {}).get('pool'):
+            continue
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is not None:
+            stats[alias] = pool.get_stats()
+    return stats
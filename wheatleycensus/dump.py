@@ -0,0 +1,186 @@
+# wheatleycensus/dump.py
+# Whole-census denormalized dump: one row per Copy joined to its Issue, Edition,
+# Title, Location and provenance names.
+# Rows are read with a chunked iterator over one select_related query (plus one
+# provenance prefetch per chunk) and written incrementally, so a full dump runs in
+# bounded memory. Used by `manage.py dump_census` and the staff-only census_dump view.
+#
+# Output formats: gzip-compressed NDJSON (always available) and Parquet (requires
+# the optional pyarrow package).
+
+import io
+import json
+import zlib
+
+from django.db.models import Prefetch
+
+from .models import Copy, ProvenanceRecord
+
+CHUNK_SIZE = 2000
+
+COPY_FIELDS = (
+    'wc_number', 'verification', 'signed_by_author', 'shelfmark', 'catalogue_url',
+    'fragment', 'from_estc', 'digital_facsimile_url', 'binding', 'marginalia',
+    'prov_info', 'bibliography', 'height', 'width', 'verified_by', 'examined_by',
+    'collated_by',
+)
+FORMATS = ('ndjson', 'parquet')
+
+
+# ------------------------------------------------------------------------------
+# Rows
+# ------------------------------------------------------------------------------
+def _row(copy):
+    row = {'copy_id': copy.pk}
+    row.update((f, getattr(copy, f)) for f in COPY_FIELDS)
+    issue = copy.issue
+    edition = issue.edition if issue else None
+    title = edition.title if edition else None
+    location = copy.location
+    row.update({
+        'issue_id': issue.pk if issue else None,
+        'issue_year': issue.year if issue else None,
+        'issue_start_date': issue.start_date if issue else None,
+        'issue_end_date': issue.end_date if issue else None,
+        'issue_bibliographic_data': issue.bibliographic_data if issue else None,
+        'edition_id': edition.pk if edition else None,
+        'edition_number': edition.edition_number if edition else None,
+        'edition_format': edition.edition_format if edition else None,
+        'title_id': title.pk if title else None,
+        'title': title.title if title else None,
+        'location_id': location.pk if location else None,
+        'location_name': location.name_of_library_collection if location else None,
+        'location_region': location.us_state_or_non_us_nation if location else None,
+        'location_latitude': location.latitude if location else None,
+        'location_longitude': location.longitude if location else None,
+        'provenance': [
+            {
+                'id': r.provenance_name.pk,
+                'name': r.provenance_name.name,
+                'viaf': r.provenance_name.viaf,
+                'gender': r.provenance_name.gender,
+                'start_century': r.provenance_name.start_century,
+                'end_century': r.provenance_name.end_century,
+            }
+            for r in copy.provenance_records.all()
+        ],
+    })
+    return row
+
+
+def iter_rows(chunk_size=CHUNK_SIZE, using='default'):
+    """Yield one denormalized dict per copy, in copy id order."""
+    records = ProvenanceRecord.objects.using(using).select_related('provenance_name').order_by('pk')
+    copies = (Copy.objects.using(using)
+              .select_related('issue__edition__title', 'location')
+              .prefetch_related(Prefetch('provenance_records', queryset=records))
+              .order_by('pk'))
+    for copy in copies.iterator(chunk_size=chunk_size):
+        yield _row(copy)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ------------------------------------------------------------------------------
+# NDJSON (gzip)
+# ------------------------------------------------------------------------------
+def iter_ndjson_gz(rows, chunk_size=CHUNK_SIZE):
+    """Yield gzip-compressed NDJSON bytes, one compressed block per batch of rows."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for batch in _batches(rows, chunk_size):
+        text = ''.join(json.dumps(row, ensure_ascii=False) + '\n' for row in batch)
+        block = compressor.compress(text.encode('utf-8'))
+        if block:
+            yield block
+    yield compressor.flush()
+
+
+# ------------------------------------------------------------------------------
+# Parquet (optional pyarrow)
+# ------------------------------------------------------------------------------
+def _parquet_schema(pa):
+    strings = ('wc_number', 'verification', 'shelfmark', 'catalogue_url', 'digital_facsimile_url',
+               'binding', 'marginalia', 'prov_info', 'bibliography', 'verified_by',
+               'examined_by', 'collated_by', 'issue_year', 'issue_bibliographic_data',
+               'edition_number', 'edition_format', 'title', 'location_name', 'location_region')
+    types = {name: pa.string() for name in strings}
+    types.update({
+        'copy_id': pa.int64(), 'issue_id': pa.int64(), 'edition_id': pa.int64(),
+        'title_id': pa.int64(), 'location_id': pa.int64(),
+        'issue_start_date': pa.int32(), 'issue_end_date': pa.int32(),
+        'signed_by_author': pa.bool_(), 'fragment': pa.bool_(), 'from_estc': pa.bool_(),
+        'height': pa.float64(), 'width': pa.float64(),
+        'location_latitude': pa.float64(), 'location_longitude': pa.float64(),
+        'provenance': pa.list_(pa.struct([
+            ('id', pa.int64()), ('name', pa.string()), ('viaf', pa.string()),
+            ('gender', pa.string()), ('start_century', pa.string()), ('end_century', pa.string()),
+        ])),
+    })
+    order = ('copy_id',) + COPY_FIELDS + tuple(
+        k for k in types if k != 'copy_id' and k not in COPY_FIELDS)
+    return pa.schema([(name, types[name]) for name in order])
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet output requires the 'pyarrow' package (pip install pyarrow).")
+    return pyarrow, pyarrow.parquet
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose contents are taken out after each row group."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self):
+        data, self._chunks = b''.join(self._chunks), []
+        return data
+
+
+def write_parquet(rows, target, chunk_size=CHUNK_SIZE):
+    """Write rows to `target` (path or binary file), one row group per batch."""
+    pa, pq = _import_pyarrow()
+    schema = _parquet_schema(pa)
+    with pq.ParquetWriter(target, schema, compression='zstd') as writer:
+        for batch in _batches(rows, chunk_size):
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+
+def iter_parquet(rows, chunk_size=CHUNK_SIZE):
+    """
+    Return an iterator of Parquet file bytes, produced as each row group is written.
+    Raises ImportError up front (not on first iteration) when pyarrow is missing.
+    """
+    pa, pq = _import_pyarrow()
+    return _parquet_blocks(pa, pq, rows, chunk_size)
+
+
+def _parquet_blocks(pa, pq, rows, chunk_size):
+    schema = _parquet_schema(pa)
+    sink = _Drain()
+    writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    for batch in _batches(rows, chunk_size):
+        writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
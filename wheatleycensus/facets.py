@@ -0,0 +1,178 @@
+# wheatleycensus/facets.py
+# Facet counts for search results: how the matching copies break down by region,
+# verification, owner gender, owner century, issue decade, fragment, ESTC source and
+# facsimile availability.
+#
+# All facets are counted in a single SQL statement (one grouped query per facet,
+# joined with UNION ALL) over the filtered result set, and cached per search under
+# the census data version. A facet value is selected with ?facet_<key>=<value>, which
+# narrows the results; counts are then taken over the narrowed set.
+
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import Cast
+
+from . import versioning
+from .models import Copy, Location, ProvenanceName
+
+PARAM_PREFIX = 'facet_'
+UNKNOWN = ''  # facet value standing for "not recorded"
+
+
+class Facet:
+    """One facet: the expression to group copies by and how to filter on a value."""
+
+    def __init__(self, key, label, expression, labels=None, multi_valued=False):
+        self.key = key
+        self.label = label
+        self.expression = expression      # field path or expression over Copy
+        self.labels = labels or {}        # stored value -> display label
+        self.multi_valued = multi_valued  # reached through a to-many relation
+
+    @property
+    def param(self):
+        return PARAM_PREFIX + self.key
+
+    def display(self, value):
+        if value == UNKNOWN:
+            return 'Unknown'
+        return self.labels.get(value, value)
+
+    def condition(self, value):
+        """Q selecting copies whose facet value is `value` (a string from the URL)."""
+        path = self.expression
+        if value == UNKNOWN:
+            return Q(**{f'{path}__isnull': True}) | Q(**{path: ''})
+        return Q(**{path: value})
+
+    def narrow(self, queryset, value):
+        condition = self.condition(value)
+        if self.multi_valued:
+            # Filter through a subquery so the to-many join does not duplicate rows.
+            return queryset.filter(pk__in=Copy.objects.filter(condition).values('pk'))
+        return queryset.filter(condition)
+
+
+class BooleanFacet(Facet):
+    def __init__(self, key, label, expression, true_label='Yes', false_label='No'):
+        super().__init__(key, label, expression, {'1': true_label, '0': false_label})
+
+    def group_expression(self):
+        return Case(When(self.expression, then=Value('1')), default=Value('0'),
+                    output_field=CharField())
+
+    def condition(self, value):
+        return self.expression if value == '1' else ~self.expression
+
+
+class DecadeFacet(Facet):
+    def group_expression(self):
+        decade = Case(When(issue__start_date__gt=0, then=F('issue__start_date') / 10 * 10),
+                      default=None, output_field=IntegerField())
+        return Cast(decade, CharField())
+
+    def display(self, value):
+        return f'{value}s' if value else 'Unknown'
+
+    def condition(self, value):
+        if not value.isdigit():
+            return Q(issue__isnull=True) | Q(issue__start_date__lte=0)
+        start = int(value)
+        return Q(issue__start_date__gte=start, issue__start_date__lt=start + 10)
+
+
+FACETS = [
+    Facet('region', 'State or nation', 'location__us_state_or_non_us_nation',
+          dict(Location.LOCATION_CHOICES)),
+    Facet('verification', 'Verification', 'verification',
+          {'V': 'Verified', 'U': 'Unverified', 'F': 'False'}),
+    Facet('gender', 'Owner gender', 'provenance_records__provenance_name__gender',
+          dict(ProvenanceName.GENDER_CHOICES), multi_valued=True),
+    Facet('century', 'Owner century', 'provenance_records__provenance_name__start_century',
+          dict(ProvenanceName.CENTURY_CHOICES), multi_valued=True),
+    DecadeFacet('decade', 'Issue decade', 'issue__start_date'),
+    BooleanFacet('fragment', 'Fragment', Q(fragment=True)),
+    BooleanFacet('estc', 'Source', Q(from_estc=True), 'ESTC', 'Other'),
+    BooleanFacet('facsimile', 'Digital facsimile',
+                 Q(digital_facsimile_url__isnull=False) & ~Q(digital_facsimile_url=''),
+                 'Available', 'None'),
+]
+BY_KEY = {f.key: f for f in FACETS}
+
+
+def _group_expression(facet):
+    if hasattr(facet, 'group_expression'):
+        return facet.group_expression()
+    return Cast(facet.expression, CharField())
+
+
+# ------------------------------------------------------------------------------
+# Selection
+# ------------------------------------------------------------------------------
+def selected(params):
+    """Return {facet key: value} for the facet_* parameters in a QueryDict."""
+    return {f.key: params[f.param] for f in FACETS if f.param in params}
+
+
+def narrow(queryset, selection):
+    """Apply the selected facet values to a Copy queryset."""
+    for key, value in selection.items():
+        queryset = BY_KEY[key].narrow(queryset, value)
+    return queryset
+
+
+# ------------------------------------------------------------------------------
+# Counting
+# ------------------------------------------------------------------------------
+def _count(queryset):
+    base = Copy.objects.filter(pk__in=queryset.order_by().values('pk')).order_by()
+    branches = [
+        base.values(facet=Value(f.key, output_field=CharField()),
+                    value=_group_expression(f))
+            .annotate(n=Count('pk', distinct=True))
+            .values_list('facet', 'value', 'n')
+        for f in FACETS
+    ]
+    rows = branches[0].union(*branches[1:], all=True)
+    counts = {f.key: {} for f in FACETS}
+    for key, value, n in rows:
+        value = UNKNOWN if value is None else value
+        counts[key][value] = counts[key].get(value, 0) + n
+    return counts
+
+
+def counts(queryset, cache_parts):
+    """
+    Return {facet key: {value: copy count}} for a Copy queryset. `cache_parts`
+    identify the search (field, value, selection) for caching.
+    """
+    digest = hashlib.md5(repr(cache_parts).encode('utf-8')).hexdigest()
+    key = versioning.versioned_key('census', 'facets', digest)
+    return cache.get_or_set(key, lambda: _count(queryset), versioning.CACHE_TIMEOUT)
+
+
+def present(counts, params, path):
+    """
+    Facets for a template: label plus, per value, its display label, count,
+    whether it is selected, and the URL that selects (or clears) it.
+    """
+    chosen = selected(params)
+    facets = []
+    for facet in FACETS:
+        values = []
+        for value, n in sorted(counts.get(facet.key, {}).items(), key=lambda kv: (-kv[1], kv[0])):
+            query = params.copy()
+            for name in ('cursor', 'format'):
+                query.pop(name, None)
+            is_selected = chosen.get(facet.key) == value
+            if is_selected:
+                query.pop(facet.param, None)
+            else:
+                query[facet.param] = value
+            values.append({'value': value, 'label': facet.display(value), 'count': n,
+                           'selected': is_selected, 'url': f'{path}?{query.urlencode()}'})
+        if values:
+            facets.append({'key': facet.key, 'label': facet.label, 'values': values})
+    return facets
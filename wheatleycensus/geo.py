@@ -0,0 +1,219 @@
+# wheatleycensus/geo.py
+# Map data for holding locations: GeoJSON points with canonical copy counts,
+# clustered server-side so the browser never draws more than a grid's worth of
+# markers however many locations there are.
+#
+# Locations are snapped to a grid in Web Mercator space whose cells are
+# GRID_CELL_PIXELS wide at the requested zoom. Each occupied cell becomes one
+# feature: the location itself when it is alone in the cell, otherwise a cluster at
+# the copy-weighted centroid of its locations. From CLUSTER_MAX_ZOOM on, every
+# location is its own feature. Results are cached per zoom and filter under the
+# census data version.
+#
+# Radius and nearest-library queries first narrow locations to a latitude/longitude
+# bounding box on the indexed columns (location_lat_lon_idx), then compute exact
+# great-circle distances for the candidates only, vectorized with numpy.
+
+import math
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Q
+from geopy import Point
+from geopy.distance import EARTH_RADIUS
+
+from . import copy_collections, versioning
+from .models import Copy, Location
+
+DEFAULT_ZOOM = 2
+MAX_ZOOM = 18
+CLUSTER_MAX_ZOOM = 12
+# Map tiles are 256 pixels wide; one cluster per 64x64 pixel cell.
+TILE_PIXELS = 256
+GRID_CELL_PIXELS = 64
+# Web Mercator is undefined at the poles; clamp like every web map does.
+MAX_LATITUDE = 85.05112878
+
+# Radius used by the 'near' search when none is given, in kilometres.
+DEFAULT_RADIUS_KM = 50
+# Nearest-library searches start with this radius and double it until enough
+# locations are found (or the whole globe is covered).
+NEAREST_START_KM = 100
+HALF_CIRCUMFERENCE_KM = math.pi * EARTH_RADIUS
+KM_PER_DEGREE = HALF_CIRCUMFERENCE_KM / 180
+
+
+def _mercator(lat, lon):
+    """Project to the unit square: x grows eastward, y southward, both in [0, 1)."""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0
+    sin = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin) / (1 - sin)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+def location_points(title=None, issue=None, collection=None, using=None):
+    """
+    Return [(location id, name, latitude, longitude, canonical copy count)] for every
+    located holding of the matching copies, in one grouped query.
+    """
+    copies = Copy.objects.using(using).filter(
+        verification__in=('U', 'V'), location__latitude__isnull=False,
+        location__longitude__isnull=False)
+    if title is not None:
+        copies = copies.filter(issue__edition__title_id=title)
+    if issue is not None:
+        copies = copies.filter(issue_id=issue)
+    if collection is not None:
+        copies = copy_collections.members(copies, collection)
+    rows = (copies.order_by()
+            .values_list('location_id', 'location__name_of_library_collection',
+                         'location__latitude', 'location__longitude')
+            .annotate(n=Count('pk')))
+    return sorted(rows)
+
+
+def cluster(points, zoom):
+    """Group points into grid cells for `zoom`; return GeoJSON features."""
+    if zoom >= CLUSTER_MAX_ZOOM:
+        return [_point_feature(*point) for point in points]
+    cells_per_side = (TILE_PIXELS << zoom) // GRID_CELL_PIXELS
+    cells = {}
+    for point in points:
+        x, y = _mercator(point[2], point[3])
+        cells.setdefault((int(x * cells_per_side), int(y * cells_per_side)), []).append(point)
+    features = []
+    for key in sorted(cells):
+        members = cells[key]
+        if len(members) == 1:
+            features.append(_point_feature(*members[0]))
+            continue
+        copies = sum(p[4] for p in members)
+        lat = sum(p[2] * p[4] for p in members) / copies
+        lon = sum(p[3] * p[4] for p in members) / copies
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(lon, 6), round(lat, 6)]},
+            'properties': {'cluster': True, 'locations': len(members), 'copies': copies},
+        })
+    return features
+
+
+def _point_feature(pk, name, lat, lon, copies):
+    return {
+        'type': 'Feature',
+        'id': pk,
+        'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+        'properties': {'cluster': False, 'name': name or '', 'copies': copies},
+    }
+
+
+def feature_collection(zoom, title=None, issue=None, collection=None):
+    """The clustered GeoJSON FeatureCollection for a zoom level and filter, cached."""
+    zoom = max(0, min(MAX_ZOOM, zoom))
+    key = versioning.versioned_key('census', 'map', min(zoom, CLUSTER_MAX_ZOOM),
+                                   title, issue, collection)
+
+    def compute():
+        points = location_points(title=title, issue=issue, collection=collection)
+        return {'type': 'FeatureCollection', 'features': cluster(points, zoom)}
+
+    return cache.get_or_set(key, compute, versioning.CACHE_TIMEOUT)
+
+
+# ------------------------------------------------------------------------------
+# Radius and nearest-location queries
+# ------------------------------------------------------------------------------
+def parse_point(value):
+    """Return (latitude, longitude) for text like '42.36,-71.06' or "42 21' N 71 3' W"."""
+    try:
+        point = Point(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Not a latitude and longitude: {value!r}")
+    return point.latitude, point.longitude
+
+
+def bounding_box(lat, lon, radius_km):
+    """Q over Location matching a box that contains every point within radius_km."""
+    dlat = radius_km / KM_PER_DEGREE
+    box = Q(latitude__gte=lat - dlat, latitude__lte=lat + dlat)
+    if abs(lat) + dlat >= 90:
+        return box  # the circle reaches a pole: every longitude is in range
+    dlon = min(180.0, dlat / math.cos(math.radians(lat)))
+    west, east = lon - dlon, lon + dlon
+    if dlon >= 180:
+        return box
+    if west < -180:
+        return box & (Q(longitude__gte=west + 360) | Q(longitude__lte=east))
+    if east > 180:
+        return box & (Q(longitude__gte=west) | Q(longitude__lte=east - 360))
+    return box & Q(longitude__gte=west, longitude__lte=east)
+
+
+def haversine_km(lat, lon, lats, lons):
+    """Great-circle distances in km from one point to arrays of points."""
+    lat, lon = math.radians(lat), math.radians(lon)
+    lats, lons = np.radians(lats), np.radians(lons)
+    a = (np.sin((lats - lat) / 2) ** 2
+         + math.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _holding_locations(issue=None, title=None, using=None):
+    locations = Location.objects.using(using)
+    if issue is None and title is None:
+        return locations
+    copies = Copy.objects.using(using).filter(verification__in=('U', 'V'))
+    if issue is not None:
+        copies = copies.filter(issue_id=issue)
+    if title is not None:
+        copies = copies.filter(issue__edition__title_id=title)
+    return locations.filter(pk__in=copies.values('location_id'))
+
+
+def _distances(lat, lon, radius_km, locations):
+    rows = list(locations.filter(bounding_box(lat, lon, radius_km))
+                .values_list('pk', 'latitude', 'longitude'))
+    if not rows:
+        return []
+    ids, lats, lons = (np.array(column) for column in zip(*rows))
+    km = haversine_km(lat, lon, lats.astype(float), lons.astype(float))
+    keep = km <= radius_km
+    order = np.lexsort((ids[keep], km[keep]))
+    return [(int(pk), float(d)) for pk, d in zip(ids[keep][order], km[keep][order])]
+
+
+def within(lat, lon, radius_km, issue=None, title=None, using=None):
+    """[(location id, km)] of the locations within radius_km, nearest first."""
+    return _distances(lat, lon, radius_km, _holding_locations(issue, title, using))
+
+
+def nearest(lat, lon, k, issue=None, title=None, using=None):
+    """[(location id, km)] of the k nearest locations (holding the issue or title, if given)."""
+    locations = _holding_locations(issue, title, using)
+    radius = NEAREST_START_KM
+    while True:
+        found = _distances(lat, lon, radius, locations)
+        if len(found) >= k or radius >= HALF_CIRCUMFERENCE_KM:
+            return found[:k]
+        radius *= 2
+
+
+def describe(found, issue=None, title=None, using=None):
+    """JSON-ready rows for (location id, km) pairs, with canonical copy counts."""
+    ids = [pk for pk, _ in found]
+    copies = Copy.objects.using(using).filter(verification__in=('U', 'V'), location_id__in=ids)
+    if issue is not None:
+        copies = copies.filter(issue_id=issue)
+    if title is not None:
+        copies = copies.filter(issue__edition__title_id=title)
+    counts = dict(copies.order_by().values_list('location_id').annotate(n=Count('pk')))
+    locations = Location.objects.using(using).in_bulk(ids)
+    return [{
+        'id': pk,
+        'name': locations[pk].name_of_library_collection or '',
+        'latitude': locations[pk].latitude,
+        'longitude': locations[pk].longitude,
+        'distance_km': round(km, 1),
+        'copies': counts.get(pk, 0),
+    } for pk, km in found]
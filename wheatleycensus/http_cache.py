@@ -0,0 +1,97 @@
+# wheatleycensus/http_cache.py
+# HTTP caching for the public pages, driven by the 'census' data version.
+# The version is bumped by signals.py on every write to a census model, so it
+# serves both as the ETag and (being a timestamp) as Last-Modified. Versions are
+# shared by all worker processes (see versioning.py), so a write made through any
+# of them changes the ETag everywhere. A conditional GET that still matches is
+# answered 304 before the view runs any queries.
+#
+# Pages read from the local snapshot (snapshot.py) use its build time instead, so
+# they are validated without contacting the primary database.
+#
+# With RESPONSE_CACHE_ENABLED in settings, anonymous GET responses are also kept
+# in the default cache under a key of (view, path and query string, version).
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+from . import versioning
+from .db import retry_on_disconnect
+from .snapshot import reads_snapshot
+
+NAMESPACE = 'census'
+
+
+def _audience(request):
+    """Which variant of a page the user sees: the templates show staff links and sign-in state."""
+    user = request.user
+    if user.is_staff:
+        return 'staff'
+    return 'user' if user.is_authenticated else 'anon'
+
+
+def _variant(request):
+    # copy_data renders a modal for XHR requests and a full page otherwise.
+    xhr = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    return f"{_audience(request)}{'-xhr' if xhr else ''}"
+
+
+def census_etag(request, *args, **kwargs):
+    return f'{versioning.version_tag(NAMESPACE)}-{_variant(request)}'
+
+
+def census_last_modified(request, *args, **kwargs):
+    return datetime.fromtimestamp(versioning.get_version(NAMESPACE) / 1e6, tz=timezone.utc)
+
+
+def _response_key(view_name, request):
+    path = hashlib.md5(request.get_full_path().encode('utf-8')).hexdigest()
+    return versioning.versioned_key(NAMESPACE, 'response', view_name, _variant(request), path)
+
+
+def census_cached(view):
+    """
+    Decorate a read-only public view with ETag/Last-Modified validation, reads
+    from the local snapshot, a retry after a dropped database connection and, when
+    enabled, a server-side response cache for anonymous visitors.
+    """
+    view_name = f'{view.__module__}.{view.__name__}'
+
+    @wraps(view)
+    def cached(request, *args, **kwargs):
+        use_cache = (getattr(settings, 'RESPONSE_CACHE_ENABLED', False)
+                     and request.method in ('GET', 'HEAD')
+                     and _audience(request) == 'anon')
+        if not use_cache:
+            return view(request, *args, **kwargs)
+        key = _response_key(view_name, request)
+        response = cache.get(key)
+        if response is None:
+            response = view(request, *args, **kwargs)
+            # Responses that set cookies (session, CSRF) are specific to one visitor.
+            if response.status_code == 200 and not response.cookies and not response.streaming:
+                cache.set(key, response, versioning.CACHE_TIMEOUT)
+        return response
+
+    # The retry covers the version read behind the ETag as well as the view.
+    conditional = retry_on_disconnect(
+        condition(etag_func=census_etag, last_modified_func=census_last_modified)(cached))
+
+    # The snapshot is chosen before validation, so the ETag, the response cache
+    # key and the view all agree on which build of the data they describe.
+    @reads_snapshot
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = conditional(request, *args, **kwargs)
+        patch_vary_headers(response, ('Cookie', 'X-Requested-With'))
+        # Browsers may keep the page but must revalidate it; the 304 is cheap.
+        patch_cache_control(response, no_cache=True, private=_audience(request) != 'anon')
+        return response
+
+    return wrapper
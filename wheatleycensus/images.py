@@ -0,0 +1,101 @@
+# wheatleycensus/images.py
+# Display-size derivatives of title icons.
+#
+# Title icons are uploaded at whatever size the curator has (500px and up) but
+# shown as 90px circles. For each icon we store square crops at 1x and 2x the
+# display size, as WebP and as PNG for browsers without WebP. Derivative names
+# carry a hash of their content (titleicon/derived/<name>-<width>.<hash>.<ext>), so
+# a file never changes once published and can be served with a far-future,
+# immutable Cache-Control header; a new upload gets new names.
+#
+# Derivatives are made when a title is saved with a new image (signals.py) and
+# for existing titles by `python manage.py build_title_icons`. Their names are
+# kept in Title.icon_variants and rendered as a <picture> with srcset by the
+# {% title_icon %} template tag.
+
+import hashlib
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.text import slugify
+from PIL import Image, ImageOps
+
+ICON_SIZE = 90          # CSS pixels; see img.play-title-icon in style.css
+DENSITIES = (1, 2)
+DERIVED_DIR = 'titleicon/derived'
+# (extension, Pillow format, save options); the first is preferred.
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 82, 'method': 6}),
+    ('png', 'PNG', {'optimize': True}),
+)
+
+
+def _name(source_name, width, extension, content):
+    stem = slugify(os.path.splitext(os.path.basename(source_name))[0]) or 'icon'
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    return f'{DERIVED_DIR}/{stem}-{width}.{digest}.{extension}'
+
+
+def render(image, width, pillow_format, options):
+    """Bytes of `image` cropped to a centred square `width` pixels wide."""
+    square = ImageOps.fit(image, (width, width), Image.Resampling.LANCZOS)
+    out = BytesIO()
+    square.save(out, pillow_format, **options)
+    return out.getvalue()
+
+
+def make_variants(field_file, storage=default_storage):
+    """
+    Write the derivatives of an uploaded icon to `storage` and return
+    {'source': name, 'size': ICON_SIZE, 'formats': {extension: [[width, name], ...]}}.
+    """
+    with field_file.open('rb') as f:
+        image = Image.open(f)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    formats = {}
+    for extension, pillow_format, options in FORMATS:
+        formats[extension] = []
+        for density in DENSITIES:
+            width = ICON_SIZE * density
+            content = render(image, width, pillow_format, options)
+            name = _name(field_file.name, width, extension, content)
+            if not storage.exists(name):
+                storage.save(name, ContentFile(content))
+            formats[extension].append([width, name])
+    return {'source': field_file.name, 'size': ICON_SIZE, 'formats': formats}
+
+
+def is_current(title):
+    """Whether the title's stored derivatives were made from its current image."""
+    return bool(title.image) and title.icon_variants.get('source') == title.image.name
+
+
+def refresh_title(title, force=False, using=None):
+    """(Re)build the title's derivatives if its image changed; return True if it did."""
+    if not title.image:
+        variants = {}
+    elif force or not is_current(title):
+        variants = make_variants(title.image)
+    else:
+        return False
+    if variants == title.icon_variants:
+        return False
+    title.icon_variants = variants
+    # update() rather than save(): no signals, so no recursion.
+    type(title).objects.using(using or title._state.db).filter(pk=title.pk).update(icon_variants=variants)
+    return True
+
+
+def srcsets(title):
+    """{extension: 'url 1x, url 2x'} for a title's derivatives, preferred format first."""
+    formats = title.icon_variants.get('formats', {})
+    return {
+        extension: ', '.join(f'{default_storage.url(name)} {width // ICON_SIZE}x'
+                             for width, name in formats[extension])
+        for extension, _, _ in FORMATS if formats.get(extension)
+    }
@@ -0,0 +1,228 @@
+# wheatleycensus/management/commands/benchmark_views.py
+# Times every named route in wheatleycensus/urls.py (plus a few search variants)
+# against the current database and records wall time and query count per URL.
+# Results are written as a JSON baseline that can be diffed against an earlier run:
+#
+#   python manage.py generate_census --scale 10 --clear
+#   python manage.py benchmark_views -o before.json
+#   ... change code ...
+#   python manage.py benchmark_views -o after.json --compare before.json
+
+import json
+import logging
+import platform
+import statistics
+import subprocess
+from contextlib import contextmanager
+from time import perf_counter
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import request_started
+from django.db import connections, reset_queries
+from django.test import Client, override_settings
+from django.urls import URLPattern, reverse
+from django.utils import timezone
+
+from wheatleycensus import urls
+from wheatleycensus.models import CoOwnership, Copy, Issue, Title
+
+# Extra query strings benchmarked for routes whose cost depends on them.
+VARIANTS = {
+    'search': [
+        '?field=keyword&value=marginalia',
+        '?field=location&value=library',
+        '?field=provenance_name&value=mary',
+        '?field=year&value=1773-1800',
+        '?field=collection&value=womanowner',
+        '?field=unverified',
+        '?field=near&value=42.36,-71.06&radius=500',
+    ],
+    'map_data': ['?zoom=6', '?zoom=14', '?zoom=4&collection=womanowner'],
+    'near_locations': ['?point=42.36,-71.06&radius=500', '?point=51.5,-0.13&k=10'],
+    'provenance_network': ['?depth=3'],
+    'year_timeline': ['?start=1770&end=1800'],
+}
+
+
+def _sample_kwargs():
+    """Route kwargs that point at representative rows of the current dataset."""
+    copy = Copy.objects.order_by('pk').first()
+    issue = Issue.objects.order_by('pk').first()
+    title = Title.objects.order_by('pk').first()
+    owner = CoOwnership.objects.order_by('-copies', 'pk').values_list('owner_id', flat=True).first()
+    wc_number = copy.wc_number.split('.')[0] if copy else '1'
+    return {
+        'issue_list': {'id': title.pk if title else 1},
+        'copy_list': {'id': issue.pk if issue else 1},
+        'copy_data': {'copy_id': copy.pk if copy else 1},
+        'cen_copy_modal': {'census_id': wc_number},
+        'copy_page': {'wc_number': wc_number},
+        'autofill_location': {'query': 'li'},
+        'autofill_provenance': {'query': 'ma'},
+        'autofill_collection': {'query': 'w'},
+        'provenance_network': {'owner_id': owner or 1},
+        'export': {'groupby': 'location__us_state_or_non_us_nation', 'column': 'id',
+                   'aggregate': 'count'},
+    }
+
+
+def _cases():
+    kwargs = _sample_kwargs()
+    seen = set()
+    for pattern in urls.urlpatterns:
+        if not isinstance(pattern, URLPattern) or not pattern.name:
+            continue
+        route_kwargs = kwargs.get(pattern.name, {}) if pattern.pattern.converters else {}
+        try:
+            url = reverse(pattern.name, kwargs=route_kwargs or None)
+        except Exception:
+            continue
+        if url in seen:
+            continue
+        seen.add(url)
+        yield pattern.name, url
+        for query in VARIANTS.get(pattern.name, ()):
+            yield pattern.name, url + query
+
+
+@contextmanager
+def _count_queries():
+    """
+    Count the queries run on every database alias (the primary and the read
+    snapshot alike) inside the block; yields a list holding the total afterwards.
+    Like CaptureQueriesContext, but without opening connections that are not in use.
+    """
+    total = []
+    state = [(c, c.force_debug_cursor) for c in connections.all()]
+    for c, _ in state:
+        # Cleared first: the logs are bounded, so a running length would stop growing.
+        c.queries_log.clear()
+        c.force_debug_cursor = True
+    # The request would otherwise clear the query logs when it starts.
+    request_started.disconnect(reset_queries)
+    try:
+        yield total
+    finally:
+        request_started.connect(reset_queries)
+        for c, debug in state:
+            c.force_debug_cursor = debug
+        total.append(sum(len(c.queries_log) for c, _ in state))
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "Benchmark every census URL (wall time and SQL query count) and write a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Warm requests per URL after the first (cold) one.")
+        parser.add_argument('--output', '-o', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="Earlier results file to compare against.")
+        parser.add_argument('--max-slowdown', type=float, default=1.5,
+                            help="Warm-time ratio above which --compare reports a regression.")
+        parser.add_argument('--only', action='append', default=[],
+                            help="Benchmark only these route names (repeatable).")
+
+    def _request(self, client, url):
+        with _count_queries() as queries:
+            start = perf_counter()
+            response = client.get(url)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = (perf_counter() - start) * 1000
+        return response.status_code, elapsed, queries[0]
+
+    def _run(self, repeat, only):
+        client = Client(raise_request_exception=False)
+        results = {}
+        for name, url in _cases():
+            if only and name not in only:
+                continue
+            # Cold: empty cache. Warm: repeated with whatever the view cached.
+            cache.clear()
+            status, cold_ms, cold_queries = self._request(client, url)
+            warm = [self._request(client, url) for _ in range(repeat)]
+            warm_ms = sorted(ms for _, ms, _ in warm) or [cold_ms]
+            results[url] = {
+                'view': name,
+                'status': status,
+                'cold_ms': round(cold_ms, 2),
+                'cold_queries': cold_queries,
+                'warm_median_ms': round(statistics.median(warm_ms), 2),
+                'warm_max_ms': round(warm_ms[-1], 2),
+                'warm_queries': warm[-1][2] if warm else cold_queries,
+            }
+            self.stdout.write(f"{status} {results[url]['cold_queries']:>5}q "
+                              f"{results[url]['warm_median_ms']:>9.1f}ms  {url}")
+        return results
+
+    def _compare(self, results, baseline, max_slowdown):
+        regressions = []
+        for url, new in results.items():
+            old = baseline.get(url)
+            if old is None:
+                continue
+            for key in ('cold_queries', 'warm_queries'):
+                if new[key] > old[key]:
+                    regressions.append(f"{url}: {key} {old[key]} -> {new[key]}")
+            if old['warm_median_ms'] and new['warm_median_ms'] > old['warm_median_ms'] * max_slowdown:
+                regressions.append(f"{url}: warm_median_ms {old['warm_median_ms']} -> {new['warm_median_ms']}")
+            if new['status'] != old['status']:
+                regressions.append(f"{url}: status {old['status']} -> {new['status']}")
+        return regressions
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f"Cannot read baseline {options['compare']}: {exc}")
+
+        # The test client's host must be allowed; the full-page cache would hide view cost.
+        # Server errors are recorded as statuses instead of logging a traceback per request.
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            with override_settings(ALLOWED_HOSTS=['*'], RESPONSE_CACHE_ENABLED=False):
+                results = self._run(options['repeat'], options['only'])
+        finally:
+            request_logger.setLevel(level)
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connections['default'].vendor,
+                'repeat': options['repeat'],
+                'rows': {'copies': Copy.objects.count(), 'issues': Issue.objects.count(),
+                         'titles': Title.objects.count()},
+            },
+            'results': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(results)} results to {options['output']}"))
+
+        if baseline is not None:
+            regressions = self._compare(results, baseline, options['max_slowdown'])
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            if regressions:
+                raise CommandError(f"{len(regressions)} regression(s) against {options['compare']}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,30 @@
+# wheatleycensus/management/commands/build_read_snapshot.py
+# Builds the local SQLite read snapshot of the census tables (see snapshot.py) and
+# swaps it in atomically. Run it on a schedule shorter than READ_SNAPSHOT_MAX_AGE.
+# Example: READ_SNAPSHOT_PATH=/srv/census/snapshot.sqlite3 python manage.py build_read_snapshot
+
+from time import perf_counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheatleycensus import snapshot
+
+
+class Command(BaseCommand):
+    help = "Copy the census tables into the local read snapshot used by public pages."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help="Database alias to copy from (default: 'default').")
+        parser.add_argument('--path', help="Snapshot file (default: READ_SNAPSHOT_PATH).")
+
+    def handle(self, *args, **options):
+        target = options['path'] or snapshot.path()
+        if not target:
+            raise CommandError("No snapshot path: set READ_SNAPSHOT_PATH or pass --path.")
+        start = perf_counter()
+        counts = snapshot.build(target, using=options['database'])
+        for table, rows in counts.items():
+            self.stdout.write(f"{table}: {rows} rows", style_func=None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {target} from '{options['database']}' in {perf_counter() - start:.1f}s."))
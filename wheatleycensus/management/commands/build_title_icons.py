@@ -0,0 +1,38 @@
+# wheatleycensus/management/commands/build_title_icons.py
+# Makes the display-size WebP/PNG derivatives of title icons (see images.py) for
+# titles that lack them, e.g. icons uploaded before derivatives existed.
+# New uploads get theirs when the title is saved.
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheatleycensus import images, versioning
+from wheatleycensus.models import Title
+
+
+class Command(BaseCommand):
+    help = "Build resized WebP/PNG title icons with content-hashed names."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help="Rebuild derivatives even for titles that have them.")
+
+    def handle(self, *args, **options):
+        built, failed = 0, 0
+        for title in Title.objects.exclude(image='').exclude(image__isnull=True).order_by('pk'):
+            try:
+                changed = images.refresh_title(title, force=options['force'])
+            except OSError as exc:
+                failed += 1
+                self.stderr.write(f"{title}: {title.image.name}: {exc}")
+                continue
+            if changed:
+                built += 1
+                sizes = ', '.join(f"{name} ({images.default_storage.size(name)} bytes)"
+                                  for _, name in title.icon_variants['formats']['webp'])
+                self.stdout.write(f"{title}: {sizes}")
+        if built:
+            versioning.bump_version('titles', 'census')
+        summary = f"Built icons for {built} titles."
+        if failed:
+            raise CommandError(f"{summary} {failed} could not be read.")
+        self.stdout.write(self.style.SUCCESS(summary))
@@ -0,0 +1,42 @@
+# wheatleycensus/management/commands/dump_census.py
+# Writes the whole census as one denormalized row per copy (see dump.py).
+# Example: python manage.py dump_census --format parquet --output census.parquet
+
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheatleycensus import dump
+
+
+class Command(BaseCommand):
+    help = "Dump every copy joined to its issue, edition, title, location and provenance names."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=dump.FORMATS, default='ndjson',
+                            help="ndjson (gzip-compressed) or parquet (needs pyarrow).")
+        parser.add_argument('--output', '-o', default='-',
+                            help="Output file path, or '-' for stdout (default).")
+        parser.add_argument('--chunk-size', type=int, default=dump.CHUNK_SIZE,
+                            help="Copies read and written per batch.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        rows = dump.iter_rows(chunk_size=chunk_size, using=options['database'])
+        output = options['output']
+        out = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            if options['format'] == 'parquet':
+                try:
+                    dump.write_parquet(rows, out, chunk_size=chunk_size)
+                except ImportError as exc:
+                    raise CommandError(str(exc))
+            else:
+                for block in dump.iter_ndjson_gz(rows, chunk_size=chunk_size):
+                    out.write(block)
+        finally:
+            if out is not sys.stdout.buffer:
+                out.close()
+        if output != '-':
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['format']} dump to {output}"))
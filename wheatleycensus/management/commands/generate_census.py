@@ -0,0 +1,36 @@
+# wheatleycensus/management/commands/generate_census.py
+# Fills an empty database with a synthetic census (see synthetic.py).
+# Example: python manage.py generate_census --scale 10 --seed 1
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheatleycensus import synthetic
+from wheatleycensus.models import Copy, Location, ProvenanceName, StaticPageText, Title
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic census of a configurable size for benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help="Multiplier applied to the default row counts.")
+        parser.add_argument('--seed', type=int, default=0)
+        for name, default in synthetic.DEFAULTS.items():
+            kind = float if isinstance(default, float) else int
+            parser.add_argument('--' + name.replace('_', '-'), dest=name, type=kind, default=None,
+                                help=f"Override the scaled count (default {default}).")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete all existing census data first.")
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['clear']:
+            for model in (Copy, Title, Location, ProvenanceName, StaticPageText):
+                model.objects.using(using).all().delete()
+        elif Copy.objects.using(using).exists() or Title.objects.using(using).exists():
+            raise CommandError("The database already holds census data; use --clear to replace it.")
+        counts = {name: options[name] for name in synthetic.DEFAULTS}
+        created = synthetic.generate(scale=options['scale'], seed=options['seed'], using=using, **counts)
+        summary = ', '.join(f"{n} {name.replace('_', ' ')}" for name, n in created.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary}."))
@@ -0,0 +1,63 @@
+# wheatleycensus/management/commands/import_census.py
+# Imports copies, provenance names or provenance records from a spreadsheet through
+# the bulk resources in resources.py. With --dry-run nothing is kept; either way each
+# new or changed row is printed as it is processed.
+# Example: python manage.py import_census copies holdings.xlsx --dry-run
+
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from import_export.formats import base_formats
+
+from wheatleycensus import resources
+
+FORMATS = {fmt().get_extension(): fmt for fmt in base_formats.DEFAULT_FORMATS if fmt().can_import()}
+
+
+class Command(BaseCommand):
+    help = "Import census rows from a CSV, XLSX, XLS, JSON or other tabular file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('resource', choices=sorted(resources.RESOURCES))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            help="File format (default: taken from the file extension).")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would change and roll everything back.")
+        parser.add_argument('--quiet', action='store_true', help="Print only the summary.")
+
+    def _dataset(self, path, extension):
+        fmt = FORMATS.get(extension or os.path.splitext(path)[1].lstrip('.').lower())
+        if fmt is None:
+            raise CommandError(f"Cannot tell the format of {path}; pass --format.")
+        fmt = fmt()
+        try:
+            with open(path, 'rb' if fmt.is_binary() else 'r', encoding=None if fmt.is_binary() else 'utf-8-sig') as f:
+                return fmt.create_dataset(f.read())
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+    def handle(self, *args, **options):
+        dataset = self._dataset(options['path'], options['format'])
+        resource = resources.RESOURCES[options['resource']](
+            diff_stream=None if options['quiet'] else self.stdout)
+        result = resource.import_data(dataset, dry_run=options['dry_run'],
+                                      rollback_on_validation_errors=True)
+
+        for error in result.base_errors:
+            self.stderr.write(str(error.error))
+        for number, errors in result.row_errors():
+            for error in errors:
+                self.stderr.write(f"Row {number}: {error.error}")
+        for row in result.invalid_rows:
+            for field, messages in row.error_dict.items():
+                self.stderr.write(f"Row {row.number}: {field}: {' '.join(messages)}")
+
+        totals = ', '.join(f"{n} {kind}" for kind, n in result.totals.items() if n)
+        summary = f"{len(dataset)} rows: {totals or 'nothing to do'}"
+        if result.has_errors() or result.has_validation_errors():
+            raise CommandError(f"{summary}. Nothing was imported.")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{summary} (dry run, nothing was kept)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{summary}."))
@@ -0,0 +1,22 @@
+# wheatleycensus/management/commands/rebuild_provenance_graph.py
+# Recomputes the co-ownership edges of the provenance network from provenance records.
+# Run after bulk loads that bypass model signals (raw SQL, loaddata --raw, etc.).
+
+from django.core.management.base import BaseCommand
+
+from wheatleycensus import provenance_graph
+from wheatleycensus.models import CoOwnership
+
+
+class Command(BaseCommand):
+    help = "Rebuild the provenance network's co-ownership edges."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help="Database alias to rebuild (default: 'default').")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        provenance_graph.rebuild(using=using)
+        edges = CoOwnership.objects.using(using).count()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {edges} co-ownership edges on '{using}'."))
@@ -0,0 +1,23 @@
+# wheatleycensus/management/commands/rebuild_search_index.py
+# Rebuilds the keyword search index for every copy.
+# Run after bulk loads that bypass model signals (raw SQL, loaddata --raw, etc.).
+
+from django.core.management.base import BaseCommand, CommandError
+
+from wheatleycensus import search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text keyword index over copies and provenance names."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help="Database alias to rebuild (default: 'default').")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        kind = search_index.backend(using)
+        if kind is None:
+            raise CommandError(f"Database '{using}' has no keyword index; run migrations first.")
+        search_index.refresh(using=using)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {kind} keyword index on '{using}'."))
@@ -0,0 +1,22 @@
+# wheatleycensus/management/commands/refresh_collections.py
+# Recomputes rule-based collection memberships for every copy (see copy_collections.py).
+# Run after adding a rule-based collection or after bulk loads that bypass model signals.
+
+from django.core.management.base import BaseCommand
+
+from wheatleycensus import copy_collections
+from wheatleycensus.models import CopyCollection
+
+
+class Command(BaseCommand):
+    help = "Recompute the rule-based collection memberships of every copy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+                            help="Database alias to refresh (default: 'default').")
+
+    def handle(self, *args, **options):
+        using = options['database']
+        copy_collections.refresh(using=using)
+        total = CopyCollection.objects.using(using).count()
+        self.stdout.write(self.style.SUCCESS(f"Refreshed collections on '{using}': {total} memberships."))
@@ -0,0 +1,123 @@
+# wheatleycensus/metrics.py
+# In-process request metrics: one histogram per (view, measurement), fed by
+# PerformanceMiddleware (middleware.py) and rendered in the Prometheus text
+# exposition format by the staff-only metrics view.
+#
+# Histograms live in process memory, so each worker reports its own; a scraper
+# that hits several workers should sum the series. The same goes for the
+# database connection counters and pool gauges (see db.py).
+
+import threading
+from bisect import bisect_left
+
+# Upper bounds of the histogram buckets; +Inf is implied.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# name -> (help text, buckets)
+MEASUREMENTS = {
+    'wheatleycensus_request_seconds': ('Wall time spent handling the request.', SECONDS_BUCKETS),
+    'wheatleycensus_db_seconds': ('Time spent executing SQL.', SECONDS_BUCKETS),
+    'wheatleycensus_template_seconds': ('Time spent rendering templates.', SECONDS_BUCKETS),
+    'wheatleycensus_db_queries': ('Number of SQL queries executed.', QUERY_BUCKETS),
+}
+
+# name -> help text; counted per database alias.
+COUNTERS = {
+    'wheatleycensus_db_connections_total': 'Database connections opened.',
+    'wheatleycensus_db_retries_total': 'Views re-run after losing their database connection.',
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a running sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets + ('+Inf',), self.counts):
+            total += n
+            yield bound, total
+
+
+_histograms = {}  # (name, view) -> Histogram
+_counters = {}    # (name, alias) -> int
+_lock = threading.Lock()
+
+
+def observe(view, timings):
+    """Record one finished request's timings under its view name."""
+    values = {
+        'wheatleycensus_request_seconds': timings.total_time,
+        'wheatleycensus_db_seconds': timings.db_time,
+        'wheatleycensus_template_seconds': timings.template_time,
+        'wheatleycensus_db_queries': timings.queries,
+    }
+    with _lock:
+        for name, value in values.items():
+            key = (name, view)
+            if key not in _histograms:
+                _histograms[key] = Histogram(MEASUREMENTS[name][1])
+            _histograms[key].observe(value)
+
+
+def increment(name, alias):
+    """Add one to a counter for a database alias."""
+    with _lock:
+        _counters[name, alias] = _counters.get((name, alias), 0) + 1
+
+
+def reset():
+    """Forget every observation (used by tests)."""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(pool_stats=None):
+    """
+    Return all histograms and counters in the Prometheus text exposition format,
+    followed by gauges for `pool_stats` ({alias: {statistic: value}}, see db.py).
+    """
+    lines = []
+    with _lock:
+        for name, (help_text, _) in MEASUREMENTS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (hist_name, view), hist in sorted(_histograms.items()):
+                if hist_name != name:
+                    continue
+                view = _label(view)
+                for bound, total in hist.cumulative():
+                    lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {total}')
+                lines.append(f'{name}_sum{{view="{view}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{view="{view}"}} {hist.count}')
+        for name, help_text in COUNTERS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (counter_name, alias), total in sorted(_counters.items()):
+                if counter_name == name:
+                    lines.append(f'{name}{{alias="{_label(alias)}"}} {total}')
+    statistics = sorted({stat for stats in (pool_stats or {}).values() for stat in stats})
+    for stat in statistics:
+        name = f'wheatleycensus_db_pool_{stat}'
+        lines.append(f'# HELP {name} psycopg connection pool statistic {stat}.')
+        lines.append(f'# TYPE {name} gauge')
+        for alias, stats in sorted(pool_stats.items()):
+            if stat in stats:
+                lines.append(f'{name}{{alias="{_label(alias)}"}} {stats[stat]}')
+    return '\n'.join(lines) + '\n'
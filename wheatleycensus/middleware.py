@@ -0,0 +1,174 @@
+# wheatleycensus/middleware.py
+# Request middleware for the census site.
+#
+# PerformanceMiddleware measures each request: SQL query count and time (through a
+# database execute wrapper), template render time and total wall time. The figures
+# go back to the browser as a Server-Timing header and into the per-view histograms
+# in metrics.py. Streaming responses (CSV exports, the dump) do their queries while
+# the body is sent, so they are recorded when the stream is finished and carry no
+# Server-Timing header.
+#
+# StaticFilesMiddleware serves the files collectstatic wrote to STATIC_ROOT
+# without touching the rest of the stack: the brotli or gzip copy when the
+# browser accepts it, and a one-year immutable Cache-Control for hashed names
+# (see staticfiles.py).
+
+import contextvars
+import os
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import FileResponse, HttpResponseNotModified
+from django.template.backends.django import Template as DjangoTemplate
+
+from . import metrics, staticfiles
+
+# Timings of the request being handled in this thread/task, if any.
+_current = contextvars.ContextVar('wheatleycensus_request_timings', default=None)
+
+
+class RequestTimings:
+    """Counters for a single request."""
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.total_time = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # Database execute wrapper.
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += perf_counter() - start
+
+    def finish(self):
+        self.total_time = perf_counter() - self.start
+
+    def server_timing(self):
+        return ', '.join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+
+# ------------------------------------------------------------------------------
+# Template timing
+# ------------------------------------------------------------------------------
+def _timed_render(render):
+    def wrapper(self, context=None, request=None):
+        timings = _current.get()
+        if timings is None:
+            return render(self, context, request)
+        # Only the outermost render counts; render_to_string inside a tag nests.
+        timings._template_depth += 1
+        start = perf_counter()
+        try:
+            return render(self, context, request)
+        finally:
+            timings._template_depth -= 1
+            if not timings._template_depth:
+                timings.template_time += perf_counter() - start
+    wrapper._wheatleycensus_timed = True
+    return wrapper
+
+
+def _instrument_templates():
+    if not getattr(DjangoTemplate.render, '_wheatleycensus_timed', False):
+        DjangoTemplate.render = _timed_render(DjangoTemplate.render)
+
+
+# ------------------------------------------------------------------------------
+# Middleware
+# ------------------------------------------------------------------------------
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    return match.view_name or match._func_path
+
+
+class PerformanceMiddleware:
+    """Record query count, DB time, template time and wall time for every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        _instrument_templates()
+
+    def _measure(self, timings):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timings))
+        return stack
+
+    def __call__(self, request):
+        timings = RequestTimings()
+        token = _current.set(timings)
+        try:
+            with self._measure(timings):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        view = _view_name(request)
+        if response.streaming:
+            response.streaming_content = self._stream(response.streaming_content, timings, view)
+        else:
+            timings.finish()
+            response['Server-Timing'] = timings.server_timing()
+            metrics.observe(view, timings)
+        return response
+
+    def _stream(self, content, timings, view):
+        # The body may be consumed in another context than the view ran in,
+        # so the timings are re-installed rather than reset by token.
+        _current.set(timings)
+        try:
+            with self._measure(timings):
+                yield from content
+        finally:
+            _current.set(None)
+            timings.finish()
+            metrics.observe(view, timings)
+
+
+# ------------------------------------------------------------------------------
+# Static files
+# ------------------------------------------------------------------------------
+class StaticFilesMiddleware:
+    """Serve collected static files, precompressed, with long-lived cache headers."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL or ''
+
+    def __call__(self, request):
+        if (request.method in ('GET', 'HEAD') and self.prefix.startswith('/')
+                and request.path.startswith(self.prefix)):
+            static = staticfiles.collected.get(request.path[len(self.prefix):])
+            if static is not None:
+                return self.serve(request, static)
+        return self.get_response(request)
+
+    def serve(self, request, static):
+        path, encoding = static.choose(request.headers.get('Accept-Encoding', ''))
+        etag = f'"{static.size:x}-{int(os.path.getmtime(static.path)):x}{"-" + encoding if encoding else ""}"'
+        if request.headers.get('If-None-Match') == etag:
+            response = HttpResponseNotModified()
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=static.content_type,
+                                    filename=os.path.basename(static.path))
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = static.cache_control
+        return response
@@ -0,0 +1,26 @@
+# Creates the keyword search index (Postgres tsvector + GIN, or SQLite FTS5)
+# and fills it from the existing copies.
+
+from django.db import migrations
+
+from wheatleycensus import search_index
+
+
+def create_keyword_index(apps, schema_editor):
+    search_index.create_index(schema_editor)
+    search_index.refresh(using=schema_editor.connection.alias)
+
+
+def drop_keyword_index(apps, schema_editor):
+    search_index.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0005_remove_location_marc_code_copy_collated_by_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_keyword_index, drop_keyword_index),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 5.1.7 on 2026-10-16 22:59
+
+from django.conf import settings
+from django.db import migrations, models
+
+from wheatleycensus import sorting
+
+
+SORT_FIELDS = ['sort_year', 'sort_title', 'sort_location', 'sort_wc_number']
+
+
+def fill_sort_keys(apps, schema_editor):
+    Copy = apps.get_model('wheatleycensus', 'Copy')
+    db = schema_editor.connection.alias
+    copies = Copy.objects.using(db).select_related(
+        'location', 'issue__edition__title')
+    batch = []
+    for c in copies.iterator(chunk_size=2000):
+        c.sort_year = sorting.issue_year(c.issue)
+        c.sort_title = sorting.title_key(c.issue.edition.title.title) if c.issue else ''
+        c.sort_location = sorting.location_key(
+            c.location.name_of_library_collection if c.location else '')
+        c.sort_wc_number = sorting.wc_number_key(c.wc_number)
+        batch.append(c)
+        if len(batch) >= 2000:
+            Copy.objects.using(db).bulk_update(batch, SORT_FIELDS)
+            batch = []
+    if batch:
+        Copy.objects.using(db).bulk_update(batch, SORT_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0006_copy_keyword_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='copy',
+            name='sort_location',
+            field=models.CharField(blank=True, default='', editable=False, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='copy',
+            name='sort_title',
+            field=models.CharField(blank=True, default='', editable=False, max_length=128),
+        ),
+        migrations.AddField(
+            model_name='copy',
+            name='sort_wc_number',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='copy',
+            name='sort_year',
+            field=models.IntegerField(default=9999, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='copy',
+            index=models.Index(fields=['sort_year', 'sort_title', 'sort_location', 'id'], name='copy_date_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='copy',
+            index=models.Index(fields=['sort_title', 'sort_year', 'sort_location', 'id'], name='copy_title_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='copy',
+            index=models.Index(fields=['sort_location', 'sort_year', 'sort_title', 'id'], name='copy_location_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='copy',
+            index=models.Index(fields=['issue', 'sort_wc_number', 'sort_location'], name='copy_issue_order_idx'),
+        ),
+        migrations.RunPython(fill_sort_keys, migrations.RunPython.noop),
+    ]
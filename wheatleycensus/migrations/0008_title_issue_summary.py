@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from wheatleycensus import sorting
+
+
+def fill_issue_summary(apps, schema_editor):
+    Title = apps.get_model('wheatleycensus', 'Title')
+    Issue = apps.get_model('wheatleycensus', 'Issue')
+    db = schema_editor.connection.alias
+    for title in Title.objects.using(db).all():
+        issues = list(Issue.objects.using(db).filter(edition__title=title).order_by('edition_id', 'id'))
+        title.earliest_year = min((sorting.issue_year(i) for i in issues), default=sorting.MISSING_YEAR)
+        title.first_issue = issues[0] if issues else None
+        title.save(update_fields=['earliest_year', 'first_issue'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0007_copy_sort_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='title',
+            name='earliest_year',
+            field=models.IntegerField(default=9999, editable=False),
+        ),
+        migrations.AddField(
+            model_name='title',
+            name='first_issue',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='wheatleycensus.issue'),
+        ),
+        migrations.AddIndex(
+            model_name='title',
+            index=models.Index(fields=['earliest_year', 'title'], name='title_homepage_order_idx'),
+        ),
+        migrations.RunPython(fill_issue_summary, migrations.RunPython.noop),
+    ]
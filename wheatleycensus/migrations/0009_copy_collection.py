@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from wheatleycensus import copy_collections
+
+
+def fill_collections(apps, schema_editor):
+    copy_collections.refresh(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0008_title_issue_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CopyCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(max_length=32)),
+                ('copy', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='collection_memberships', to='wheatleycensus.copy')),
+            ],
+            options={
+                'verbose_name': 'Collection Membership',
+                'verbose_name_plural': 'Collection Memberships',
+                'constraints': [models.UniqueConstraint(fields=('collection', 'copy'), name='copy_collection_unique')],
+            },
+        ),
+        migrations.RunPython(fill_collections, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0009_copy_collection'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='location_lat_lon_idx'),
+        ),
+    ]
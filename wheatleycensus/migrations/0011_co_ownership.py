@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from wheatleycensus import provenance_graph
+
+
+def fill_edges(apps, schema_editor):
+    provenance_graph.rebuild(using=schema_editor.connection.alias, apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0010_location_lat_lon_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoOwnership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('copies', models.PositiveIntegerField(default=1)),
+                ('co_owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wheatleycensus.provenancename')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='wheatleycensus.provenancename')),
+            ],
+            options={
+                'verbose_name': 'Co-Ownership',
+                'verbose_name_plural': 'Co-Ownerships',
+                'constraints': [models.UniqueConstraint(fields=('owner', 'co_owner'), name='co_ownership_unique'), models.CheckConstraint(condition=models.Q(('owner__lt', models.F('co_owner'))), name='co_ownership_ordered')],
+            },
+        ),
+        migrations.RunPython(fill_edges, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0011_co_ownership'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['start_date', 'end_date'], name='issue_date_range_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0012_issue_date_range_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='title',
+            name='icon_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
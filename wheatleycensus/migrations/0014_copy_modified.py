@@ -0,0 +1,20 @@
+# Generated by Django 5.1.7 on 2026-10-16 23:58
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('wheatleycensus', '0013_title_icon_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='copy',
+            name='modified',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, editable=False),
+            preserve_default=False,
+        ),
+    ]
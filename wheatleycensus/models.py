@@ -1,6 +1,8 @@
 from django.db import models
 from django.conf import settings
 
+from . import sorting
+
 # wheatleycensus/models.py
 # Defines all database models for the Wheatley Census app.
 # Models represent core data structures: locations, copies, issues, titles, provenance, and static page text.
@@ -49,6 +51,12 @@ class Location(models.Model):
     latitude                    = models.FloatField(null=True, blank=True)
     longitude                   = models.FloatField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Bounding-box prefilter of the radius and nearest-library queries (see geo.py).
+            models.Index(fields=['latitude', 'longitude'], name='location_lat_lon_idx'),
+        ]
+
     def __str__(self):
         return self.name_of_library_collection or "Unknown Location"
 
@@ -100,10 +108,33 @@ class Title(models.Model):
     title = models.CharField(max_length=128, unique=True)
     notes = models.TextField(null=True, blank=True, default='')
     image = models.ImageField(upload_to='titleicon', null=True, blank=True)
+    # Display-size WebP/PNG derivatives of the image, made by images.py.
+    icon_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    # Summary of the title's issues, maintained by signals on Edition/Issue writes
+    # so the homepage grid needs a single query.
+    earliest_year = models.IntegerField(default=sorting.MISSING_YEAR, editable=False)
+    first_issue   = models.ForeignKey('Issue', on_delete=models.SET_NULL, null=True, blank=True,
+                                      editable=False, related_name='+')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['earliest_year', 'title'], name='title_homepage_order_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def refresh_issue_summary(self, using=None):
+        """Recompute earliest_year and first_issue from this title's issues."""
+        db = using or self._state.db or 'default'
+        issues = list(Issue.objects.using(db).filter(edition__title=self)
+                      .order_by('edition_id', 'id').only('id', 'year', 'start_date'))
+        self.earliest_year = min((sorting.issue_year(i) for i in issues), default=sorting.MISSING_YEAR)
+        self.first_issue = issues[0] if issues else None
+        Title.objects.using(db).filter(pk=self.pk).update(
+            earliest_year=self.earliest_year, first_issue=self.first_issue)
+
 # Edition: Represents an edition of a title.
 class Edition(models.Model):
     title           = models.ForeignKey(Title, on_delete=models.CASCADE)
@@ -123,6 +154,12 @@ class Issue(models.Model):
     notes              = models.TextField(null=True, blank=True)
     bibliographic_data = models.TextField(null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Year searches and the timeline (timeline.py) select issues by interval.
+            models.Index(fields=['start_date', 'end_date'], name='issue_date_range_idx'),
+        ]
+
     def __str__(self):
         return f"{self.edition} ({self.year})"
 
@@ -155,5 +192,87 @@ class Copy(models.Model):
     examined_by         = models.CharField(max_length=500, null=True, blank=True)
     collated_by         = models.CharField(max_length=500, null=True, blank=True)
 
+    # Normalized sort columns, derived from the issue, title and location on save
+    # (and refreshed by signals when those change). See sorting.py.
+    sort_year           = models.IntegerField(default=sorting.MISSING_YEAR, editable=False)
+    sort_title          = models.CharField(max_length=128, default='', blank=True, editable=False)
+    sort_location       = models.CharField(max_length=500, default='', blank=True, editable=False)
+    sort_wc_number      = models.CharField(max_length=64, default='', blank=True, editable=False)
+
+    # When the copy or anything shown in its table row (issue year, title, location
+    # name) last changed; signals advance it for the related rows. Keys the cached
+    # row HTML (see row_cache.py).
+    modified            = models.DateTimeField(auto_now=True, editable=False)
+
+    SORT_FIELDS = ('sort_year', 'sort_title', 'sort_location', 'sort_wc_number')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sort_year', 'sort_title', 'sort_location', 'id'], name='copy_date_order_idx'),
+            models.Index(fields=['sort_title', 'sort_year', 'sort_location', 'id'], name='copy_title_order_idx'),
+            models.Index(fields=['sort_location', 'sort_year', 'sort_title', 'id'], name='copy_location_order_idx'),
+            models.Index(fields=['issue', 'sort_wc_number', 'sort_location'], name='copy_issue_order_idx'),
+        ]
+
     def __str__(self):
         return f"{self.wc_number} ({self.issue.year if self.issue else 'No Issue'})"
+
+    def update_sort_keys(self):
+        """Recompute the persisted sort columns from the related issue, title and location."""
+        issue = self.issue
+        self.sort_year = sorting.issue_year(issue)
+        self.sort_title = sorting.title_key(issue.edition.title.title) if issue else ''
+        self.sort_location = sorting.location_key(
+            self.location.name_of_library_collection if self.location else '')
+        self.sort_wc_number = sorting.wc_number_key(self.wc_number)
+
+    def save(self, *args, **kwargs):
+        self.update_sort_keys()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | set(self.SORT_FIELDS) | {'modified'}
+        super().save(*args, **kwargs)
+
+# CopyCollection: Membership of a copy in a browse collection. Rule-based collections
+# are maintained by signals; curated ones are edited in the admin (see copy_collections.py).
+class CopyCollection(models.Model):
+    collection = models.CharField(max_length=32)
+    copy       = models.ForeignKey(Copy, on_delete=models.CASCADE, related_name='collection_memberships')
+
+    class Meta:
+        verbose_name = "Collection Membership"
+        verbose_name_plural = "Collection Memberships"
+        constraints = [
+            models.UniqueConstraint(fields=['collection', 'copy'], name='copy_collection_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.copy} in {self.collection}"
+
+# CoOwnership: Edge of the provenance network between two provenance names that own
+# at least one copy in common, stored once per pair (owner id < co_owner id) with the
+# number of shared copies. Maintained by signals; see provenance_graph.py.
+class CoOwnership(models.Model):
+    owner    = models.ForeignKey(ProvenanceName, on_delete=models.CASCADE, related_name='+')
+    co_owner = models.ForeignKey(ProvenanceName, on_delete=models.CASCADE, related_name='+')
+    copies   = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        verbose_name = "Co-Ownership"
+        verbose_name_plural = "Co-Ownerships"
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'co_owner'], name='co_ownership_unique'),
+            models.CheckConstraint(condition=models.Q(owner__lt=models.F('co_owner')),
+                                   name='co_ownership_ordered'),
+        ]
+
+    def __str__(self):
+        return f"{self.owner} with {self.co_owner} ({self.copies})"
+
+# DataVersion: Current version of one data namespace (see versioning.py). Kept in the
+# database so that every worker process sees a bump as soon as the write commits.
+class DataVersion(models.Model):
+    namespace = models.CharField(max_length=64, primary_key=True)
+    version   = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.namespace} @ {self.version}"
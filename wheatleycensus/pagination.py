@@ -0,0 +1,146 @@
+# wheatleycensus/pagination.py
+# Keyset (cursor) pagination for copy listings.
+# Pages are fetched with `WHERE (sort columns) > (last row's values) ORDER BY ... LIMIT n`,
+# so a deep page costs the same as the first one. Cursors are signed tokens holding the
+# sort tuple of the row at the page boundary.
+#
+# Also EstimatedCountPaginator, used by the admin changelists of the large tables.
+
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'wheatleycensus.pagination.cursor'
+
+
+def _field_name(term):
+    return term[1:] if term.startswith('-') else term
+
+
+class KeysetPage:
+    """One page of results plus the tokens for its neighbouring pages."""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Paginate a queryset by a tuple of non-null sort columns. The last term of
+    `ordering` must be unique (normally 'id') so every row has a distinct key.
+    A leading '-' marks a descending column, as in QuerySet.order_by().
+    """
+
+    def __init__(self, queryset, ordering, per_page=20):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+
+    # --- cursors ---
+    def _key(self, obj):
+        return [getattr(obj, _field_name(term)) for term in self.ordering]
+
+    def _encode(self, obj, direction):
+        return signing.dumps({'k': self._key(obj), 'd': direction}, salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            key, direction = data['k'], data['d']
+        except (signing.BadSignature, KeyError, TypeError):
+            return None, 'next'
+        if len(key) != len(self.ordering) or direction not in ('next', 'prev'):
+            return None, 'next'
+        return key, direction
+
+    def _after(self, key, backwards):
+        """Q matching rows strictly after `key` in the ordering (before, if backwards)."""
+        query = Q(pk__in=[])
+        equal = Q()
+        for term, value in zip(self.ordering, key):
+            name = _field_name(term)
+            ascending = not term.startswith('-')
+            lookup = 'gt' if ascending != backwards else 'lt'
+            query |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        return query
+
+    # --- pages ---
+    def page(self, cursor=None):
+        """Return the page following (or preceding) the row encoded in `cursor`."""
+        key, direction = self._decode(cursor) if cursor else (None, 'next')
+        backwards = direction == 'prev'
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(_field_name(t) if t.startswith('-') else '-' + t for t in ordering)
+
+        qs = self.queryset.order_by(*ordering)
+        if key is not None:
+            qs = qs.filter(self._after(key, backwards))
+        rows = list(qs[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage([], None, None)
+        if backwards:
+            has_next, has_previous = key is not None, more
+        else:
+            has_next, has_previous = more, key is not None
+        return KeysetPage(
+            rows,
+            self._encode(rows[-1], 'next') if has_next else None,
+            self._encode(rows[0], 'prev') if has_previous else None,
+        )
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the total of an unfiltered PostgreSQL table from the
+    planner's row estimate instead of COUNT(*), which scans the whole table.
+    Filtered querysets, small tables and other databases are counted exactly.
+    """
+
+    # Below this many (estimated) rows an exact count is cheap enough.
+    EXACT_BELOW = 10000
+
+    def _estimate(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query') or queryset.query.where:
+            return None
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                           [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        return int(row[0]) if row and row[0] > 0 else None
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate()
+        if estimate is not None and estimate >= self.EXACT_BELOW:
+            return estimate
+        return super().count
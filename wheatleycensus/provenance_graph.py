@@ -0,0 +1,209 @@
+# wheatleycensus/provenance_graph.py
+# The provenance network: which owners held copies alongside which others.
+#
+# Owner-owner edges are precomputed in the CoOwnership table (one row per pair of
+# provenance names sharing at least one copy, with the number of shared copies).
+# signals.py keeps it current: saving or deleting a ProvenanceRecord recomputes
+# only the edges of the owners involved.
+#
+# Queries never walk the tables recursively. Each process holds the network in
+# compressed sparse row (CSR) arrays indexed by database id: owner -> co-owners
+# (from CoOwnership) and owner -> copies -> owners (the bipartite adjacency, used
+# when the walk is restricted to one title). It is rebuilt from three queries
+# whenever the graph, copy or title data version changes, and neighbourhoods are
+# a breadth-first search over those arrays.
+
+import threading
+
+import numpy as np
+from django.apps import apps as django_apps
+from django.db.models import Count, F
+
+from . import versioning
+
+NAMESPACE = 'provenance-graph'
+DEFAULT_DEPTH = 2
+MAX_DEPTH = 4
+# Most owners a neighbourhood returns; the search stops once it has this many.
+NODE_LIMIT = 200
+BATCH_SIZE = 1000
+# Owner ids per IN (...) lookup when refreshing edges.
+CHUNK_SIZE = 500
+
+
+# ------------------------------------------------------------------------------
+# Edge maintenance
+# ------------------------------------------------------------------------------
+def _pairs(records):
+    """(owner, other owner, shared copies) for every pair reachable from `records`."""
+    return (records.annotate(other=F('copy__provenance_records__provenance_name'))
+            .exclude(other=F('provenance_name'))
+            .order_by()
+            .values_list('provenance_name', 'other')
+            .annotate(n=Count('copy', distinct=True)))
+
+
+def refresh_owners(owner_ids, using='default', apps=None):
+    """Recompute every edge touching the given provenance names."""
+    apps = apps or django_apps
+    ProvenanceRecord = apps.get_model('wheatleycensus', 'ProvenanceRecord')
+    CoOwnership = apps.get_model('wheatleycensus', 'CoOwnership')
+    owner_ids = sorted({int(pk) for pk in owner_ids if pk is not None})
+    if not owner_ids:
+        return
+    for i in range(0, len(owner_ids), CHUNK_SIZE):
+        chunk = owner_ids[i:i + CHUNK_SIZE]
+        edges = {}
+        records = ProvenanceRecord.objects.using(using).filter(provenance_name__in=chunk)
+        for owner, other, n in _pairs(records):
+            edges[min(owner, other), max(owner, other)] = n
+        CoOwnership.objects.using(using).filter(owner__in=chunk).delete()
+        CoOwnership.objects.using(using).filter(co_owner__in=chunk).delete()
+        CoOwnership.objects.using(using).bulk_create(
+            [CoOwnership(owner_id=a, co_owner_id=b, copies=n) for (a, b), n in edges.items()],
+            batch_size=BATCH_SIZE)
+    versioning.bump_version(NAMESPACE)
+
+
+def rebuild(using='default', apps=None):
+    """Recompute the whole CoOwnership table."""
+    apps = apps or django_apps
+    ProvenanceRecord = apps.get_model('wheatleycensus', 'ProvenanceRecord')
+    CoOwnership = apps.get_model('wheatleycensus', 'CoOwnership')
+    CoOwnership.objects.using(using).all().delete()
+    pairs = _pairs(ProvenanceRecord.objects.using(using)).filter(
+        other__gt=F('provenance_name'))
+    batch = []
+    for owner, other, n in pairs.iterator(chunk_size=BATCH_SIZE):
+        batch.append(CoOwnership(owner_id=owner, co_owner_id=other, copies=n))
+        if len(batch) == BATCH_SIZE:
+            CoOwnership.objects.using(using).bulk_create(batch)
+            batch = []
+    CoOwnership.objects.using(using).bulk_create(batch)
+    versioning.bump_version(NAMESPACE)
+
+
+# ------------------------------------------------------------------------------
+# In-memory graph
+# ------------------------------------------------------------------------------
+def _csr(rows, cols, size, weights=None):
+    """CSR arrays (indptr, indices, weights) for edges rows[i] -> cols[i]."""
+    order = np.argsort(rows, kind='stable')
+    indptr = np.searchsorted(rows[order], np.arange(size + 1)).astype(np.int64)
+    weights = weights[order] if weights is not None else None
+    return indptr, cols[order], weights
+
+
+class ProvenanceGraph:
+    """Owner-owner and owner-copy adjacency of one database, kept in CSR arrays."""
+
+    def __init__(self, using='default'):
+        self.using = using
+        self.version = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _current_version():
+        return tuple(versioning.get_version(ns) for ns in (NAMESPACE, 'copies', 'titles'))
+
+    def _build(self):
+        from .models import CoOwnership, Copy, ProvenanceRecord
+
+        version = self._current_version()
+        edges = np.array(CoOwnership.objects.using(self.using).values_list(
+            'owner_id', 'co_owner_id', 'copies'), dtype=np.int64).reshape(-1, 3)
+        records = np.array(ProvenanceRecord.objects.using(self.using).values_list(
+            'provenance_name_id', 'copy_id'), dtype=np.int64).reshape(-1, 2)
+        titles = np.array(Copy.objects.using(self.using).filter(issue__isnull=False).values_list(
+            'pk', 'issue__edition__title_id'), dtype=np.int64).reshape(-1, 2)
+
+        owners = int(max(edges[:, :2].max(initial=0), records[:, 0].max(initial=0))) + 1
+        copies = int(max(records[:, 1].max(initial=0), titles[:, 0].max(initial=0))) + 1
+        a, b, n = edges[:, 0], edges[:, 1], edges[:, 2]
+        self.owner_owner = _csr(np.concatenate([a, b]), np.concatenate([b, a]), owners,
+                                np.concatenate([n, n]))
+        self.owner_copy = _csr(records[:, 0], records[:, 1], owners)
+        self.copy_owner = _csr(records[:, 1], records[:, 0], copies)
+        self.copy_title = np.full(copies, -1, dtype=np.int64)
+        self.copy_title[titles[:, 0]] = titles[:, 1]
+        self.owners, self.copies = owners, copies
+        self.version = version
+
+    def _ensure_current(self):
+        with self._lock:
+            if self.version != self._current_version():
+                self._build()
+
+    @staticmethod
+    def _row(csr, node, size):
+        if node >= size:
+            return csr[1][:0]
+        return csr[1][csr[0][node]:csr[0][node + 1]]
+
+    def owned_copies(self, owner, title=None):
+        found = self._row(self.owner_copy, owner, self.owners)
+        if title is not None:
+            found = found[self.copy_title[found] == title]
+        return found
+
+    def neighbors(self, owner, title=None):
+        """{co-owner id: shared copies}, counting only copies of `title` if given."""
+        if title is None:
+            if owner >= self.owners:
+                return {}
+            start, end = self.owner_owner[0][owner], self.owner_owner[0][owner + 1]
+            return dict(zip(self.owner_owner[1][start:end].tolist(),
+                            self.owner_owner[2][start:end].tolist()))
+        found = {}
+        for copy in self.owned_copies(owner, title).tolist():
+            for other in self._row(self.copy_owner, copy, self.copies).tolist():
+                if other != owner:
+                    found[other] = found.get(other, 0) + 1
+        return found
+
+    def neighborhood(self, owner, depth=DEFAULT_DEPTH, title=None, limit=NODE_LIMIT):
+        """
+        Owners within `depth` co-ownership steps of `owner` (breadth first, at most
+        `limit` of them) and the edges between them.
+        """
+        self._ensure_current()
+        depth = max(0, min(depth, MAX_DEPTH))
+        depths = {owner: 0}
+        frontier = [owner]
+        truncated = False
+        for level in range(1, depth + 1):
+            following = []
+            for node in frontier:
+                for other in sorted(self.neighbors(node, title)):
+                    if other in depths:
+                        continue
+                    if len(depths) >= limit:
+                        truncated = True
+                        break
+                    depths[other] = level
+                    following.append(other)
+            frontier = following
+            if not frontier:
+                break
+        edges = [(a, b, n) for a in depths for b, n in self.neighbors(a, title).items()
+                 if a < b and b in depths]
+        copies = {pk: len(self.owned_copies(pk, title)) for pk in depths}
+        return depths, sorted(edges), copies, truncated
+
+
+graph = ProvenanceGraph()
+
+
+def neighborhood(owner, depth=DEFAULT_DEPTH, title=None):
+    """JSON-ready neighbourhood of a provenance name: nodes, edges and whether it was cut short."""
+    from .models import ProvenanceName
+
+    depths, edges, copies, truncated = graph.neighborhood(owner, depth, title)
+    names = dict(ProvenanceName.objects.using(graph.using).filter(pk__in=list(depths))
+                 .values_list('pk', 'name'))
+    return {
+        'nodes': [{'id': pk, 'name': names.get(pk) or '', 'depth': d, 'copies': copies[pk]}
+                  for pk, d in depths.items()],
+        'edges': [{'source': a, 'target': b, 'copies': n} for a, b, n in edges],
+        'truncated': truncated,
+    }
@@ -0,0 +1,387 @@
+# wheatleycensus/resources.py
+# django-import-export resources for onboarding holdings from spreadsheets.
+#
+# Rows are matched on natural keys rather than database ids: a copy by its WC number,
+# a location by its name, an issue by title + edition + year, a provenance name by the
+# name itself. Every key the file mentions is resolved up front in a few chunked
+# queries, and rows are written with batched bulk_create / bulk_update, so an import
+# costs a handful of queries per thousand rows instead of several per row.
+#
+# Bulk writes skip model signals; the derived data the signals would maintain (sort
+# keys, keyword index, collections, provenance network, cache versions) is updated once
+# after the import.
+# Large files are best loaded with `python manage.py import_census`, which streams the
+# dry-run diff row by row instead of rendering it in the admin.
+
+from django.db.models import Model
+from django.utils import timezone
+from import_export import fields, resources, widgets
+from import_export.instance_loaders import ModelInstanceLoader
+
+from . import copy_collections, provenance_graph, search_index, versioning
+from .models import Copy, Issue, Location, ProvenanceName, ProvenanceRecord
+
+# Rows per bulk_create / bulk_update statement.
+BATCH_SIZE = 1000
+# Keys per IN (...) lookup; well under SQLite's bound-parameter limit.
+CHUNK_SIZE = 500
+# Above this many changed copies, rebuilding the keyword index and collections
+# outright is cheaper than refreshing them id by id.
+REFRESH_ALL_ABOVE = 5000
+
+
+def _text(value):
+    """Cell value as stripped text; spreadsheet numbers like 12.0 become '12'."""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+def _key_part(value):
+    return value.pk if isinstance(value, Model) else value
+
+
+def _render(field, value):
+    return repr(_text(field.widget.render(value)))
+
+
+# ------------------------------------------------------------------------------
+# Widgets
+# ------------------------------------------------------------------------------
+class BulkForeignKeyWidget(widgets.ForeignKeyWidget):
+    """
+    ForeignKeyWidget that resolves values from a lookup table filled once per
+    import by prime(), instead of one query per row. Where several rows share a
+    value (e.g. two locations with the same name), the lowest id wins.
+    """
+
+    def __init__(self, model, field='pk', select_related=(), **kwargs):
+        super().__init__(model, field, **kwargs)
+        self.select_related = select_related
+        self.lookup = None
+
+    def prime(self, values, using):
+        keys = sorted({_text(v) for v in values} - {''})
+        queryset = self.model.objects.using(using).select_related(*self.select_related)
+        self.lookup = {}
+        for chunk in _chunks(keys):
+            for obj in queryset.filter(**{f'{self.field}__in': chunk}).order_by('-pk'):
+                self.lookup[_text(getattr(obj, self.field))] = obj
+
+    def clean(self, value, row=None, **kwargs):
+        if self.lookup is None:
+            return super().clean(value, row, **kwargs)
+        key = _text(value)
+        if not key:
+            return None
+        try:
+            return self.lookup[key]
+        except KeyError:
+            raise ValueError(f"{self.model._meta.verbose_name.capitalize()} '{key}' does not exist.")
+
+
+class IssueWidget(widgets.Widget):
+    """
+    The issue of a copy, identified by the row's title, edition and year columns.
+    The field's own column is the year; title and edition are read from the row.
+    """
+
+    def __init__(self, title_column='title', edition_column='edition', **kwargs):
+        super().__init__(**kwargs)
+        self.title_column = title_column
+        self.edition_column = edition_column
+        self.lookup = None
+
+    def key(self, row, year):
+        return (_text(row.get(self.title_column)), _text(row.get(self.edition_column)), _text(year))
+
+    def prime(self, rows, using):
+        titles = sorted({_text(row.get(self.title_column)) for row in rows} - {''})
+        queryset = Issue.objects.using(using).select_related('edition__title')
+        self.lookup = {}
+        for chunk in _chunks(titles):
+            for issue in queryset.filter(edition__title__title__in=chunk).order_by('-pk'):
+                edition = issue.edition
+                self.lookup[(edition.title.title, edition.edition_number or '', issue.year)] = issue
+
+    def clean(self, value, row=None, **kwargs):
+        title, edition, year = key = self.key(row or {}, value)
+        if not any(key):
+            return None
+        if not title or not year:
+            raise ValueError("Both a title and a year are needed to identify the issue.")
+        try:
+            return (self.lookup or {})[key]
+        except KeyError:
+            raise ValueError(f"No issue of '{title}' edition '{edition}' for {year}.")
+
+    def render(self, value, obj=None, **kwargs):
+        return value.year if value else ''
+
+
+# ------------------------------------------------------------------------------
+# Instance loading
+# ------------------------------------------------------------------------------
+class BulkInstanceLoader(ModelInstanceLoader):
+    """Load every existing row the dataset refers to, keyed by the import id fields."""
+
+    def __init__(self, resource, dataset=None):
+        super().__init__(resource, dataset)
+        self.fields = [resource.fields[name] for name in resource.get_import_id_fields()]
+        self.instances = {}
+        if dataset is None or any(f.column_name not in dataset.headers for f in self.fields):
+            return
+        keys = set()
+        for row in dataset.dict:
+            try:
+                keys.add(self.row_key(row))
+            except ValueError:
+                continue  # reported when the row itself is imported
+        # Narrow on the first key field, then match the full key in Python.
+        model = resource._meta.model
+        lookup = f'{self.fields[0].attribute}__in'
+        attnames = [model._meta.get_field(f.attribute).attname for f in self.fields]
+        for chunk in _chunks(sorted({key[0] for key in keys if key[0] is not None})):
+            for instance in self.get_queryset().filter(**{lookup: chunk}).order_by('-pk'):
+                key = tuple(getattr(instance, name) for name in attnames)
+                if key in keys:
+                    self.instances[key] = instance
+
+    def row_key(self, row):
+        return tuple(_key_part(field.clean(row)) for field in self.fields)
+
+    def get_instance(self, row):
+        return self.instances.get(self.row_key(row))
+
+
+# ------------------------------------------------------------------------------
+# Resources
+# ------------------------------------------------------------------------------
+class BulkResource(resources.ModelResource):
+    """
+    ModelResource with bulk lookups and writes. Pass diff_stream (anything with a
+    write() method) to receive one line per new or changed row as it is imported.
+    """
+
+    class Meta:
+        use_bulk = True
+        batch_size = BATCH_SIZE
+        use_transactions = True
+        skip_unchanged = True
+        # The per-row deep copy and HTML diff dominate import time; changes are
+        # tracked field by field in import_instance() instead.
+        skip_diff = True
+        report_skipped = False
+        instance_loader_class = BulkInstanceLoader
+
+    def __init__(self, diff_stream=None, **kwargs):
+        super().__init__(**kwargs)
+        self.diff_stream = diff_stream
+        self.saved = []
+        self._changes = None
+        self._tracked = []
+        self._seen = {}
+
+    # --- hooks for subclasses ---
+    def prime(self, dataset, using):
+        """Fill the lookup tables of the foreign key widgets for this dataset."""
+
+    def refresh_derived(self, instances, using):
+        """Bring data maintained by signals up to date for the written instances."""
+
+    # --- import workflow ---
+    def before_import(self, dataset, **kwargs):
+        super().before_import(dataset, **kwargs)
+        using = self.get_db_connection_name()
+        self.prime(dataset, using)
+        self._tracked = [f for f in self.get_import_fields()
+                         if not f.readonly and f.attribute and f.column_name in dataset.headers]
+        self.saved = []
+        self._seen = {}
+
+    def _key_text(self, row):
+        return ' / '.join(_text(row.get(self.fields[name].column_name))
+                          for name in self.get_import_id_fields())
+
+    def before_import_row(self, row, **kwargs):
+        super().before_import_row(row, **kwargs)
+        key = self._key_text(row)
+        if key in self._seen:
+            raise ValueError(f"Row repeats '{key}' from row {self._seen[key]}.")
+        self._seen[key] = kwargs.get('row_number')
+
+    def import_instance(self, instance, row, **kwargs):
+        self._changes = None
+        before = {f: f.get_value(instance) for f in self._tracked} if instance.pk else {}
+        super().import_instance(instance, row, **kwargs)
+        self._changes = {}
+        for f in self._tracked:
+            old, new = before.get(f), f.get_value(instance)
+            # A blank cell matches a NULL column.
+            if _key_part(old) in ('', None) and _key_part(new) in ('', None):
+                continue
+            if _key_part(old) != _key_part(new):
+                self._changes[f] = (old, new)
+        instance._changed_fields = {f.attribute for f in self._changes}
+
+    def skip_row(self, instance, original, row, import_validation_errors=None):
+        return bool(self._meta.skip_unchanged and not import_validation_errors
+                    and instance.pk is not None and not self._changes)
+
+    def after_import_row(self, row, row_result, **kwargs):
+        super().after_import_row(row, row_result, **kwargs)
+        if self.diff_stream is None or not self._changes:
+            return
+        changes = '; '.join(
+            f"{f.column_name}: {_render(f, old)} -> {_render(f, new)}" if row_result.import_type == 'update'
+            else f"{f.column_name}={_render(f, new)}"
+            for f, (old, new) in self._changes.items())
+        self.diff_stream.write(f"{kwargs.get('row_number')}\t{row_result.import_type}\t"
+                               f"{self._key_text(row)}\t{changes}")
+
+    def bulk_create(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        pending = list(self.create_instances)
+        super().bulk_create(using_transactions, dry_run, raise_errors, batch_size, result)
+        self.saved.extend(pending)
+
+    def update_fields(self, changed):
+        """Columns to write for an existing row whose imported attributes `changed`."""
+        return tuple(sorted(changed))
+
+    def bulk_update(self, using_transactions, dry_run, raise_errors, batch_size=None, result=None):
+        # Rows are grouped by the columns that actually changed: bulk_update builds a
+        # CASE expression per column, so writing unchanged columns is the dominant cost.
+        groups = {}
+        for instance in self.update_instances:
+            groups.setdefault(self.update_fields(instance._changed_fields), []).append(instance)
+        try:
+            if using_transactions or not dry_run:
+                for names, instances in groups.items():
+                    self._meta.model.objects.bulk_update(instances, names, batch_size=batch_size)
+            self.saved.extend(self.update_instances)
+        except Exception as e:
+            self.handle_import_error(result, e, raise_errors)
+        finally:
+            self.update_instances.clear()
+
+    def after_import(self, dataset, result, **kwargs):
+        super().after_import(dataset, result, **kwargs)
+        if not self._is_dry_run(kwargs) and not result.has_errors() and self.saved:
+            self.refresh_derived([i for i in self.saved if i.pk is not None],
+                                 self.get_db_connection_name())
+
+
+def _refresh_copies(copy_ids, using):
+    copy_ids = sorted(set(copy_ids))
+    if len(copy_ids) > REFRESH_ALL_ABOVE:
+        copy_ids = None
+    search_index.refresh(copy_ids, using=using)
+    copy_collections.refresh(copy_ids, using=using)
+
+
+class CopyResource(BulkResource):
+    title = fields.Field(attribute='issue__edition__title__title', column_name='title', readonly=True)
+    edition = fields.Field(attribute='issue__edition__edition_number', column_name='edition',
+                           readonly=True)
+    issue = fields.Field(attribute='issue', column_name='year', widget=IssueWidget())
+    location = fields.Field(attribute='location', column_name='location',
+                            widget=BulkForeignKeyWidget(Location, 'name_of_library_collection'))
+
+    class Meta:
+        model = Copy
+        import_id_fields = ('wc_number',)
+        fields = ('wc_number', 'title', 'edition', 'issue', 'location', 'shelfmark',
+                  'verification', 'signed_by_author', 'fragment', 'from_estc',
+                  'catalogue_url', 'digital_facsimile_url', 'binding', 'marginalia',
+                  'prov_info', 'bibliography', 'height', 'width')
+        export_order = fields
+
+    def get_queryset(self):
+        return Copy.objects.select_related('issue__edition__title', 'location')
+
+    def prime(self, dataset, using):
+        if 'year' in dataset.headers:
+            self.fields['issue'].widget.prime(dataset.dict, using)
+        if 'location' in dataset.headers:
+            self.fields['location'].widget.prime(dataset['location'], using)
+
+    def update_fields(self, changed):
+        if changed & {'issue', 'location'}:
+            changed = changed | set(Copy.SORT_FIELDS)
+        # bulk_update() does not apply auto_now.
+        return super().update_fields(changed | {'modified'})
+
+    def before_save_instance(self, instance, row, **kwargs):
+        super().before_save_instance(instance, row, **kwargs)
+        instance.update_sort_keys()
+        instance.modified = timezone.now()
+
+    def refresh_derived(self, instances, using):
+        _refresh_copies([copy.pk for copy in instances], using)
+        versioning.bump_version('copies', 'census')
+
+
+class ProvenanceNameResource(BulkResource):
+    class Meta:
+        model = ProvenanceName
+        import_id_fields = ('name',)
+        fields = ('name', 'bio', 'viaf', 'start_century', 'end_century', 'gender')
+        export_order = fields
+
+    def refresh_derived(self, instances, using):
+        # Renamed or edited owners change the keyword index and collections of their copies.
+        copy_ids = ProvenanceRecord.objects.using(using).filter(
+            provenance_name__in=[name.pk for name in instances]
+        ).values_list('copy_id', flat=True) if len(instances) <= REFRESH_ALL_ABOVE else None
+        if copy_ids is None:
+            search_index.refresh(using=using)
+            copy_collections.refresh(using=using)
+        else:
+            _refresh_copies(copy_ids, using)
+        versioning.bump_version('autocomplete-provenance', 'census')
+
+
+class ProvenanceRecordResource(BulkResource):
+    copy = fields.Field(attribute='copy', column_name='wc_number',
+                        widget=BulkForeignKeyWidget(Copy, 'wc_number'))
+    provenance_name = fields.Field(attribute='provenance_name', column_name='provenance_name',
+                                   widget=BulkForeignKeyWidget(ProvenanceName, 'name'))
+
+    class Meta:
+        model = ProvenanceRecord
+        import_id_fields = ('copy', 'provenance_name')
+        fields = ('copy', 'provenance_name')
+
+    def get_queryset(self):
+        return ProvenanceRecord.objects.select_related('copy', 'provenance_name')
+
+    def prime(self, dataset, using):
+        for name in ('copy', 'provenance_name'):
+            column = self.fields[name].column_name
+            if column in dataset.headers:
+                self.fields[name].widget.prime(dataset[column], using)
+
+    def refresh_derived(self, instances, using):
+        _refresh_copies([record.copy_id for record in instances], using)
+        owner_ids = {record.provenance_name_id for record in instances}
+        if len(owner_ids) > REFRESH_ALL_ABOVE:
+            provenance_graph.rebuild(using=using)
+        else:
+            provenance_graph.refresh_owners(owner_ids, using=using)
+        versioning.bump_version('census')
+
+
+# Resources offered by `manage.py import_census`, by name.
+RESOURCES = {
+    'copies': CopyResource,
+    'provenance-names': ProvenanceNameResource,
+    'provenance-records': ProvenanceRecordResource,
+}
@@ -0,0 +1,53 @@
+# wheatleycensus/row_cache.py
+# Cached HTML for the cells of copy table rows.
+#
+# The copy, search and all-copies tables render the same cells for a copy on every
+# page that lists it, each with several {% url %} reversals. render_rows() renders
+# a row template once per copy and keeps the result in the cache, keyed by the
+# copy's id and Copy.modified stamp, whether the viewer is staff (staff rows carry
+# an admin link) and a digest of the row template, so an edited template never
+# serves old markup. A page of rows is one get_many() and, for the misses, one
+# set_many().
+#
+# Saving a copy advances its modified stamp, and the signal handlers that push
+# title, issue and location changes down to copies (signals.py) advance it too,
+# so stale rows are simply never looked up again and expire on their own.
+#
+# Row templates see only `copy` and `is_staff`; anything that varies per page or
+# per position (row striping, search snippets) stays in the surrounding template.
+
+import hashlib
+
+from django.core.cache import cache
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
+
+from . import versioning
+
+# Rendered rows are keyed by content, so they only need to outlive their readers.
+ROW_TIMEOUT = versioning.CACHE_TIMEOUT
+
+
+def _digest(template):
+    return hashlib.sha256(template.template.source.encode()).hexdigest()[:12]
+
+
+def row_key(template_name, digest, copy, is_staff):
+    stamp = int(copy.modified.timestamp() * 1_000_000) if copy.modified else 0
+    return f'wheatleycensus:row:{template_name}:{digest}:{copy.pk}:{stamp}:{int(is_staff)}'
+
+
+def render_rows(copies, template_name, is_staff=False):
+    """[(copy, cells HTML)] for `copies`, rendering `template_name` only for cache misses."""
+    copies = list(copies)
+    template = get_template(template_name)
+    digest = _digest(template)
+    keys = [row_key(template_name, digest, copy, is_staff) for copy in copies]
+    rows = cache.get_many(keys)
+    missing = {}
+    for copy, key in zip(copies, keys):
+        if key not in rows:
+            rows[key] = missing[key] = template.render({'copy': copy, 'is_staff': is_staff})
+    if missing:
+        cache.set_many(missing, ROW_TIMEOUT)
+    return [(copy, mark_safe(rows[key])) for copy, key in zip(copies, keys)]
@@ -0,0 +1,234 @@
+# wheatleycensus/search_index.py
+# Full-text keyword index over the free-text fields of Copy and its provenance names.
+# On PostgreSQL the index is a tsvector column on the copy table with a GIN index;
+# on SQLite it is an FTS5 shadow table whose rowid is the copy id.
+# The index is kept current by the signal handlers in signals.py and can be
+# rebuilt from scratch with `python manage.py rebuild_search_index`.
+
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+# ------------------------------------------------------------------------------
+# Constants
+# ------------------------------------------------------------------------------
+COPY_TABLE = 'wheatleycensus_copy'
+FTS_TABLE = 'wheatleycensus_copy_fts'
+GIN_INDEX = 'wheatleycensus_copy_search_gin'
+TS_CONFIG = 'english'
+
+# Sentinels wrapped around matched terms by the database; swapped for <mark>
+# only after the surrounding text has been HTML-escaped.
+_HL_START = '\x02'
+_HL_STOP = '\x03'
+
+# Correlated subquery producing the space-separated provenance names of a copy.
+_PG_NAMES = (
+    "(SELECT string_agg(n.name, ' ') FROM wheatleycensus_provenancerecord r "
+    "JOIN wheatleycensus_provenancename n ON n.id = r.provenance_name_id "
+    "WHERE r.copy_id = c.id)"
+)
+_SQLITE_NAMES = (
+    "(SELECT group_concat(n.name, ' ') FROM wheatleycensus_provenancerecord r "
+    "JOIN wheatleycensus_provenancename n ON n.id = r.provenance_name_id "
+    "WHERE r.copy_id = c.id)"
+)
+
+# Column weights: marginalia and owner names rank above binding/provenance notes,
+# which rank above bibliography.
+_PG_DOCUMENT = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(c.marginalia, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce({_PG_NAMES}, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(c.binding, '')), 'B') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(c.prov_info, '')), 'B') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce(c.bibliography, '')), 'C')"
+)
+_SQLITE_BM25 = f"bm25({FTS_TABLE}, 4.0, 4.0, 2.0, 2.0, 1.0)"
+
+
+# ------------------------------------------------------------------------------
+# Backend detection
+# ------------------------------------------------------------------------------
+# SQLite databases known to carry the FTS5 table, keyed by (alias, database name).
+_fts_databases = set()
+
+
+def backend(using='default'):
+    """Return 'postgresql', 'sqlite' or None if the database has no keyword index."""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        key = (using, str(connection.settings_dict['NAME']))
+        if key in _fts_databases:
+            return 'sqlite'
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+            )
+            if cursor.fetchone():
+                _fts_databases.add(key)
+                return 'sqlite'
+    return None
+
+
+def _fts5_query(value):
+    """Turn free user input into a safe FTS5 query: every word is a quoted prefix term."""
+    tokens = re.findall(r'\w+', value or '')
+    return ' '.join('"{}"*'.format(t) for t in tokens)
+
+
+# ------------------------------------------------------------------------------
+# Schema (used by migrations)
+# ------------------------------------------------------------------------------
+def create_index(schema_editor):
+    """Create the keyword index structures for the current database."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f"ALTER TABLE {COPY_TABLE} ADD COLUMN search_vector tsvector")
+        schema_editor.execute(
+            f"CREATE INDEX {GIN_INDEX} ON {COPY_TABLE} USING gin (search_vector)"
+        )
+    elif vendor == 'sqlite':
+        with schema_editor.connection.cursor() as cursor:
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                    "marginalia, provenance_names, binding, prov_info, bibliography, "
+                    "tokenize = 'porter unicode61')"
+                )
+            except Exception:
+                # SQLite built without FTS5: keyword search falls back to icontains.
+                return
+
+
+def drop_index(schema_editor):
+    """Drop the keyword index structures for the current database."""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f"DROP INDEX IF EXISTS {GIN_INDEX}")
+        schema_editor.execute(f"ALTER TABLE {COPY_TABLE} DROP COLUMN IF EXISTS search_vector")
+    elif vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+# ------------------------------------------------------------------------------
+# Maintenance
+# ------------------------------------------------------------------------------
+def refresh(copy_ids=None, using='default'):
+    """Re-index the given copy ids, or every copy when copy_ids is None."""
+    kind = backend(using)
+    if kind is None:
+        return
+    if copy_ids is not None:
+        copy_ids = [int(pk) for pk in copy_ids]
+        if not copy_ids:
+            return
+    with connections[using].cursor() as cursor:
+        if kind == 'postgresql':
+            sql = f"UPDATE {COPY_TABLE} AS c SET search_vector = {_PG_DOCUMENT}"
+            if copy_ids is None:
+                cursor.execute(sql)
+            else:
+                cursor.execute(sql + " WHERE c.id = ANY(%s)", [copy_ids])
+            return
+
+        select = (
+            f"INSERT INTO {FTS_TABLE} "
+            "(rowid, marginalia, provenance_names, binding, prov_info, bibliography) "
+            "SELECT c.id, coalesce(c.marginalia, ''), "
+            f"coalesce({_SQLITE_NAMES}, ''), coalesce(c.binding, ''), "
+            "coalesce(c.prov_info, ''), coalesce(c.bibliography, '') "
+            f"FROM {COPY_TABLE} c"
+        )
+        if copy_ids is None:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(select)
+            return
+        # Stay well under SQLite's bound-parameter limit.
+        for i in range(0, len(copy_ids), 500):
+            chunk = copy_ids[i:i + 500]
+            marks = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", chunk)
+            cursor.execute(select + f" WHERE c.id IN ({marks})", chunk)
+
+
+def remove(copy_ids, using='default'):
+    """Drop deleted copies from the index (Postgres rows vanish with the copy itself)."""
+    if backend(using) != 'sqlite' or not copy_ids:
+        return
+    copy_ids = [int(pk) for pk in copy_ids]
+    marks = ', '.join(['%s'] * len(copy_ids))
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({marks})", copy_ids)
+
+
+# ------------------------------------------------------------------------------
+# Querying
+# ------------------------------------------------------------------------------
+def keyword_filter(queryset, value):
+    """
+    Restrict a Copy queryset to keyword matches, annotated with `search_rank`
+    (higher is better). Returns None when the database has no keyword index.
+    """
+    kind = backend(queryset.db)
+    if kind == 'postgresql':
+        tsquery = f"websearch_to_tsquery('{TS_CONFIG}', %s)"
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT id FROM {COPY_TABLE} WHERE search_vector @@ {tsquery}", [value])
+        ).annotate(search_rank=RawSQL(
+            f"ts_rank_cd({COPY_TABLE}.search_vector, {tsquery})", [value],
+            output_field=FloatField(),
+        ))
+    if kind == 'sqlite':
+        match = _fts5_query(value)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            pk__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).annotate(search_rank=RawSQL(
+            f"(SELECT -{_SQLITE_BM25} FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {COPY_TABLE}.id)",
+            [match], output_field=FloatField(),
+        ))
+    return None
+
+
+def _highlight(text):
+    """Escape a database-highlighted fragment and turn the sentinels into <mark> tags."""
+    return (escape(text)
+            .replace(_HL_START, '<mark>')
+            .replace(_HL_STOP, '</mark>'))
+
+
+def snippets(copy_ids, value, using='default'):
+    """Return {copy_id: highlighted HTML snippet} for the given ids (one query per page)."""
+    kind = backend(using)
+    copy_ids = [int(pk) for pk in copy_ids]
+    if kind is None or not copy_ids or not value:
+        return {}
+    with connections[using].cursor() as cursor:
+        if kind == 'postgresql':
+            options = f'StartSel={_HL_START}, StopSel={_HL_STOP}, MaxFragments=2, MaxWords=20, MinWords=5'
+            cursor.execute(
+                f"SELECT c.id, ts_headline('{TS_CONFIG}', "
+                f"concat_ws(' … ', c.marginalia, {_PG_NAMES}, c.binding, c.prov_info, c.bibliography), "
+                f"websearch_to_tsquery('{TS_CONFIG}', %s), %s) "
+                f"FROM {COPY_TABLE} c WHERE c.id = ANY(%s)",
+                [value, options, copy_ids],
+            )
+        else:
+            match = _fts5_query(value)
+            if not match:
+                return {}
+            marks = ', '.join(['%s'] * len(copy_ids))
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, -1, %s, %s, '…', 16) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN ({marks})",
+                [_HL_START, _HL_STOP, match] + copy_ids,
+            )
+        return {pk: _highlight(text) for pk, text in cursor.fetchall()
+                if text and _HL_START in text}
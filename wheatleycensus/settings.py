@@ -42,6 +42,8 @@ INSTALLED_APPS = [
 # Add, remove, or reorder middleware to change request/response handling.
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'wheatleycensus.middleware.StaticFilesMiddleware',  # collected, precompressed assets
+    'wheatleycensus.middleware.PerformanceMiddleware',  # Server-Timing + /metrics/
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -78,22 +80,98 @@ TEMPLATES = [
 WSGI_APPLICATION = 'wheatleycensus.wsgi.application'
 
 # --- Database Configuration ---
+# The database sits behind the Supabase pooler on a remote host, so opening a
+# connection (TCP + TLS + auth) costs far more than most queries. Connections are
+# therefore kept between requests (CONN_MAX_AGE) and checked before reuse
+# (CONN_HEALTH_CHECKS), and TCP keepalives notice a dropped link early.
+#
+# DATABASE_PORT=6543 selects the pooler's transaction mode, where consecutive
+# transactions may run on different server connections: server-side cursors are
+# then disabled (they do not survive the transaction). Prepared statements are
+# already off: psycopg2 never uses them and Django turns them off for psycopg 3.
+#
+# DATABASE_POOL_MAX_SIZE > 0 switches to an in-process psycopg connection pool
+# instead of one persistent connection per thread (needs psycopg[pool] >= 3;
+# Django does not allow CONN_MAX_AGE with a pool). Pool statistics are exported
+# on /metrics/; read-only views retry once on a dropped connection (see db.py).
+DATABASE_PORT = os.environ.get('DATABASE_PORT', '')
+DATABASE_POOL_MAX_SIZE = int(os.environ.get('DATABASE_POOL_MAX_SIZE', '0'))
+DATABASE_TRANSACTION_POOLING = os.environ.get(
+    'DATABASE_TRANSACTION_POOLING', 'true' if DATABASE_PORT == '6543' else ''
+).lower() in ('1', 'true', 'yes')
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres.cdombdokqaztauvilcnc',
-        'PASSWORD': 'Projectwheatley@2025',
-        'HOST': 'aws-0-us-east-2.pooler.supabase.com',
-        # 'PORT': '6543',
-        # 'CONN_MAX_AGE': 60,  # Keep connections alive for 60 seconds
-        # 'OPTIONS': {
-        #     'connect_timeout': 10,  # 10 seconds timeout for initial connection
-        #     'sslmode': 'require',  # Require SSL for database connection
-        # }
+        'NAME': os.environ.get('DATABASE_NAME', 'postgres'),
+        'USER': os.environ.get('DATABASE_USER', 'postgres.cdombdokqaztauvilcnc'),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', 'Projectwheatley@2025'),
+        'HOST': os.environ.get('DATABASE_HOST', 'aws-0-us-east-2.pooler.supabase.com'),
+        'PORT': DATABASE_PORT,
+        'CONN_MAX_AGE': 0 if DATABASE_POOL_MAX_SIZE else int(os.environ.get('DATABASE_CONN_MAX_AGE', '600')),
+        'CONN_HEALTH_CHECKS': True,
+        'DISABLE_SERVER_SIDE_CURSORS': DATABASE_TRANSACTION_POOLING,
+        'OPTIONS': {
+            'connect_timeout': int(os.environ.get('DATABASE_CONNECT_TIMEOUT', '10')),
+            'sslmode': os.environ.get('DATABASE_SSLMODE', 'require'),
+            'application_name': 'wheatleycensus',
+            'keepalives': 1,
+            'keepalives_idle': 30,
+            'keepalives_interval': 10,
+            'keepalives_count': 3,
+        },
+    }
+}
+if DATABASE_POOL_MAX_SIZE:
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DATABASE_POOL_MIN_SIZE', '1')),
+        'max_size': DATABASE_POOL_MAX_SIZE,
+        'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', '10')),
+        'max_idle': 300,
+    }
+
+# --- Read snapshot ---
+# With READ_SNAPSHOT_PATH set, public read-only pages read the census tables from
+# a local SQLite copy built by `python manage.py build_read_snapshot`, and fall back
+# to the primary once the copy is older than READ_SNAPSHOT_MAX_AGE seconds (so
+# rebuild it more often than that, e.g. from cron). The admin and all writes always
+# use the primary. See wheatleycensus/snapshot.py.
+READ_SNAPSHOT_PATH = os.environ.get('READ_SNAPSHOT_PATH', '')
+READ_SNAPSHOT_MAX_AGE = int(os.environ.get('READ_SNAPSHOT_MAX_AGE', '3600'))
+if READ_SNAPSHOT_PATH:
+    DATABASES['snapshot'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': READ_SNAPSHOT_PATH,
+        'CONN_MAX_AGE': None,
+        'OPTIONS': {
+            'init_command': 'PRAGMA query_only = ON; PRAGMA mmap_size = 268435456; '
+                            'PRAGMA temp_store = MEMORY;',
+        },
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['wheatleycensus.snapshot.ReadSnapshotRouter']
+
+# --- Cache ---
+# Holds versioned query results and, for a couple of seconds at a time, the data
+# versions themselves (see wheatleycensus/versioning.py). Versions are stored in
+# the database, so with per-process local memory and several gunicorn workers a
+# write reaches the other workers within versioning.VERSION_MAX_AGE; a shared
+# backend (Redis, memcached) makes that immediate and saves each worker from
+# computing the same results again.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'wheatleycensus',
+        # Room for one rendered table row per copy (row_cache.py) besides pages.
+        'OPTIONS': {'MAX_ENTRIES': 20000},
     }
 }
 
+# RESPONSE_CACHE_ENABLED keeps whole anonymous page responses in the cache, keyed
+# on the census data version (see wheatleycensus/http_cache.py). ETag/304 handling
+# is always on; this only adds the server-side copy.
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', '').lower() in ('1', 'true', 'yes')
+
 # --- Auto Field ---
 # DEFAULT_AUTO_FIELD sets the default type for primary keys.
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -123,9 +201,19 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
+# STATIC_MANIFEST (on by default when DEBUG is off) makes collectstatic write
+# content-hashed copies of every asset plus .gz/.br versions, and {% static %}
+# link to the hashed names; StaticFilesMiddleware then serves them from
+# STATIC_ROOT with immutable caching. See wheatleycensus/staticfiles.py.
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', '' if DEBUG else '1').lower() in ('1', 'true', 'yes')
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'wheatleycensus.staticfiles.CompressedManifestStaticFilesStorage'
+                    if STATIC_MANIFEST else 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
 # Production static files configuration
 # if not DEBUG:
-#     STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'
 #     # Security settings for production
 #     SECURE_SSL_REDIRECT = True
 #     SESSION_COOKIE_SECURE = True
@@ -0,0 +1,261 @@
+# wheatleycensus/signals.py
+# Model signal handlers that keep derived data (search index, caches) in step with edits.
+# Handlers are connected when the app registry is ready; see apps.py.
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import (autocomplete, copy_collections, images, provenance_graph, search_index, sorting,
+               versioning)
+from .models import (Copy, CopyCollection, Edition, Issue, Location, ProvenanceName,
+                     ProvenanceRecord, Title)
+
+# =====================
+# Keyword search index
+# =====================
+
+@receiver(post_save, sender=Copy)
+def index_copy(sender, instance, using, **kwargs):
+    search_index.refresh([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Copy)
+def unindex_copy(sender, instance, using, **kwargs):
+    search_index.remove([instance.pk], using=using)
+
+
+@receiver(post_save, sender=ProvenanceRecord)
+@receiver(post_delete, sender=ProvenanceRecord)
+def index_provenance_record(sender, instance, using, **kwargs):
+    search_index.refresh([instance.copy_id], using=using)
+
+
+@receiver(post_save, sender=ProvenanceName)
+def index_provenance_name(sender, instance, using, created, **kwargs):
+    if created:
+        return
+    copy_ids = ProvenanceRecord.objects.using(using).filter(
+        provenance_name=instance
+    ).values_list('copy_id', flat=True)
+    search_index.refresh(list(copy_ids), using=using)
+
+
+# =====================
+# Copy sort columns
+# =====================
+# Copy.save() derives its own sort columns; these handlers push changes made to
+# the related rows down to the copies that depend on them. They also advance
+# Copy.modified, which retires the copies' cached table rows (row_cache.py).
+
+@receiver(post_save, sender=Title)
+def resort_title_copies(sender, instance, using, created, **kwargs):
+    if created:
+        return
+    Copy.objects.using(using).filter(issue__edition__title=instance).update(
+        sort_title=sorting.title_key(instance.title), modified=timezone.now())
+
+
+@receiver(post_save, sender=Edition)
+def resort_edition_copies(sender, instance, using, created, **kwargs):
+    if created:
+        return
+    Copy.objects.using(using).filter(issue__edition=instance).update(
+        sort_title=sorting.title_key(instance.title.title), modified=timezone.now())
+
+
+@receiver(post_save, sender=Issue)
+def resort_issue_copies(sender, instance, using, created, **kwargs):
+    if created:
+        return
+    Copy.objects.using(using).filter(issue=instance).update(
+        sort_year=sorting.issue_year(instance),
+        sort_title=sorting.title_key(instance.edition.title.title),
+        modified=timezone.now())
+
+
+@receiver(post_save, sender=Location)
+def resort_location_copies(sender, instance, using, created, **kwargs):
+    if created:
+        return
+    Copy.objects.using(using).filter(location=instance).update(
+        sort_location=sorting.location_key(instance.name_of_library_collection),
+        modified=timezone.now())
+
+
+@receiver(post_delete, sender=Location)
+def resort_orphaned_copies(sender, instance, using, **kwargs):
+    # Deleting a location sets Copy.location to NULL without calling Copy.save().
+    Copy.objects.using(using).filter(location__isnull=True).exclude(sort_location='').update(
+        sort_location='', modified=timezone.now())
+
+
+# =====================
+# Title issue summary (homepage)
+# =====================
+# Title.earliest_year / Title.first_issue follow the title's editions and issues.
+# pre_save remembers which title a row belonged to, so moving an edition or issue
+# to another title refreshes both.
+
+def _refresh_titles(title_ids, using):
+    for title in Title.objects.using(using).filter(pk__in={t for t in title_ids if t}):
+        title.refresh_issue_summary(using=using)
+    versioning.bump_version('titles')
+
+
+@receiver(pre_save, sender=Edition)
+def remember_edition_title(sender, instance, using, **kwargs):
+    instance._previous_title_id = (
+        Edition.objects.using(using).filter(pk=instance.pk).values_list('title_id', flat=True).first()
+        if instance.pk else None)
+
+
+@receiver(pre_save, sender=Issue)
+def remember_issue_title(sender, instance, using, **kwargs):
+    instance._previous_title_id = (
+        Issue.objects.using(using).filter(pk=instance.pk).values_list('edition__title_id', flat=True).first()
+        if instance.pk else None)
+
+
+@receiver(post_save, sender=Edition)
+def summarize_edition_titles(sender, instance, using, **kwargs):
+    _refresh_titles([instance.title_id, getattr(instance, '_previous_title_id', None)], using)
+
+
+@receiver(post_save, sender=Issue)
+def summarize_issue_titles(sender, instance, using, **kwargs):
+    title_id = Edition.objects.using(using).filter(pk=instance.edition_id).values_list(
+        'title_id', flat=True).first()
+    _refresh_titles([title_id, getattr(instance, '_previous_title_id', None)], using)
+
+
+@receiver(post_delete, sender=Edition)
+def summarize_deleted_edition_title(sender, instance, using, **kwargs):
+    _refresh_titles([instance.title_id], using)
+
+
+@receiver(post_delete, sender=Issue)
+def summarize_deleted_issue_title(sender, instance, using, **kwargs):
+    title_id = Edition.objects.using(using).filter(pk=instance.edition_id).values_list(
+        'title_id', flat=True).first()
+    _refresh_titles([title_id], using)
+
+
+@receiver(post_save, sender=Title)
+def make_title_icons(sender, instance, using, **kwargs):
+    # Before title_changed below, so the bumped version covers the new icons.
+    try:
+        images.refresh_title(instance, using=using)
+    except OSError:
+        pass  # image file missing or unreadable: keep the original; build_title_icons reports it
+
+
+@receiver(post_save, sender=Title)
+@receiver(post_delete, sender=Title)
+def title_changed(sender, **kwargs):
+    versioning.bump_version('titles')
+
+
+# =====================
+# Copy statistics
+# =====================
+
+@receiver(post_save, sender=Copy)
+@receiver(post_delete, sender=Copy)
+def copies_changed(sender, **kwargs):
+    versioning.bump_version('copies')
+
+
+# =====================
+# Autocomplete indexes
+# =====================
+
+@receiver(post_save, sender=Location)
+def suggest_location(sender, instance, **kwargs):
+    autocomplete.locations.update(instance.pk, instance.name_of_library_collection)
+
+
+@receiver(post_delete, sender=Location)
+def unsuggest_location(sender, instance, **kwargs):
+    autocomplete.locations.remove(instance.pk)
+
+
+@receiver(post_save, sender=ProvenanceName)
+def suggest_provenance_name(sender, instance, **kwargs):
+    autocomplete.provenance_names.update(instance.pk, instance.name)
+
+
+@receiver(post_delete, sender=ProvenanceName)
+def unsuggest_provenance_name(sender, instance, **kwargs):
+    autocomplete.provenance_names.remove(instance.pk)
+
+
+# =====================
+# Collection membership (see copy_collections.py)
+# =====================
+
+@receiver(post_save, sender=Copy)
+def collect_copy(sender, instance, using, **kwargs):
+    copy_collections.refresh([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Copy)
+def uncollect_copy(sender, instance, using, **kwargs):
+    # Provenance records deleted in the same cascade may have re-added memberships.
+    CopyCollection.objects.using(using).filter(copy_id=instance.pk).delete()
+
+
+@receiver(post_save, sender=ProvenanceRecord)
+@receiver(post_delete, sender=ProvenanceRecord)
+def collect_provenance_record(sender, instance, using, **kwargs):
+    copy_collections.refresh([instance.copy_id], using=using)
+
+
+@receiver(post_save, sender=ProvenanceName)
+def collect_provenance_name(sender, instance, using, created, **kwargs):
+    if created:
+        return
+    copy_ids = ProvenanceRecord.objects.using(using).filter(
+        provenance_name=instance
+    ).values_list('copy_id', flat=True)
+    copy_collections.refresh(list(copy_ids), using=using)
+
+
+@receiver(post_save, sender=CopyCollection)
+@receiver(post_delete, sender=CopyCollection)
+def collection_changed(sender, **kwargs):
+    versioning.bump_version('collections')
+
+
+# =====================
+# Provenance network (see provenance_graph.py)
+# =====================
+
+@receiver(pre_save, sender=ProvenanceRecord)
+def remember_provenance_owner(sender, instance, using, **kwargs):
+    instance._previous_owner_id = (
+        ProvenanceRecord.objects.using(using).filter(pk=instance.pk).values_list(
+            'provenance_name_id', flat=True).first()
+        if instance.pk else None)
+
+
+@receiver(post_save, sender=ProvenanceRecord)
+def link_provenance_owner(sender, instance, using, **kwargs):
+    provenance_graph.refresh_owners(
+        [instance.provenance_name_id, getattr(instance, '_previous_owner_id', None)], using=using)
+
+
+@receiver(post_delete, sender=ProvenanceRecord)
+def unlink_provenance_owner(sender, instance, using, **kwargs):
+    provenance_graph.refresh_owners([instance.provenance_name_id], using=using)
+
+
+# =====================
+# Census data version (HTTP caching, see http_cache.py)
+# =====================
+
+@receiver(post_save)
+@receiver(post_delete)
+def census_changed(sender, **kwargs):
+    if sender._meta.app_label == 'wheatleycensus':
+        versioning.bump_version('census')
@@ -0,0 +1,256 @@
+# wheatleycensus/snapshot.py
+# Local read snapshot: a SQLite copy of the census tables that public pages read
+# instead of the remote primary database.
+#
+# `python manage.py build_read_snapshot` copies every census table (and the
+# keyword index) into a new SQLite file next to the live one, indexes and analyzes
+# it, then renames it over the live file in one step, so readers only ever see a
+# complete snapshot. Connections opened on the old file are closed at the start of
+# the next public request that notices the new one.
+#
+# ReadSnapshotRouter sends reads of census models to the 'snapshot' database only
+# inside `reading()` (entered by census_cached, i.e. by public read-only views) and
+# only while the snapshot is younger than READ_SNAPSHOT_MAX_AGE. Everything else
+# (the admin, management commands, every write) uses the primary. Public pages can
+# thus lag curators' edits by at most READ_SNAPSHOT_MAX_AGE; rebuild the snapshot
+# more often than that. While reading the snapshot, its build time replaces the
+# data versions in cache keys and page ETags, so a public page never waits on the
+# primary, and results cached from the previous build are re-rendered in every
+# worker once a new one is swapped in.
+
+import contextvars
+import os
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.utils import load_backend
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from . import search_index, versioning
+
+SNAPSHOT_ALIAS = 'snapshot'
+BUILD_ALIAS = 'snapshot-build'
+META_TABLE = 'wheatleycensus_snapshot'
+BATCH_SIZE = 2000
+# Data versions that hold results computed from census tables.
+VERSIONS = ('titles', 'copies', 'census', 'collections')
+
+# Whether the current request may read from the snapshot.
+_reading = contextvars.ContextVar('wheatleycensus_snapshot_reading', default=False)
+
+
+def path():
+    """The snapshot file, or None when no 'snapshot' database is configured."""
+    database = settings.DATABASES.get(SNAPSHOT_ALIAS)
+    return str(database['NAME']) if database else None
+
+
+# ------------------------------------------------------------------------------
+# Building
+# ------------------------------------------------------------------------------
+def _snapshot_models():
+    """Models copied into the snapshot, parents before children."""
+    # Data versions stay on the primary (see versioning.py).
+    census = [model for model in apps.get_app_config('wheatleycensus').get_models()
+              if model._meta.model_name != 'dataversion']
+    # Copy.created_by is shown on the copy page; users are copied without passwords.
+    return [get_user_model()] + census
+
+
+def _open_build_connection(target):
+    # configure_settings() fills in the defaults; it insists on a 'default' key.
+    database = connections.configure_settings({DEFAULT_DB_ALIAS: {
+        'ENGINE': 'django.db.backends.sqlite3', 'NAME': target,
+    }})[DEFAULT_DB_ALIAS]
+    # Registered for this thread only, so that connections[BUILD_ALIAS] works in
+    # helpers that take an alias (search_index.refresh).
+    connection = load_backend(database['ENGINE']).DatabaseWrapper(database, BUILD_ALIAS)
+    connections[BUILD_ALIAS] = connection
+    return connection
+
+
+def _close_build_connection(connection):
+    connection.close()
+    del connections[BUILD_ALIAS]
+
+
+def _copy_table(model, source, target):
+    fields = model._meta.concrete_fields
+    columns = ', '.join(target.ops.quote_name(f.column) for f in fields)
+    marks = ', '.join(['%s'] * len(fields))
+    sql = f"INSERT INTO {target.ops.quote_name(model._meta.db_table)} ({columns}) VALUES ({marks})"
+    rows = model._base_manager.using(source).order_by('pk').values_list(*[f.attname for f in fields])
+    # Password hashes stay on the primary; '!' is Django's unusable password.
+    blank = {'password'} if model is get_user_model() else set()
+    total, batch = 0, []
+    with target.cursor() as cursor:
+        for row in rows.iterator(chunk_size=BATCH_SIZE):
+            batch.append([f.get_db_prep_save('!' if f.name in blank else value, target)
+                          for f, value in zip(fields, row)])
+            if len(batch) == BATCH_SIZE:
+                cursor.executemany(sql, batch)
+                total, batch = total + len(batch), []
+        if batch:
+            cursor.executemany(sql, batch)
+    return total + len(batch)
+
+
+def build(target=None, using=DEFAULT_DB_ALIAS):
+    """
+    Copy the census tables of `using` into a fresh SQLite file and move it to
+    `target` (the configured snapshot by default). Return {table: rows}.
+    """
+    target = target or path()
+    if not target:
+        raise ValueError("No snapshot path: set READ_SNAPSHOT_PATH.")
+    temporary = f'{target}.{os.getpid()}.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    built_at = time.time()
+
+    connection = _open_build_connection(temporary)
+    counts = {}
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode = OFF")
+            cursor.execute("PRAGMA synchronous = OFF")
+            cursor.execute("PRAGMA foreign_keys = OFF")
+        with connection.schema_editor() as editor:
+            for model in _snapshot_models():
+                editor.create_model(model)
+            search_index.create_index(editor)
+        source = connections[using]
+        # One consistent view of every table while they are read.
+        with transaction.atomic(using=using), transaction.atomic(using=BUILD_ALIAS):
+            if source.vendor == 'postgresql':
+                with source.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+            for model in _snapshot_models():
+                counts[model._meta.db_table] = _copy_table(model, using, connection)
+            search_index.refresh(using=BUILD_ALIAS)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {META_TABLE} (built_at REAL NOT NULL, source TEXT NOT NULL)")
+            cursor.execute(f"INSERT INTO {META_TABLE} VALUES (%s, %s)", [built_at, using])
+            cursor.execute("ANALYZE")
+            cursor.execute("PRAGMA journal_mode = DELETE")
+        connection.close()
+        with closing(sqlite3.connect(temporary)) as raw:
+            raw.execute("VACUUM")
+        os.replace(temporary, target)
+    finally:
+        _close_build_connection(connection)
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    versioning.bump_version(*VERSIONS)
+    return counts
+
+
+# ------------------------------------------------------------------------------
+# Freshness
+# ------------------------------------------------------------------------------
+class SnapshotState:
+    """Build time of the snapshot file, re-read whenever the file is replaced."""
+
+    def __init__(self):
+        self._file = None  # (inode, mtime) the build time below belongs to
+        self.built_at = None
+
+    def current(self):
+        """Return the snapshot file's inode if it is present and fresh enough, else None."""
+        name = path()
+        if not name:
+            return None
+        try:
+            stat = os.stat(name)
+        except OSError:
+            return None
+        file = (stat.st_ino, stat.st_mtime_ns)
+        if file != self._file:
+            try:
+                with closing(sqlite3.connect(f'file:{name}?mode=ro', uri=True)) as raw:
+                    built_at = raw.execute(f"SELECT built_at FROM {META_TABLE}").fetchone()[0]
+            except (sqlite3.Error, TypeError):
+                return None
+            self._file, self.built_at = file, built_at
+        if time.time() - self.built_at > getattr(settings, 'READ_SNAPSHOT_MAX_AGE', 3600):
+            return None
+        return stat.st_ino
+
+
+state = SnapshotState()
+
+
+@receiver(connection_created)
+def remember_snapshot_file(sender, connection, **kwargs):
+    if connection.alias == SNAPSHOT_ALIAS:
+        try:
+            connection.snapshot_inode = os.stat(path()).st_ino
+        except OSError:
+            connection.snapshot_inode = None
+
+
+@contextmanager
+def reading():
+    """Let census reads in this block go to the snapshot, if it is fresh."""
+    inode = state.current()
+    if inode is not None:
+        connection = connections[SNAPSHOT_ALIAS]
+        if connection.connection is not None and getattr(connection, 'snapshot_inode', None) != inode:
+            connection.close()  # opened on a file that has since been replaced
+    # Cached results and ETags are keyed on the build being read (see versioning.py).
+    built_at = state.built_at if inode is not None else None
+    build = versioning.set_snapshot_build(int(built_at * 1e6) if built_at is not None else None)
+    token = _reading.set(inode is not None)
+    try:
+        yield
+    finally:
+        versioning.reset_snapshot_build(build)
+        _reading.reset(token)
+
+
+def reads_snapshot(view):
+    """Decorate a read-only view to read census data from the snapshot."""
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(request, *args, **kwargs)
+        with reading():
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+# ------------------------------------------------------------------------------
+# Router
+# ------------------------------------------------------------------------------
+class ReadSnapshotRouter:
+    """Route public census reads to the snapshot; everything else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _reading.get() and model._meta.app_label == 'wheatleycensus':
+            return SNAPSHOT_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == SNAPSHOT_ALIAS:
+            return DEFAULT_DB_ALIAS  # never write back into the snapshot
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, SNAPSHOT_ALIAS}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in (SNAPSHOT_ALIAS, BUILD_ALIAS):
+            return False
+        return None
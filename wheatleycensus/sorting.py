@@ -0,0 +1,53 @@
+# wheatleycensus/sorting.py
+# Normalizers for the sort columns persisted on Copy (sort_year, sort_title, sort_location, sort_wc_number).
+# Listing views order by these columns in the database instead of sorting querysets in Python.
+
+import re
+
+# Year used for copies whose issue has no parseable year, so they sort last.
+MISSING_YEAR = 9999
+
+
+def strip_article(s):
+    """Remove leading articles from a string."""
+    articles = ['a ', 'A ', 'an ', 'An ', 'the ', 'The ']
+    for a in articles:
+        if s.startswith(a):
+            return s.replace(a, '', 1)
+    return s
+
+
+def title_key(title):
+    """Sort value for a title: numeric prefixes moved to the end, leading article dropped."""
+    title = title or ''
+    if title and title[0].isdigit():
+        words = title.split()
+        title = ' '.join(words[1:] + [words[0]])
+    return strip_article(title).lower()
+
+
+def location_key(name):
+    """Sort value for a location name: leading article dropped, lowercased."""
+    return strip_article(name or '').lower()
+
+
+def issue_year(issue):
+    """Sort year for an issue: its start_date, else the first 4-digit year in `year`."""
+    if issue is None:
+        return MISSING_YEAR
+    if issue.start_date:
+        return int(issue.start_date)
+    match = re.match(r'\s*(\d{4})', issue.year or '')
+    return int(match.group(1)) if match else MISSING_YEAR
+
+
+def wc_number_key(wc_number):
+    """
+    Sort value for a WC number such as '12' or '12.3': zero-padded so string order
+    matches numeric order. Non-numeric values sort after every numeric one.
+    """
+    wc_number = (wc_number or '').strip()
+    major, _, minor = wc_number.partition('.')
+    if major.isdigit() and (not minor or minor.isdigit()):
+        return '{:010d}.{:010d}'.format(int(major), int(minor or 0))
+    return '~' + wc_number.lower()
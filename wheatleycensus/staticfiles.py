@@ -0,0 +1,136 @@
+# wheatleycensus/staticfiles.py
+# Static files: content-hashed names plus gzip/brotli copies written once by
+# collectstatic, and a lookup used by StaticFilesMiddleware (middleware.py) to
+# serve them.
+#
+# CompressedManifestStaticFilesStorage is Django's ManifestStaticFilesStorage
+# (style.css -> style.3f2a9c1b7e4d.css, references inside CSS rewritten) that also
+# writes <name>.gz and, when the optional `brotli` package is installed, <name>.br
+# next to every text asset, keeping a copy only when it is meaningfully smaller.
+# Hashed names change whenever the content does, so they are served with a
+# one-year immutable Cache-Control header; workers then only ever send each asset
+# once per browser, and compressed.
+
+import gzip
+import mimetypes
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.html', '.xml', '.ico',
+                '.ttf', '.otf', '.eot')
+# Smaller files gain too little to be worth a second request path.
+MIN_SIZE = 256
+# Keep a compressed copy only if it is at most this fraction of the original.
+MAX_RATIO = 0.95
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+# (Content-Encoding, file suffix), in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compress(path):
+    """Write path.gz (and path.br with brotli installed); return the suffixes written."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < MIN_SIZE:
+        return []
+    variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    brotli = _brotli()
+    if brotli is not None:
+        variants['.br'] = brotli.compress(data, quality=11)
+    written = []
+    for suffix, content in variants.items():
+        if len(content) <= len(data) * MAX_RATIO:
+            with open(path + suffix, 'wb') as f:
+                f.write(content)
+            written.append(suffix)
+        elif os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # A template naming a file that was never collected falls back to the
+    # unhashed URL instead of failing the page.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if not dry_run and not isinstance(processed, Exception):
+                for candidate in {name, hashed_name} - {None}:
+                    if candidate.lower().endswith(COMPRESSIBLE) and self.exists(candidate):
+                        compress(self.path(candidate))
+            yield name, hashed_name, processed
+
+
+# ------------------------------------------------------------------------------
+# Lookup for serving
+# ------------------------------------------------------------------------------
+class StaticFile:
+    """A collected file, its precompressed variants and its response headers."""
+
+    def __init__(self, path, immutable):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.cache_control = IMMUTABLE if immutable else REVALIDATE
+        self.encodings = {encoding: path + suffix for encoding, suffix in ENCODINGS
+                          if os.path.exists(path + suffix)}
+
+    def choose(self, accept_encoding):
+        """(path, Content-Encoding or None) to send for an Accept-Encoding header."""
+        accepted = {part.split(';')[0].strip().lower() for part in accept_encoding.split(',')}
+        for encoding, _ in ENCODINGS:
+            if encoding in accepted and encoding in self.encodings:
+                return self.encodings[encoding], encoding
+        return self.path, None
+
+
+class CollectedFiles:
+    """Collected static files by relative name, loaded from STATIC_ROOT on first use."""
+
+    def __init__(self):
+        self._files = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        root = settings.STATIC_ROOT
+        if not root or not os.path.isdir(root):
+            return {}
+        storage = CompressedManifestStaticFilesStorage(location=root)
+        hashed = set(storage.hashed_files.values())
+        suffixes = tuple(suffix for _, suffix in ENCODINGS)
+        files = {}
+        for directory, _, names in os.walk(root):
+            for filename in names:
+                if filename.endswith(suffixes):
+                    continue
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                files[name] = StaticFile(path, immutable=name in hashed)
+        return files
+
+    def get(self, name):
+        with self._lock:
+            if self._files is None:
+                self._files = self._load()
+        return self._files.get(name)
+
+    def reset(self):
+        with self._lock:
+            self._files = None
+
+
+collected = CollectedFiles()
@@ -0,0 +1,30 @@
+# wheatleycensus/stats.py
+# Census-wide copy statistics shown on the about/static pages.
+# All counts come from one conditional-aggregation query over Copy, cached under
+# the 'copies' data version (bumped by signals.py on every Copy write).
+
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from . import versioning
+from .models import Copy
+
+facsimile_query = ~Q(digital_facsimile_url=None) & ~Q(digital_facsimile_url='')
+
+
+def _compute():
+    return Copy.objects.aggregate(
+        copy_count=Count('pk', filter=Q(verification__in=('U', 'V'), fragment=False)),
+        fragment_copy_count=Count('pk', filter=Q(fragment=True)),
+        facsimile_copy_count=Count('pk', filter=facsimile_query),
+        verified_copy_count=Count('pk', filter=Q(verification='V')),
+        unverified_copy_count=Count('pk', filter=Q(verification='U')),
+        estc_copy_count=Count('pk', filter=Q(from_estc=True)),
+        non_estc_copy_count=Count('pk', filter=Q(from_estc=False)),
+    )
+
+
+def census_statistics():
+    """Return the census copy counts as a dict, recomputed only after Copy writes."""
+    return cache.get_or_set(
+        versioning.versioned_key('copies', 'statistics'), _compute, versioning.CACHE_TIMEOUT)
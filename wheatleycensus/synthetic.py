@@ -0,0 +1,171 @@
+# wheatleycensus/synthetic.py
+# Synthetic census data for benchmarks and load testing.
+# generate() fills an empty database with titles, editions, issues, locations,
+# provenance names, copies and provenance records whose counts, field fill rates
+# and text lengths resemble the real census. Output is deterministic for a seed.
+#
+# Rows are written with bulk_create, which skips model signals, so everything the
+# signals would maintain (sort keys, title summaries, search index, collections,
+# cache versions) is brought up to date explicitly at the end.
+
+import random
+
+from django.db import transaction
+
+from . import copy_collections, provenance_graph, search_index, versioning
+from .models import Copy, Edition, Issue, Location, ProvenanceName, ProvenanceRecord, Title
+
+# Default scale (multiplied by the `scale` argument of generate()).
+DEFAULTS = {
+    'titles': 20,
+    'editions_per_title': 3,
+    'issues_per_edition': 2,
+    'locations': 400,
+    'provenance_names': 3000,
+    'copies': 5000,
+    'records_per_copy': 1.5,
+}
+BATCH_SIZE = 1000
+
+WORDS = (
+    'poems various subjects religious moral boston london printed sold bell aldgate '
+    'cox berry king street negro servant mr john wheatley phillis engraved frontispiece '
+    'leaf inscribed ink pencil owner signature bookplate armorial gilt calf boards rebacked '
+    'marbled endpapers spine label lacking title page stained foxed trimmed bound with '
+    'sermon hymn elegy whitefield countess huntingdon dedication volume copy library gift '
+    'presented family bible annotation reader notes margin underlined verses manuscript'
+).split()
+FIRST_NAMES = ('Mary John Sarah William Elizabeth Thomas Ann James Hannah Samuel Abigail '
+               'Joseph Phillis Susanna Benjamin Lucy Richard Margaret George Prince').split()
+LAST_NAMES = ('Adams Brown Clark Davis Eliot Franklin Green Hancock Irving Jones Lathrop '
+              'Mather Otis Peters Quincy Russell Sewall Thornton Warren Young Occom').split()
+LIBRARY_KINDS = ('Library', 'Public Library', 'Athenaeum', 'Historical Society',
+                 'University Library', 'College Library', 'Antiquarian Society')
+REGIONS = [code for code, _ in Location.LOCATION_CHOICES]
+FORMATS = ('4to', '8vo', '12mo', 'folio')
+CENTURIES = [code for code, _ in ProvenanceName.CENTURY_CHOICES]
+GENDERS = (ProvenanceName.FEMALE, ProvenanceName.MALE, ProvenanceName.UNKNOWN,
+           ProvenanceName.NOT_APPLICABLE)
+
+
+class _Text:
+    """Random prose of a given length built from census-like vocabulary."""
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def words(self, low, high):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(self.rng.randint(low, high)))
+
+    def sentences(self, low, high):
+        text = self.words(low, high)
+        return text[:1].upper() + text[1:] + '.' if text else ''
+
+    def maybe(self, probability, low, high):
+        return self.sentences(low, high) if self.rng.random() < probability else None
+
+
+def _scaled(options, scale):
+    counts = dict(DEFAULTS)
+    for key in ('titles', 'locations', 'provenance_names', 'copies'):
+        counts[key] = max(1, int(counts[key] * scale))
+    counts.update((k, v) for k, v in options.items() if v is not None)
+    return counts
+
+
+def generate(scale=1.0, seed=0, using='default', batch_size=BATCH_SIZE, **options):
+    """
+    Populate `using` with a synthetic census and return the number of rows written
+    per model. Counts default to DEFAULTS times `scale`; pass e.g. copies=20000
+    to set one directly.
+    """
+    counts = _scaled(options, scale)
+    rng = random.Random(seed)
+    text = _Text(rng)
+    created = {}
+
+    with transaction.atomic(using=using):
+        titles = Title.objects.using(using).bulk_create(
+            [Title(title=f"{text.words(2, 5).title()} {n + 1}"[:128]) for n in range(counts['titles'])],
+            batch_size=batch_size)
+        editions = Edition.objects.using(using).bulk_create(
+            [Edition(title=t, edition_number=str(n + 1), edition_format=rng.choice(FORMATS),
+                     notes=text.maybe(0.3, 5, 30) or '')
+             for t in titles for n in range(counts['editions_per_title'])],
+            batch_size=batch_size)
+        issues = []
+        for edition in editions:
+            for _ in range(counts['issues_per_edition']):
+                start = rng.randint(1773, 1900)
+                end = start + (rng.randint(1, 3) if rng.random() < 0.1 else 0)
+                issues.append(Issue(
+                    edition=edition, start_date=start, end_date=end,
+                    year=str(start) if start == end else f'{start}-{end}',
+                    notes=text.maybe(0.2, 5, 25),
+                    bibliographic_data=text.maybe(0.5, 10, 40)))
+        issues = Issue.objects.using(using).bulk_create(issues, batch_size=batch_size)
+
+        locations = Location.objects.using(using).bulk_create(
+            [Location(name_of_library_collection=f"{rng.choice(LAST_NAMES)} {rng.choice(LIBRARY_KINDS)} {n + 1}",
+                      us_state_or_non_us_nation=rng.choice(REGIONS),
+                      latitude=round(rng.uniform(25.0, 55.0), 6),
+                      longitude=round(rng.uniform(-125.0, 5.0), 6))
+             for n in range(counts['locations'])],
+            batch_size=batch_size)
+        names = []
+        for _ in range(counts['provenance_names']):
+            start = rng.choice(CENTURIES)
+            names.append(ProvenanceName(
+                name=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                bio=text.maybe(0.3, 10, 60),
+                viaf=str(rng.randint(10 ** 6, 10 ** 9)) if rng.random() < 0.2 else None,
+                start_century=start,
+                end_century=rng.choice([c for c in CENTURIES if c >= start]),
+                gender=rng.choice(GENDERS)))
+        names = ProvenanceName.objects.using(using).bulk_create(names, batch_size=batch_size)
+
+        copies = []
+        for n in range(counts['copies']):
+            copy = Copy(
+                wc_number=str(n + 1) if rng.random() < 0.95 else f'{n + 1}.{rng.randint(1, 3)}',
+                verification=rng.choices('VUF', weights=(70, 25, 5))[0],
+                signed_by_author=rng.random() < 0.05,
+                issue=rng.choice(issues),
+                location=rng.choice(locations) if rng.random() < 0.97 else None,
+                shelfmark=f'{rng.choice("ABCDEFG")}{rng.randint(1, 999)}.{rng.randint(1, 99)}',
+                catalogue_url=f'https://catalogue.example.org/record/{n + 1}' if rng.random() < 0.6 else None,
+                fragment=rng.random() < 0.05,
+                from_estc=rng.random() < 0.3,
+                digital_facsimile_url=f'https://facsimile.example.org/{n + 1}' if rng.random() < 0.4 else None,
+                binding=text.maybe(0.8, 5, 40),
+                marginalia=text.maybe(0.3, 10, 80),
+                prov_info=text.maybe(0.7, 10, 120),
+                bibliography=text.maybe(0.4, 5, 40),
+                height=round(rng.uniform(15.0, 25.0), 1),
+                width=round(rng.uniform(10.0, 18.0), 1),
+            )
+            copy.update_sort_keys()
+            copies.append(copy)
+        copies = Copy.objects.using(using).bulk_create(copies, batch_size=batch_size)
+
+        records = []
+        for copy in copies:
+            n = int(counts['records_per_copy']) + (rng.random() < counts['records_per_copy'] % 1)
+            for name in rng.sample(names, min(n, len(names))):
+                records.append(ProvenanceRecord(copy=copy, provenance_name=name))
+        records = ProvenanceRecord.objects.using(using).bulk_create(records, batch_size=batch_size)
+
+        for title in titles:
+            title.refresh_issue_summary(using=using)
+        search_index.refresh(using=using)
+        copy_collections.refresh(using=using)
+        provenance_graph.rebuild(using=using)
+
+    versioning.bump_version('titles', 'copies', 'census',
+                            'autocomplete-location', 'autocomplete-provenance')
+    created.update({
+        'titles': len(titles), 'editions': len(editions), 'issues': len(issues),
+        'locations': len(locations), 'provenance_names': len(names),
+        'copies': len(copies), 'provenance_records': len(records),
+    })
+    return created
@@ -0,0 +1,27 @@
+# wheatleycensus/templatetags/census_images.py
+# {% title_icon title %}: a title's icon as a <picture> of its display-size
+# derivatives (see images.py), with explicit dimensions so the grid does not
+# reflow while icons load. Falls back to the original upload when no derivatives
+# have been made yet.
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from wheatleycensus import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def title_icon(title, css_class='play-title-icon'):
+    size = images.ICON_SIZE
+    srcsets = images.srcsets(title) if images.is_current(title) else {}
+    if not srcsets:
+        return format_html('<img class="{}" src="{}" alt="{}" width="{}" height="{}">',
+                           css_class, title.image.url, title.title, size, size)
+    *preferred, (fallback, fallback_srcset) = srcsets.items()
+    sources = format_html_join('', '<source type="image/{}" srcset="{}">', preferred)
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" alt="{}" width="{}" height="{}" '
+        'loading="lazy" decoding="async"></picture>',
+        sources, css_class, fallback_srcset.split(' ', 1)[0], fallback_srcset, title.title, size, size)
@@ -0,0 +1,16 @@
+# wheatleycensus/templatetags/census_rows.py
+# {% copy_rows copies "census/<row>.html" as rows %}: pairs of (copy, cells HTML)
+# for a page of copies, served from the row cache where possible (see row_cache.py).
+# The caller writes the <tr> itself, so striping and per-page extras stay live.
+
+from django import template
+
+from wheatleycensus import row_cache
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def copy_rows(context, copies, template_name):
+    user = context.get('user')
+    return row_cache.render_rows(copies, template_name, is_staff=bool(user and user.is_staff))
@@ -2,30 +2,53 @@
 # Contains unit tests for the Wheatley Census app.
 # Includes setup for test data and test cases for search and filtering functionality.
 
-from django.test import TestCase
+import gzip
+import json
+import os
+import sqlite3
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from .models import Copy, Location, ProvenanceName, Title, Edition, Issue
+from PIL import Image
+from .models import (CoOwnership, Copy, CopyCollection, DataVersion, Location, ProvenanceName, ProvenanceRecord,
+                     Title, Edition, Issue, StaticPageText)
+from .pagination import EstimatedCountPaginator, KeysetPaginator
+from . import (autocomplete, db, dump, facets, geo, http_cache, metrics, provenance_graph, resources, row_cache,
+               snapshot, staticfiles, synthetic, timeline, versioning)
+
+def clear_caches():
+    """Empty the cache, then read the data versions back into it, as a warm worker has them."""
+    cache.clear()
+    versioning.get_version('census')
+
 
 class SearchViewTests(TestCase):
     @classmethod
     def setUpTestData(cls):
-        # 1) Create a title (this is the missing step)
-        title = Title.objects.create(title="Test Play", author="Tester")
+        # 1) Create a title
+        title = Title.objects.create(title="Test Play")
 
         # 2) Create an edition pointing at that Title
-        ed = Edition.objects.create(
-            title=title,
-            edition_number="1",        # or whatever your field is
-            author="Tester"            # if you have an author field here
-        )
+        ed = Edition.objects.create(title=title, edition_number="1")
 
         # 3) Create an issue on that edition
         iss = Issue.objects.create(
             edition=ed,
-            year=1600,
+            year="1600",
             start_date=1600,
             end_date=1600,
-            stc_wing="Wing123"
         )
 
         # 4) Create a location
@@ -36,7 +59,8 @@ class SearchViewTests(TestCase):
             issue=iss,
             location=loc,
             wc_number="123.4",
-            verification='V'
+            verification='V',
+            marginalia="Test annotations in a contemporary hand"
         )
 
         # 6) Link a provenance record
@@ -72,8 +96,1198 @@ class SearchViewTests(TestCase):
             expected=1
         )
 
+    def test_gender_filter_matches_code_or_label_only(self):
+        other = Copy.objects.create(issue=Issue.objects.get(year="1600"), wc_number="123.5", verification='V')
+        other.provenance_records.create(provenance_name=ProvenanceName.objects.create(name="Jones", gender="M"))
+        for value, expected in (("F", ["123.4"]), ("female", ["123.4"]), ("male", ["123.5"]), ("Fem", [])):
+            resp = self.client.get(reverse('search'), {'field': 'gender', 'value': value})
+            self.assertEqual([c.wc_number for c in resp.context['page_obj'].object_list], expected, value)
+
     def test_census_id(self):
         self.assertCount(
             reverse('search') + '?field=census_id&value=123.4',
             expected=1
         )
+
+
+class KeywordSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects")
+        ed = Edition.objects.create(title=title, edition_number="1")
+        iss = Issue.objects.create(edition=ed, year="1773", start_date=1773, end_date=1773)
+        loc = Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        cls.annotated = Copy.objects.create(
+            issue=iss, location=loc, wc_number="1", verification='V',
+            marginalia="Pencil annotations <b>throughout</b> the elegies",
+        )
+        cls.owned = Copy.objects.create(issue=iss, location=loc, wc_number="2", verification='V')
+        owner = ProvenanceName.objects.create(name="Phillis Peters")
+        cls.owned.provenance_records.create(provenance_name=owner)
+
+    def search(self, value):
+        return self.client.get(reverse('search'), {'field': 'keyword', 'value': value})
+
+    def test_matches_copy_text(self):
+        resp = self.search('annotations')
+        self.assertEqual(resp.context['copy_count'], 1)
+        self.assertEqual(resp.context['page_obj'].object_list[0].pk, self.annotated.pk)
+
+    def test_matches_provenance_name_and_follows_edits(self):
+        self.assertEqual(self.search('Peters').context['copy_count'], 1)
+        self.owned.provenance_records.all().delete()
+        self.assertEqual(self.search('Peters').context['copy_count'], 0)
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        content = self.search('annotations').content.decode()
+        self.assertIn('<mark>annotations</mark>', content)
+        self.assertIn('&lt;b&gt;throughout', content)
+
+
+class CopyOrderingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.poems = Title.objects.create(title="Poems on Various Subjects")
+        cls.elegy = Title.objects.create(title="An Elegiac Poem")
+        cls.poems_issue = Issue.objects.create(
+            edition=Edition.objects.create(title=cls.poems, edition_number="1"),
+            year="1773", start_date=1773, end_date=1773)
+        cls.elegy_issue = Issue.objects.create(
+            edition=Edition.objects.create(title=cls.elegy, edition_number="1"),
+            year="1770", start_date=1770, end_date=1770)
+        cls.yale = Location.objects.create(name_of_library_collection="Yale University")
+        cls.library = Location.objects.create(name_of_library_collection="The Library Company")
+        Copy.objects.create(issue=cls.poems_issue, location=cls.yale, wc_number="10", verification='V')
+        Copy.objects.create(issue=cls.poems_issue, location=cls.library, wc_number="9", verification='V')
+        Copy.objects.create(issue=cls.elegy_issue, location=cls.yale, wc_number="11", verification='V')
+
+    def ordered(self, order):
+        resp = self.client.get(reverse('search'), {'field': 'location', 'value': 'y', 'order': order})
+        return [c.wc_number for c in resp.context['page_obj'].object_list]
+
+    def test_sort_keys_are_persisted(self):
+        copy = Copy.objects.get(wc_number="11")
+        self.assertEqual((copy.sort_year, copy.sort_title, copy.sort_location),
+                         (1770, "elegiac poem", "yale university"))
+
+    def test_orderings(self):
+        self.assertEqual(self.ordered('date'), ["11", "9", "10"])
+        self.assertEqual(self.ordered('title'), ["11", "9", "10"])
+        self.assertEqual(self.ordered('location'), ["9", "11", "10"])
+
+    def test_related_edits_update_sort_keys(self):
+        self.library.name_of_library_collection = "Zurich Library"
+        self.library.save()
+        self.poems_issue.start_date = 1760
+        self.poems_issue.save()
+        self.assertEqual(self.ordered('location'), ["10", "11", "9"])
+        self.assertEqual(self.ordered('date'), ["10", "9", "11"])
+
+    def test_copy_list_orders_by_wc_number(self):
+        resp = self.client.get(reverse('copy_list', args=[self.poems_issue.pk]))
+        self.assertEqual([c.wc_number for c in resp.context['all_copies']], ["9", "10"])
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects")
+        issue = Issue.objects.create(
+            edition=Edition.objects.create(title=title, edition_number="1"),
+            year="1773", start_date=1773, end_date=1773)
+        loc = Location.objects.create(name_of_library_collection="Library of Congress")
+        for n in range(1, 8):
+            Copy.objects.create(issue=issue, location=loc, wc_number=str(n), verification='V')
+
+    def walk(self, ordering):
+        paginator = KeysetPaginator(Copy.objects.all(), ordering, per_page=3)
+        pages, page = [], paginator.page()
+        while True:
+            pages.append([c.wc_number for c in page])
+            if not page.has_next():
+                return paginator, page, pages
+            page = paginator.page(page.next_cursor)
+
+    def test_forward_and_back(self):
+        paginator, last, pages = self.walk(('sort_wc_number', 'id'))
+        self.assertEqual(pages, [["1", "2", "3"], ["4", "5", "6"], ["7"]])
+        middle = paginator.page(last.previous_cursor)
+        self.assertEqual([c.wc_number for c in middle], ["4", "5", "6"])
+        first = paginator.page(middle.previous_cursor)
+        self.assertEqual([c.wc_number for c in first], ["1", "2", "3"])
+        self.assertFalse(first.has_previous())
+
+    def test_descending_column(self):
+        _, _, pages = self.walk(('-sort_wc_number', 'id'))
+        self.assertEqual(pages, [["7", "6", "5"], ["4", "3", "2"], ["1"]])
+
+    def test_tampered_cursor_restarts(self):
+        page = KeysetPaginator(Copy.objects.all(), ('sort_wc_number', 'id'), per_page=3).page('junk')
+        self.assertEqual([c.wc_number for c in page], ["1", "2", "3"])
+
+    def test_json_mode(self):
+        resp = self.client.get(reverse('search'), {'field': 'location', 'value': 'Congress', 'format': 'json'})
+        data = resp.json()
+        self.assertEqual(data['rows'].count('<tr>'), 7)
+        self.assertIsNone(data['next_url'])
+
+
+class HomepageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.later = Title.objects.create(title="Poems on Various Subjects")
+        cls.earlier = Title.objects.create(title="An Elegiac Poem")
+        ed = Edition.objects.create(title=cls.later, edition_number="1")
+        cls.later_issue = Issue.objects.create(edition=ed, year="1773", start_date=1773, end_date=1773)
+        ed = Edition.objects.create(title=cls.earlier, edition_number="1")
+        cls.earlier_issues = [
+            Issue.objects.create(edition=ed, year="1771", start_date=1771, end_date=1771),
+            Issue.objects.create(edition=ed, year="1770", start_date=1770, end_date=1770),
+        ]
+
+    def setUp(self):
+        clear_caches()
+
+    def test_summary_follows_issue_writes(self):
+        self.earlier.refresh_from_db()
+        self.assertEqual(self.earlier.earliest_year, 1770)
+        self.assertEqual(self.earlier.first_issue, self.earlier_issues[0])
+        self.earlier_issues[1].delete()
+        self.earlier_issues[0].delete()
+        self.earlier.refresh_from_db()
+        self.assertEqual(self.earlier.earliest_year, 9999)
+        self.assertIsNone(self.earlier.first_issue)
+
+    def test_titles_sort_without_case_and_follow_other_workers(self):
+        self.client.get(reverse('homepage'))
+        # Another process renames a title and bumps the shared version; no signal runs here.
+        Title.objects.filter(pk=self.later.pk).update(title="an Anthem", earliest_year=1770)
+        DataVersion.objects.filter(namespace='titles').update(version=F('version') + 1)
+        cache.delete(versioning._VERSIONS_KEY)  # as after VERSION_MAX_AGE
+        titles = [t.title for t in self.client.get(reverse('homepage')).context['titlelist']]
+        self.assertEqual(titles, ["an Anthem", "An Elegiac Poem"])
+
+    def test_grid_order_and_query_count(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('homepage'))
+        self.assertEqual(resp.context['titlelist'], [self.earlier, self.later])
+        self.assertContains(resp, reverse('copy_list', args=[self.earlier_issues[0].pk]))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('homepage'))
+
+
+class AboutPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        StaticPageText.objects.create(
+            viewname='about', content="{copy_count} copies, {fragment_copy_count} fragments, {facsimile_percent}")
+        Copy.objects.create(wc_number="1", verification='V', digital_facsimile_url="https://example.org/1")
+        Copy.objects.create(wc_number="2", verification='U')
+        Copy.objects.create(wc_number="3", verification='V', fragment=True)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_counts_are_cached_until_copies_change(self):
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('about'))
+        self.assertContains(resp, "2 copies, 1 fragments, 50%")
+        with self.assertNumQueries(1):
+            self.client.get(reverse('about'))
+        Copy.objects.create(wc_number="4", verification='V')
+        self.assertContains(self.client.get(reverse('about')), "3 copies, 1 fragments, 33%")
+
+    def test_pages_without_counts_skip_statistics(self):
+        StaticPageText.objects.filter(viewname='about').update(content="Write to us.")
+        with self.assertNumQueries(1):
+            self.assertContains(self.client.get(reverse('about')), "Write to us.")
+
+
+class CsvExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for n, place in enumerate(["Boston Athenaeum", "Yale University", "Boston Athenaeum"]):
+            title = Title.objects.create(title=f"Title {n}")
+            issue = Issue.objects.create(
+                edition=Edition.objects.create(title=title, edition_number="1"),
+                year=str(1770 + n), start_date=1770 + n, end_date=1770 + n)
+            loc, _ = Location.objects.get_or_create(name_of_library_collection=place)
+            Copy.objects.create(issue=issue, location=loc, wc_number=str(n), verification='V')
+        Copy.objects.create(wc_number="99", verification='V')
+
+    def rows(self, url):
+        with self.assertNumQueries(1):
+            resp = self.client.get(url)
+            body = b''.join(resp.streaming_content).decode()
+        return [line.split(',') for line in body.strip().split('\r\n')]
+
+    def test_location_counts(self):
+        header, *body = self.rows(reverse('location_copy_count_csv_export'))
+        self.assertEqual(header, ['Location', 'Number of Copies'])
+        self.assertEqual(sorted(body), [
+            ['Boston Athenaeum', '2'], ['Unknown', '0'], ['Yale University', '1']])
+
+    def test_year_issue_counts(self):
+        self.assertEqual(self.rows(reverse('year_issue_copy_count_csv_export'))[1:], [
+            ['1770', 'Title 0', '1'], ['1771', 'Title 1', '1'], ['1772', 'Title 2', '1']])
+
+    def test_generic_export_rejects_user_fields(self):
+        url = reverse('export', args=['created_by__password', 'id', 'count'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CensusDumpTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects")
+        issue = Issue.objects.create(
+            edition=Edition.objects.create(title=title, edition_number="1"),
+            year="1773", start_date=1773, end_date=1773)
+        loc = Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        owner = ProvenanceName.objects.create(name="Phillis Peters", gender='F')
+        for n in range(5):
+            copy = Copy.objects.create(issue=issue, location=loc, wc_number=str(n), verification='V')
+            copy.provenance_records.create(provenance_name=owner)
+        Copy.objects.create(wc_number="orphan")
+        cls.staff = User.objects.create_user('curator', password='pw', is_staff=True)
+
+    def test_rows_are_denormalized_without_n_plus_one(self):
+        # One copy query read in two chunks, plus one provenance prefetch per chunk.
+        with self.assertNumQueries(3):
+            rows = list(dump.iter_rows(chunk_size=3))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual((rows[0]['title'], rows[0]['location_name'], rows[0]['issue_year']),
+                         ("Poems on Various Subjects", "Boston Athenaeum", "1773"))
+        self.assertEqual(rows[0]['provenance'][0]['name'], "Phillis Peters")
+        self.assertIsNone(rows[5]['title'])
+
+    def test_ndjson_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('census_dump')).status_code, 302)
+        self.client.force_login(self.staff)
+        resp = self.client.get(reverse('census_dump'))
+        lines = gzip.decompress(b''.join(resp.streaming_content)).decode().splitlines()
+        self.assertEqual([json.loads(line)['wc_number'] for line in lines], ["0", "1", "2", "3", "4", "orphan"])
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ("Library of Congress", "Boston Public Library", "Bodleian Library",
+                     "Houghton Library, Harvard", "Schomburg Center"):
+            Location.objects.create(name_of_library_collection=name)
+        ProvenanceName.objects.create(name="Phillis Wheatley Peters")
+
+    def setUp(self):
+        # Start each test from a fresh version so the index rebuilds from this test's data.
+        cache.clear()
+
+    def matches(self, query):
+        return self.client.get(reverse('autofill_location', args=[query])).json()['matches']
+
+    def test_name_prefix_ranks_before_word_prefix(self):
+        self.assertEqual(self.matches("bo"), ["Bodleian Library", "Boston Public Library"])
+        self.assertEqual(self.matches("lib"),
+                         ["Library of Congress", "Bodleian Library", "Boston Public Library",
+                          "Houghton Library, Harvard"])
+
+    def test_multiple_words_accents_and_case(self):
+        self.assertEqual(self.matches("LIBRARY harv"), ["Houghton Library, Harvard"])
+        self.assertEqual(self.matches("Schömburg"), ["Schomburg Center"])
+        resp = self.client.get(reverse('autofill_provenance', args=["wheat pet"]))
+        self.assertEqual(resp.json()['matches'], ["Phillis Wheatley Peters"])
+
+    def test_warm_lookups_skip_the_database(self):
+        self.matches("bo")
+        with self.assertNumQueries(0):
+            for prefix in ("s", "sc", "sch", "scho"):
+                self.matches(prefix)
+        # Once the cached data versions expire, one keystroke re-reads them; the
+        # index is not rebuilt.
+        cache.delete(versioning._VERSIONS_KEY)
+        with self.assertNumQueries(1):
+            self.matches("schom")
+        with self.assertNumQueries(0):
+            self.matches("schomb")
+
+    def test_edits_update_the_index(self):
+        self.matches("bo")
+        loc = Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        # The write makes this process re-read the data versions; the index is
+        # updated in place, not rebuilt.
+        with self.assertNumQueries(1):
+            self.assertEqual(self.matches("bost"), ["Boston Athenaeum", "Boston Public Library"])
+        loc.delete()
+        self.assertEqual(self.matches("bost"), ["Boston Public Library"])
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects")
+        cls.issue = Issue.objects.create(
+            edition=Edition.objects.create(title=title, edition_number="1"),
+            year="1773", start_date=1773, end_date=1773)
+        Copy.objects.create(issue=cls.issue, wc_number="1", verification='V')
+        cls.staff = User.objects.create_user('curator', password='pw', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('copy_list', args=[self.issue.pk])
+
+    def test_matching_etag_is_answered_without_queries(self):
+        etag = self.client.get(self.url)['ETag']
+        with self.assertNumQueries(0):
+            resp = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertIn('Cookie', resp['Vary'])
+
+    def test_any_write_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_writes_in_other_workers_change_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        # Another process committing a write: the shared version row moves, and no
+        # signal runs in this one. Its versions are re-read after VERSION_MAX_AGE.
+        DataVersion.objects.filter(namespace='census').update(version=F('version') + 1)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        cache.delete(versioning._VERSIONS_KEY)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_staff_and_public_pages_have_different_etags(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    @override_settings(RESPONSE_CACHE_ENABLED=True)
+    def test_response_cache_serves_anonymous_repeats(self):
+        first = self.client.get(self.url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(first.content, second.content)
+        Copy.objects.create(issue=self.issue, wc_number="2", verification='V')
+        self.assertNotEqual(self.client.get(self.url).content, first.content)
+
+    def test_issue_list_renders(self):
+        resp = self.client.get(reverse('issue_list', args=[self.issue.edition.title_id]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.has_header('Last-Modified'))
+
+
+class PerformanceMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        cls.staff = User.objects.create_user('curator', password='pw', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+
+    def test_server_timing_header(self):
+        resp = self.client.get(reverse('homepage'))
+        timing = resp['Server-Timing']
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+
+    def test_metrics_endpoint_reports_per_view_histograms(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 302)
+        self.client.get(reverse('homepage'))
+        b''.join(self.client.get(reverse('location_copy_count_csv_export')).streaming_content)
+        self.client.force_login(self.staff)
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('# TYPE wheatleycensus_db_queries histogram', body)
+        self.assertIn('wheatleycensus_request_seconds_count{view="homepage"} 1', body)
+        self.assertIn('wheatleycensus_db_queries_count{view="location_copy_count_csv_export"} 1', body)
+        self.assertIn('wheatleycensus_db_queries_bucket{view="location_copy_count_csv_export",le="1"} 1', body)
+
+
+
+class ConnectionRetryTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.calls = 0
+
+    def flaky_view(self, failures):
+        def view(request):
+            self.calls += 1
+            if self.calls <= failures:
+                raise OperationalError("server closed the connection unexpectedly")
+            return HttpResponse("ok")
+        return db.retry_on_disconnect(view)
+
+    def test_read_only_view_retried_once_after_lost_connection(self):
+        factory = RequestFactory()
+        with mock.patch.object(db, '_drop_lost_connections', return_value=['default']), \
+                mock.patch.object(db, 'RETRY_BACKOFF', 0), self.assertLogs('wheatleycensus.db', 'WARNING'):
+            self.assertEqual(self.flaky_view(1)(factory.get('/')).content, b"ok")
+            self.assertEqual(self.calls, 2)
+            self.calls = 0
+            with self.assertRaises(OperationalError):
+                self.flaky_view(2)(factory.get('/'))
+            self.calls = 0
+            with self.assertRaises(OperationalError):
+                self.flaky_view(1)(factory.post('/'))
+            self.assertEqual(self.calls, 1)
+        self.assertIn('wheatleycensus_db_retries_total{alias="default"} 2', metrics.render())
+
+    def test_version_read_of_public_pages_is_retried(self):
+        cache.clear()
+        read = versioning._read_versions
+        failures = [OperationalError("server closed the connection unexpectedly")]
+
+        def flaky_read():
+            if failures:
+                raise failures.pop()
+            return read()
+
+        with mock.patch.object(versioning, '_read_versions', flaky_read), \
+                mock.patch.object(db, '_drop_lost_connections', return_value=['default']), \
+                mock.patch.object(db, 'RETRY_BACKOFF', 0), self.assertLogs('wheatleycensus.db', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('homepage')).status_code, 200)
+        self.assertEqual(failures, [])
+
+    def test_no_retry_inside_a_transaction_or_on_a_live_connection(self):
+        # TestCase runs inside a transaction, and the connection is usable.
+        with self.assertRaises(OperationalError):
+            self.flaky_view(1)(RequestFactory().get('/'))
+        self.assertEqual(self.calls, 1)
+
+    def test_pool_statistics_rendered_as_gauges(self):
+        body = metrics.render({'default': {'pool_size': 4, 'pool_available': 3}})
+        self.assertIn('# TYPE wheatleycensus_db_pool_pool_size gauge', body)
+        self.assertIn('wheatleycensus_db_pool_pool_available{alias="default"} 3', body)
+        self.assertEqual(db.pool_stats(), {})
+
+
+
+class ReadSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('curator', password='secret')
+        title = Title.objects.create(title="Poems")
+        issue = Issue.objects.create(edition=Edition.objects.create(title=title, edition_number="1"),
+                                     year="1773", start_date=1773, end_date=1773)
+        cls.copy = Copy.objects.create(wc_number="1", issue=issue, marginalia="a marginal hymn",
+                                       created_by=user)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'snapshot.sqlite3')
+
+    def test_build_copies_census_tables_and_swaps_in_atomically(self):
+        counts = snapshot.build(self.path)
+        self.assertEqual(counts['wheatleycensus_copy'], 1)
+        Copy.objects.create(wc_number="2", issue=self.copy.issue)
+        snapshot.build(self.path)
+        self.assertEqual(os.listdir(os.path.dirname(self.path)), ['snapshot.sqlite3'])
+        raw = sqlite3.connect(self.path)
+        self.addCleanup(raw.close)
+        self.assertEqual(raw.execute("SELECT count(*) FROM wheatleycensus_copy").fetchone(), (2,))
+        self.assertEqual(raw.execute("SELECT password FROM auth_user").fetchall(), [('!',)])
+        self.assertEqual(raw.execute("SELECT rowid FROM wheatleycensus_copy_fts "
+                                     "WHERE wheatleycensus_copy_fts MATCH 'hymn'").fetchall(), [(self.copy.pk,)])
+        indexes = {name for name, in raw.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertIn('copy_date_order_idx', indexes)
+
+    def test_snapshot_used_only_while_fresh(self):
+        with mock.patch.object(snapshot, 'path', return_value=self.path):
+            state = snapshot.SnapshotState()
+            self.assertIsNone(state.current())
+            snapshot.build(self.path)
+            self.assertEqual(state.current(), os.stat(self.path).st_ino)
+            with override_settings(READ_SNAPSHOT_MAX_AGE=0):
+                self.assertIsNone(state.current())
+
+    def test_router_sends_only_public_census_reads_to_snapshot(self):
+        router = snapshot.ReadSnapshotRouter()
+        self.assertIsNone(router.db_for_read(Copy))
+        with mock.patch.object(snapshot.state, 'current', return_value=None), snapshot.reading():
+            self.assertIsNone(router.db_for_read(Copy))
+        with mock.patch.object(snapshot.state, 'current', return_value=1), \
+                mock.patch.object(snapshot, 'connections', {'snapshot': mock.Mock(connection=None)}), \
+                snapshot.reading():
+            self.assertEqual(router.db_for_read(Copy), 'snapshot')
+            self.assertIsNone(router.db_for_read(User))
+        self.copy._state.db = 'snapshot'
+        self.assertEqual(router.db_for_write(Copy, instance=self.copy), 'default')
+        self.assertFalse(router.allow_migrate('snapshot', 'wheatleycensus'))
+
+    def test_keys_and_etags_follow_the_snapshot_build(self):
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        seen = []
+        with mock.patch.object(snapshot.state, 'current', return_value=1), \
+                mock.patch.object(snapshot, 'connections', {'snapshot': mock.Mock(connection=None)}):
+            # A rebuild in another process changes nothing but the build time.
+            cache.clear()
+            for built_at in (1000.0, 2000.0):
+                # No trip to the primary for versions.
+                with mock.patch.object(snapshot.state, 'built_at', built_at), snapshot.reading(), \
+                        self.assertNumQueries(0):
+                    seen.append((versioning.versioned_key('census', 'page'), http_cache.census_etag(request)))
+        seen.append((versioning.versioned_key('census', 'page'), http_cache.census_etag(request)))
+        self.assertEqual(len(set(seen)), 3)
+        self.assertNotIn('snapshot', seen[2][0])
+        self.assertEqual(seen[1], ('wheatleycensus:census:snapshot2000000000:page', 'snapshot2000000000-anon'))
+
+
+class YearTimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.poems = Title.objects.create(title="Poems")
+        cls.letters = Title.objects.create(title="Letters")
+        poems = Edition.objects.create(title=cls.poems, edition_number="1")
+        letters = Edition.objects.create(title=cls.letters, edition_number="1")
+        issues = [Issue.objects.create(edition=poems, year="1773-1775", start_date=1773, end_date=1775),
+                  Issue.objects.create(edition=poems, year="1774", start_date=1774, end_date=0),
+                  Issue.objects.create(edition=letters, year="1778", start_date=1778, end_date=1778),
+                  Issue.objects.create(edition=letters, year="", start_date=0, end_date=0)]
+        for n, (issue, verification) in enumerate([(0, 'V'), (0, 'U'), (1, 'V'), (2, 'V'),
+                                                   (2, 'F'), (3, 'V')]):
+            Copy.objects.create(wc_number=str(n + 1), issue=issues[issue], verification=verification)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_sweep_counts_copies_in_every_year_of_their_issue(self):
+        data = timeline.timeline()
+        self.assertEqual(data['years'], list(range(1773, 1779)))
+        self.assertEqual(data['total'], [2, 3, 2, 0, 0, 1])
+        self.assertEqual({t['title']: t['counts'] for t in data['titles']},
+                         {"Poems": [2, 3, 2, 0, 0, 0], "Letters": [0, 0, 0, 0, 0, 1]})
+
+    def test_filters_and_endpoint(self):
+        data = timeline.timeline(title=self.poems.pk, start=1774, end=1790)
+        self.assertEqual((data['years'], data['total']), ([1774, 1775, 1776, 1777, 1778], [3, 2, 0, 0, 0]))
+        self.assertEqual([t['title'] for t in data['titles']], ["Poems"])
+        self.assertEqual(timeline.timeline(start=1776, end=1777)['titles'], [])
+
+        url = reverse('year_timeline')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            resp = self.client.get(url, {'title': self.letters.pk})
+        self.assertEqual(resp.json()['total'], [0, 0, 0, 0, 0, 1])
+        Copy.objects.create(wc_number="7", issue=Issue.objects.get(year="1778"), verification='U')
+        self.assertEqual(self.client.get(url, {'start': 1778}).json()['total'], [2])
+
+    def test_year_search_lists_the_copies_counted_in_a_year(self):
+        data = timeline.timeline()
+        for year, count in zip(data['years'], data['total']):
+            resp = self.client.get(reverse('search'), {'field': 'year', 'value': str(year)})
+            self.assertEqual(resp.context['copy_count'], count, year)
+
+
+
+class TitleIconTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media = override_settings(MEDIA_ROOT=directory.name)
+        self.media.enable()
+        self.addCleanup(self.media.disable)
+        cache.clear()
+
+    def upload(self, name="london 1773 icon.png", size=500):
+        out = BytesIO()
+        Image.linear_gradient('L').resize((size, size)).convert('RGBA').save(out, 'PNG')
+        return SimpleUploadedFile(name, out.getvalue(), content_type='image/png')
+
+    def test_upload_makes_hashed_display_size_derivatives(self):
+        title = Title.objects.create(title="Poems", image=self.upload())
+        title.refresh_from_db()
+        variants = title.icon_variants
+        self.assertEqual(variants['source'], title.image.name)
+        self.assertEqual([w for w, _ in variants['formats']['webp']], [90, 180])
+        for extension, names in variants['formats'].items():
+            for width, name in names:
+                self.assertRegex(name, rf'^titleicon/derived/london_1773_icon-{width}\.[0-9a-f]{{12}}\.{extension}$')
+                with default_storage.open(name) as f, Image.open(f) as image:
+                    self.assertEqual(image.size, (width, width))
+        self.assertLess(default_storage.size(variants['formats']['webp'][0][1]) * 10,
+                        default_storage.size(title.image.name))
+
+        # Saving without a new image keeps them; a new image replaces them.
+        title.notes = "Notes"
+        title.save()
+        title.refresh_from_db()
+        self.assertEqual(title.icon_variants, variants)
+        title.image = self.upload("other.png", 300)
+        title.save()
+        title.refresh_from_db()
+        self.assertNotEqual(title.icon_variants['formats'], variants['formats'])
+
+    def test_templates_emit_srcset_with_dimensions(self):
+        title = Title.objects.create(title="Poems", image=self.upload())
+        Title.objects.filter(pk=title.pk).update(icon_variants={})
+        resp = self.client.get(reverse('homepage'))
+        self.assertContains(resp, 'width="90" height="90"')
+        self.assertNotContains(resp, '<picture>')
+
+        out = StringIO()
+        call_command('build_title_icons', stdout=out)
+        self.assertIn("Built icons for 1 titles.", out.getvalue())
+        resp = self.client.get(reverse('homepage'))
+        self.assertContains(resp, '<source type="image/webp" srcset="/media/titleicon/derived/london_1773_icon-90.')
+        self.assertContains(resp, 'width="90" height="90"')
+        self.assertRegex(resp.content.decode(), r'-180\.[0-9a-f]{12}\.png 2x"')
+
+
+@override_settings(STORAGES={
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'wheatleycensus.staticfiles.CompressedManifestStaticFilesStorage'},
+})
+class CompressedStaticFilesTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        root = override_settings(STATIC_ROOT=self.root)
+        root.enable()
+        self.addCleanup(root.disable)
+        staticfiles.collected.reset()
+        self.addCleanup(staticfiles.collected.reset)
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        with open(os.path.join(self.root, 'staticfiles.json')) as f:
+            hashed = json.load(f)['paths']['census/style.css']
+        self.assertRegex(hashed, r'^census/style\.[0-9a-f]{12}\.css$')
+        with open(os.path.join(self.root, 'census', 'style.css'), 'rb') as f:
+            original = f.read()
+        with gzip.open(os.path.join(self.root, hashed + '.gz')) as f:
+            self.assertEqual(f.read(), original)
+        self.assertTrue(os.path.exists(os.path.join(self.root, 'census/style.css.gz')))
+        self.assertLess(os.path.getsize(os.path.join(self.root, hashed + '.gz')), len(original))
+
+    def test_middleware_serves_precompressed_variants(self):
+        with open(os.path.join(self.root, 'staticfiles.json')) as f:
+            hashed = json.load(f)['paths']['census/style.css']
+        resp = self.client.get('/static/' + hashed, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(resp['Content-Type'], 'text/css')
+        self.assertEqual(resp['Vary'], 'Accept-Encoding')
+        self.assertEqual(resp['Cache-Control'], staticfiles.IMMUTABLE)
+        with open(os.path.join(self.root, hashed), 'rb') as f:
+            self.assertEqual(gzip.decompress(b''.join(resp.streaming_content)), f.read())
+
+        resp = self.client.get('/static/' + hashed)
+        self.assertNotIn('Content-Encoding', resp)
+        self.assertEqual(int(resp['Content-Length']), os.path.getsize(os.path.join(self.root, hashed)))
+        b''.join(resp.streaming_content)
+        resp = self.client.get('/static/census/style.css')
+        self.assertEqual(resp['Cache-Control'], staticfiles.REVALIDATE)
+        b''.join(resp.streaming_content)
+        resp = self.client.get('/static/census/style.css', HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, 304)
+
+        self.assertEqual(self.client.get('/static/missing.css').status_code, 404)
+
+
+class CopyRowCacheTests(TestCase):
+    ROW = 'census/copy-list-row.html'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.issue = Issue.objects.create(
+            edition=Edition.objects.create(title=Title.objects.create(title="Poems"), edition_number="1"),
+            year="1773", start_date=1773, end_date=1773)
+        cls.library = Location.objects.create(name_of_library_collection="The Library Company")
+        for n in range(3):
+            Copy.objects.create(issue=cls.issue, location=cls.library, wc_number=str(n + 1),
+                                shelfmark=f"Shelf {n + 1}", verification='V')
+
+    def setUp(self):
+        cache.clear()
+
+    def rows(self, is_staff=False):
+        copies = Copy.objects.select_related('location', 'issue__edition__title').order_by('wc_number')
+        return [str(cells) for _, cells in row_cache.render_rows(copies, self.ROW, is_staff)]
+
+    def test_rows_are_rendered_once_per_stamp(self):
+        first = self.rows()
+        self.assertIn("Shelf 1", first[0])
+        self.assertNotIn("Edit&nbsp;copy", first[0])
+        self.assertIn("Edit&nbsp;copy", self.rows(is_staff=True)[0])
+
+        # Cached under the unchanged stamp: an update() that skips signals is not seen...
+        Copy.objects.filter(wc_number="1").update(shelfmark="Moved")
+        with mock.patch.object(row_cache.cache, 'set_many') as set_many:
+            self.assertEqual(self.rows(), first)
+        set_many.assert_not_called()
+        # ...but save() and edits to related rows advance it.
+        Copy.objects.get(wc_number="1").save()
+        self.assertIn("Moved", self.rows()[0])
+        self.library.name_of_library_collection = "Houghton Library"
+        self.library.save()
+        self.assertTrue(all("Houghton Library" in row for row in self.rows()))
+
+    def test_pages_render_cached_rows(self):
+        url = reverse('copy_list', args=[self.issue.pk])
+        resp = self.client.get(url)
+        self.assertContains(resp, '<tr class="odd">')
+        self.assertContains(resp, "Shelf 3")
+        resp = self.client.get(reverse('search'), {'field': 'location', 'value': 'library'})
+        self.assertContains(resp, "The Library Company", count=3)
+
+
+class SyntheticCensusTests(TestCase):
+    def test_generate_is_complete_and_deterministic(self):
+        created = synthetic.generate(scale=0.01, seed=3, copies=40)
+        self.assertEqual(created['copies'], 40)
+        self.assertEqual(Copy.objects.count(), 40)
+        self.assertFalse(Copy.objects.filter(sort_wc_number='').exists())
+        self.assertFalse(Title.objects.filter(first_issue=None).exists())
+        first = list(Copy.objects.order_by('pk').values_list('wc_number', 'marginalia')[:5])
+        Copy.objects.all().delete()
+        Title.objects.all().delete()
+        synthetic.generate(scale=0.01, seed=3, copies=40)
+        self.assertEqual(list(Copy.objects.order_by('pk').values_list('wc_number', 'marginalia')[:5]), first)
+
+    def test_benchmark_writes_and_compares_baselines(self):
+        synthetic.generate(scale=0.01, copies=20)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'baseline.json')
+            call_command('benchmark_views', repeat=1, only=['homepage', 'copy_list'],
+                         output=path, stdout=open(os.devnull, 'w'))
+            with open(path) as f:
+                results = json.load(f)['results']
+            self.assertEqual({r['view'] for r in results.values()}, {'homepage', 'copy_list'})
+            self.assertEqual(results['/']['status'], 200)
+            call_command('benchmark_views', repeat=1, only=['homepage'], compare=path,
+                         max_slowdown=1000, stdout=open(os.devnull, 'w'))
+
+
+class CopyDetailModalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects", notes="First collection")
+        issue = Issue.objects.create(
+            edition=Edition.objects.create(title=title, edition_number="1", notes="London"),
+            year="1773", start_date=1773, end_date=1773)
+        loc = Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        user = User.objects.create_user('cataloguer')
+        cls.copies = []
+        for n in range(3):
+            copy = Copy.objects.create(issue=issue, location=loc, wc_number=str(n + 1),
+                                       verification='V', created_by=user)
+            for name in ("Phillis Peters", "John Andrews"):
+                copy.provenance_records.create(provenance_name=ProvenanceName.objects.create(name=name))
+            cls.copies.append(copy)
+
+    def setUp(self):
+        clear_caches()
+
+    def test_modal_is_rendered_from_two_queries(self):
+        with self.assertNumQueries(2):
+            resp = self.client.get(reverse('copy_data', args=[self.copies[0].pk]),
+                                   HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertContains(resp, "John Andrews")
+        self.assertContains(resp, "cataloguer")
+
+    def test_batch_returns_every_modal_in_two_queries(self):
+        ids = ','.join(str(c.pk) for c in self.copies) + ',bogus'
+        with self.assertNumQueries(2):
+            modals = self.client.get(reverse('copy_data_batch'), {'ids': ids}).json()['modals']
+        self.assertEqual(set(modals), {str(c.pk) for c in self.copies})
+        single = self.client.get(reverse('copy_data', args=[self.copies[1].pk]),
+                                 HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(modals[str(self.copies[1].pk)], single.content.decode())
+
+
+class CollectionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.copy = Copy.objects.create(wc_number="1", verification='V')
+        cls.other = Copy.objects.create(wc_number="2", verification='V', marginalia="Signed")
+        cls.owner = ProvenanceName.objects.create(name="Phillis Peters", gender='M', start_century='18')
+
+    def setUp(self):
+        cache.clear()
+
+    def slugs(self, copy):
+        return set(CopyCollection.objects.filter(copy=copy).values_list('collection', flat=True))
+
+    def test_memberships_follow_provenance_and_copy_edits(self):
+        self.assertEqual(self.slugs(self.other), {'marginalia'})
+        self.copy.provenance_records.create(provenance_name=self.owner)
+        self.assertEqual(self.slugs(self.copy), set())
+        self.owner.gender = 'F'
+        self.owner.save()
+        self.assertEqual(self.slugs(self.copy), {'womanowner', 'earlywomanowner'})
+        self.copy.provenance_records.all().delete()
+        self.assertEqual(self.slugs(self.copy), set())
+        self.other.marginalia = ''
+        self.other.save()
+        self.assertEqual(self.slugs(self.other), set())
+
+    def test_browse_and_counts_use_memberships(self):
+        CopyCollection.objects.create(copy=self.copy, collection='earlysammelband')
+        resp = self.client.get(reverse('search'), {'field': 'collection', 'value': 'earlysammelband'})
+        self.assertContains(resp, "Extant copies: 1")
+        self.assertContains(resp, "Copies in an early sammelband")
+        matches = self.client.get(reverse('autofill_collection')).json()['matches']
+        counts = {m['value']: m['count'] for m in matches}
+        self.assertEqual((counts['earlysammelband'], counts['marginalia'], counts['womanowner']), (1, 1, 0))
+
+    def test_deleting_a_copy_with_provenance(self):
+        self.copy.provenance_records.create(provenance_name=self.owner)
+        self.copy.provenance_records.create(provenance_name=ProvenanceName.objects.create(name="A", gender='F'))
+        pk = self.copy.pk
+        self.copy.delete()
+        self.assertFalse(CopyCollection.objects.filter(copy_id=pk).exists())
+
+
+class FacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects")
+        edition = Edition.objects.create(title=title, edition_number="1")
+        early = Issue.objects.create(edition=edition, year="1773", start_date=1773, end_date=1773)
+        late = Issue.objects.create(edition=edition, year="1802", start_date=1802, end_date=1802)
+        boston = Location.objects.create(name_of_library_collection="Boston Athenaeum",
+                                         us_state_or_non_us_nation='MA')
+        london = Location.objects.create(name_of_library_collection="British Library",
+                                         us_state_or_non_us_nation='UK')
+        woman = ProvenanceName.objects.create(name="Phillis Peters", gender='F')
+        man = ProvenanceName.objects.create(name="John Andrews", gender='M')
+        a = Copy.objects.create(issue=early, location=boston, wc_number="1", verification='V',
+                                digital_facsimile_url="https://example.org/1")
+        b = Copy.objects.create(issue=early, location=london, wc_number="2", verification='U')
+        Copy.objects.create(issue=late, location=boston, wc_number="3", verification='V', fragment=True)
+        for copy, owner in ((a, woman), (a, man), (b, woman)):
+            copy.provenance_records.create(provenance_name=owner)
+
+    def setUp(self):
+        cache.clear()
+
+    def search(self, **params):
+        resp = self.client.get(reverse('search'), dict({'field': 'location', 'value': 'a'}, **params))
+        facets = {f['key']: {v['value']: v['count'] for v in f['values']} for f in resp.context['facets']}
+        return resp, facets
+
+    def test_counts_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = facets._count(Copy.objects.all())
+        self.assertEqual(counts['region'], {'MA': 2, 'UK': 1})
+        self.assertEqual(counts['gender'], {'F': 2, 'M': 1, '': 1})
+        self.assertEqual(counts['decade'], {'1770': 2, '1800': 1})
+        self.assertEqual(counts['facsimile'], {'1': 1, '0': 2})
+        self.assertEqual(counts['fragment'], {'1': 1, '0': 2})
+
+    def test_selecting_a_value_narrows_results_and_counts(self):
+        resp, counts = self.search(facet_gender='F')
+        self.assertContains(resp, "Extant copies: 2")
+        self.assertEqual(counts['region'], {'MA': 1, 'UK': 1})
+        resp, counts = self.search(facet_gender='F', facet_region='UK')
+        self.assertContains(resp, "Extant copies: 1")
+        resp, counts = self.search(facet_decade='1800')
+        self.assertContains(resp, "Extant copies: 1")
+        selected = [v for f in resp.context['facets'] for v in f['values'] if v['selected']]
+        self.assertEqual([v['label'] for v in selected], ['1800s'])
+        self.assertNotIn('facet_decade', selected[0]['url'])
+
+
+class AdminScalingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.org', 'pw')
+        cls.title = Title.objects.create(title="Poems")
+        cls.location = Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        cls.copy = Copy.objects.create(issue=cls.add_issue(), location=cls.location, wc_number="1")
+
+    @classmethod
+    def add_issue(cls):
+        edition = Edition.objects.create(title=cls.title, edition_number="1")
+        return Issue.objects.create(edition=edition, start_date=1773, end_date=1773, year="1773")
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_title_changelist_counts_without_per_row_queries(self):
+        url = reverse('admin:wheatleycensus_title_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(url)
+        for n in range(5):
+            Title.objects.create(title=f"Other {n}")
+            self.add_issue()
+        with CaptureQueriesContext(connection) as after:
+            resp = self.client.get(url)
+        self.assertEqual(len(after), len(before))
+        row = next(t for t in resp.context['cl'].result_list if t.pk == self.title.pk)
+        self.assertEqual((row.edition_total, row.copy_total), (6, 1))
+
+    def test_copy_change_page_uses_autocomplete_widgets(self):
+        for n in range(20):
+            ProvenanceName.objects.create(name=f"Owner {n}")
+        resp = self.client.get(reverse('admin:wheatleycensus_copy_change', args=[self.copy.pk]))
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, 'admin-autocomplete')
+        self.assertNotContains(resp, "Owner 19")
+
+    def test_estimated_paginator_counts_exactly_off_postgres(self):
+        paginator = EstimatedCountPaginator(Copy.objects.order_by('pk'), 25)
+        self.assertEqual(paginator.count, 1)
+
+
+class BulkImportTests(TestCase):
+    HEADERS = ['wc_number', 'title', 'edition', 'year', 'location', 'shelfmark', 'marginalia']
+
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems on Various Subjects")
+        edition = Edition.objects.create(title=title, edition_number="1")
+        cls.issue = Issue.objects.create(edition=edition, year="1773", start_date=1773, end_date=1773)
+        cls.location = Location.objects.create(name_of_library_collection="Boston Athenaeum")
+        Copy.objects.create(wc_number="1", issue=cls.issue, shelfmark="A1", verification='V')
+        ProvenanceName.objects.create(name="Phillis Peters", gender='F')
+
+    def setUp(self):
+        cache.clear()
+
+    def dataset(self, rows, headers=None):
+        import tablib
+        return tablib.Dataset(*rows, headers=headers or self.HEADERS)
+
+    def copy_rows(self, n, start=2):
+        return [(str(i), "Poems on Various Subjects", "1", "1773", "Boston Athenaeum", f"B{i}", "")
+                for i in range(start, start + n)]
+
+    def test_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as small:
+            resources.CopyResource().import_data(self.dataset(self.copy_rows(5)), dry_run=True)
+        with CaptureQueriesContext(connection) as large:
+            resources.CopyResource().import_data(self.dataset(self.copy_rows(200)), dry_run=True)
+        # No per-row lookups: 195 more rows cost only a few more batched INSERTs.
+        self.assertLess(len(large) - len(small), 10)
+        self.assertEqual(Copy.objects.count(), 1)
+
+    def test_import_creates_updates_and_refreshes_derived_data(self):
+        rows = self.copy_rows(2) + [("1", "Poems on Various Subjects", "1", "1773", "Boston Athenaeum",
+                                     "A1", "Annotated by a reader")]
+        result = resources.CopyResource().import_data(self.dataset(rows))
+        self.assertFalse(result.has_errors() or result.has_validation_errors())
+        self.assertEqual((result.totals['new'], result.totals['update']), (2, 1))
+        copy = Copy.objects.get(wc_number="1")
+        self.assertEqual((copy.location, copy.marginalia), (self.location, "Annotated by a reader"))
+        self.assertEqual(copy.sort_location, "boston athenaeum")
+        self.assertEqual(Copy.objects.get(wc_number="3").issue, self.issue)
+        self.assertTrue(CopyCollection.objects.filter(copy=copy, collection='marginalia').exists())
+        resp = self.client.get(reverse('search'), {'field': 'keyword', 'value': 'annotated'})
+        self.assertContains(resp, "Extant copies: 1")
+
+        unchanged = resources.CopyResource().import_data(self.dataset(rows))
+        self.assertEqual(unchanged.totals['skip'], 3)
+
+    def test_unknown_keys_and_repeated_rows_are_errors(self):
+        rows = [("2", "Poems on Various Subjects", "1", "1773", "Nowhere", "", ""),
+                ("3", "Poems on Various Subjects", "2", "1773", "", "", ""),
+                ("4", "", "", "", "", "", ""),
+                ("4", "", "", "", "", "", "")]
+        result = resources.CopyResource().import_data(self.dataset(rows))
+        self.assertEqual([n for n, _ in result.row_errors()] + [r.number for r in result.invalid_rows],
+                         [4, 1, 2])
+        self.assertEqual(Copy.objects.count(), 1)
+
+    def test_provenance_records_by_natural_key(self):
+        headers = ['wc_number', 'provenance_name']
+        rows = [("1", "Phillis Peters"), ("1", "Phillis Peters")]
+        result = resources.ProvenanceRecordResource().import_data(self.dataset(rows[:1], headers))
+        self.assertEqual(result.totals['new'], 1)
+        self.assertTrue(CopyCollection.objects.filter(copy__wc_number="1", collection='womanowner').exists())
+        again = resources.ProvenanceRecordResource().import_data(self.dataset(rows, headers))
+        self.assertEqual(again.totals['error'], 1)
+        self.assertEqual(ProvenanceRecord.objects.count(), 1)
+
+    def test_command_streams_dry_run_diff(self):
+        rows = self.copy_rows(1) + [("1", "Poems on Various Subjects", "1", "1773", "", "A2", "")]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(self.dataset(rows).csv)
+        self.addCleanup(os.remove, f.name)
+        out = StringIO()
+        call_command('import_census', 'copies', f.name, '--dry-run', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith("1\tnew\t2\t"))
+        self.assertEqual(lines[1], "2\tupdate\t1\tshelfmark: 'A1' -> 'A2'")
+        self.assertIn("1 new, 1 update", lines[2])
+        self.assertEqual(Copy.objects.count(), 1)
+        with self.assertRaises(CommandError):
+            call_command('import_census', 'copies', f.name + '.unknown', stdout=StringIO())
+
+
+class MapDataTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems")
+        edition = Edition.objects.create(title=title, edition_number="1")
+        cls.issue = Issue.objects.create(edition=edition, year="1773", start_date=1773, end_date=1773)
+        boston = Location.objects.create(name_of_library_collection="Boston Athenaeum",
+                                         latitude=42.3577, longitude=-71.0618)
+        cambridge = Location.objects.create(name_of_library_collection="Houghton Library",
+                                            latitude=42.3736, longitude=-71.1163)
+        london = Location.objects.create(name_of_library_collection="British Library",
+                                         latitude=51.5299, longitude=-0.1277)
+        Location.objects.create(name_of_library_collection="Unplaced")
+        for n, (location, verification) in enumerate(
+                [(boston, 'V'), (boston, 'U'), (cambridge, 'V'), (london, 'V'), (london, 'F')]):
+            Copy.objects.create(wc_number=str(n + 1), issue=cls.issue, location=location,
+                                verification=verification)
+
+    def setUp(self):
+        cache.clear()
+
+    def features(self, **params):
+        resp = self.client.get(reverse('map_data'), params)
+        self.assertEqual(resp['Content-Type'], 'application/geo+json')
+        return resp.json()['features']
+
+    def test_clusters_by_zoom(self):
+        world = self.features(zoom=2)
+        self.assertEqual(sorted((f['properties']['cluster'], f['properties']['copies']) for f in world),
+                         [(False, 1), (True, 3)])
+        cluster = next(f for f in world if f['properties']['cluster'])
+        self.assertEqual(cluster['properties']['locations'], 2)
+        lon, lat = cluster['geometry']['coordinates']
+        self.assertAlmostEqual(lat, (2 * 42.3577 + 42.3736) / 3, places=4)
+        street = self.features(zoom=14)
+        self.assertEqual(sorted(f['properties']['name'] for f in street),
+                         ["Boston Athenaeum", "British Library", "Houghton Library"])
+
+    def test_filters_and_cache_follow_census_version(self):
+        self.assertEqual(self.features(zoom=14, issue=self.issue.pk + 1), [])
+        CopyCollection.objects.create(copy=Copy.objects.get(wc_number="4"), collection='earlysammelband')
+        self.assertEqual([f['properties']['name'] for f in self.features(zoom=14, collection='earlysammelband')],
+                         ["British Library"])
+        self.assertEqual(self.client.get(reverse('map_data'), {'collection': 'nope'}).status_code, 404)
+        self.features(zoom=14)
+        with self.assertNumQueries(0):
+            self.features(zoom=15)
+        Copy.objects.filter(wc_number="5").update(verification='V')
+        Copy.objects.get(wc_number="5").save()
+        london = next(f for f in self.features(zoom=14) if f['properties']['name'] == "British Library")
+        self.assertEqual(london['properties']['copies'], 2)
+
+
+class NearbyLocationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        title = Title.objects.create(title="Poems")
+        edition = Edition.objects.create(title=title, edition_number="1")
+        cls.issue = Issue.objects.create(edition=edition, year="1773", start_date=1773, end_date=1773)
+        cls.other_issue = Issue.objects.create(edition=edition, year="1786", start_date=1786, end_date=1786)
+        places = [("Boston Athenaeum", 42.3577, -71.0618), ("Houghton Library", 42.3736, -71.1163),
+                  ("Yale University Library", 41.3111, -72.9267), ("British Library", 51.5299, -0.1277),
+                  ("Fiji Museum", -18.1496, 178.4257)]
+        cls.locations = {name: Location.objects.create(name_of_library_collection=name, latitude=lat,
+                                                       longitude=lon) for name, lat, lon in places}
+        for n, name in enumerate(cls.locations):
+            issue = cls.other_issue if name == "Houghton Library" else cls.issue
+            Copy.objects.create(wc_number=str(n + 1), issue=issue, location=cls.locations[name],
+                                verification='V')
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, found):
+        by_pk = {l.pk: name for name, l in self.locations.items()}
+        return [by_pk[pk] for pk, _ in found]
+
+    def test_radius_uses_bounding_box_then_exact_distance(self):
+        found = geo.within(42.36, -71.06, 10)
+        self.assertEqual(self.names(found), ["Boston Athenaeum", "Houghton Library"])
+        self.assertLess(found[0][1], found[1][1])
+        self.assertEqual(self.names(geo.within(42.36, -71.06, 200)),
+                         ["Boston Athenaeum", "Houghton Library", "Yale University Library"])
+        # The box wraps around the antimeridian.
+        self.assertEqual(self.names(geo.within(-18.0, -179.9, 250)), ["Fiji Museum"])
+
+    def test_nearest_holding_an_issue(self):
+        self.assertEqual(self.names(geo.nearest(42.37, -71.12, 2, issue=self.issue.pk)),
+                         ["Boston Athenaeum", "Yale University Library"])
+        self.assertEqual(self.names(geo.nearest(51.5, 0, 1)), ["British Library"])
+        self.assertEqual(len(geo.nearest(0, 0, 10)), 5)
+
+    def test_search_field_and_endpoint(self):
+        resp = self.client.get(reverse('search'), {'field': 'near', 'value': '42.36, -71.06', 'radius': '200'})
+        self.assertContains(resp, "Extant copies: 3")
+        # Facet counts are cached per radius.
+        for radius, copies in (('10', 2), ('6000', 4)):
+            resp = self.client.get(reverse('search'), {'field': 'near', 'value': '42.36, -71.06', 'radius': radius})
+            decades = {f['key']: f for f in resp.context['facets']}['decade']['values']
+            self.assertEqual(sum(v['count'] for v in decades), copies, radius)
+        resp = self.client.get(reverse('near_locations'), {'point': '42.36,-71.06', 'k': 1})
+        self.assertEqual([(l['name'], l['copies']) for l in resp.json()['locations']],
+                         [("Boston Athenaeum", 1)])
+        self.assertEqual(self.client.get(reverse('near_locations'), {'point': 'nowhere'}).status_code, 400)
+
+
+class ProvenanceGraphTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.poems = Title.objects.create(title="Poems")
+        cls.letters = Title.objects.create(title="Letters")
+        poems_issue = Issue.objects.create(edition=Edition.objects.create(title=cls.poems, edition_number="1"),
+                                           year="1773", start_date=1773, end_date=1773)
+        letters_issue = Issue.objects.create(edition=Edition.objects.create(title=cls.letters, edition_number="1"),
+                                             year="1864", start_date=1864, end_date=1864)
+        cls.owners = {name: ProvenanceName.objects.create(name=name) for name in "ABCDE"}
+        # A and B share two copies of Poems; B and C a copy of Letters; C and D a copy of Poems.
+        holdings = [(poems_issue, "AB"), (poems_issue, "AB"), (letters_issue, "BC"), (poems_issue, "CD")]
+        for n, (issue, names) in enumerate(holdings):
+            copy = Copy.objects.create(wc_number=str(n + 1), issue=issue)
+            for name in names:
+                ProvenanceRecord.objects.create(copy=copy, provenance_name=cls.owners[name])
+
+    def setUp(self):
+        cache.clear()
+
+    def edges(self):
+        return {(e.owner.name, e.co_owner.name): e.copies for e in CoOwnership.objects.select_related('owner', 'co_owner')}
+
+    def depths(self, name, **kwargs):
+        data = provenance_graph.neighborhood(self.owners[name].pk, **kwargs)
+        return {node['name']: node['depth'] for node in data['nodes']}
+
+    def test_edges_follow_provenance_records(self):
+        self.assertEqual(self.edges(), {("A", "B"): 2, ("B", "C"): 1, ("C", "D"): 1})
+        ProvenanceRecord.objects.create(copy=Copy.objects.get(wc_number="4"), provenance_name=self.owners["E"])
+        ProvenanceRecord.objects.filter(copy__wc_number="1", provenance_name=self.owners["A"]).delete()
+        self.assertEqual(self.edges(), {("A", "B"): 1, ("B", "C"): 1, ("C", "D"): 1,
+                                        ("C", "E"): 1, ("D", "E"): 1})
+        record = ProvenanceRecord.objects.get(copy__wc_number="3", provenance_name=self.owners["C"])
+        record.provenance_name = self.owners["E"]
+        record.save()
+        self.assertEqual(self.edges(), {("A", "B"): 1, ("B", "E"): 1, ("C", "D"): 1,
+                                        ("C", "E"): 1, ("D", "E"): 1})
+        expected = self.edges()
+        provenance_graph.rebuild()
+        self.assertEqual(self.edges(), expected)
+
+    def test_neighborhood_is_depth_limited(self):
+        self.assertEqual(self.depths("A", depth=1), {"A": 0, "B": 1})
+        self.assertEqual(self.depths("A"), {"A": 0, "B": 1, "C": 2})
+        self.assertEqual(self.depths("A", depth=3), {"A": 0, "B": 1, "C": 2, "D": 3})
+        # Restricted to Poems, the chain breaks at the Letters copy B and C share.
+        self.assertEqual(self.depths("A", depth=3, title=self.poems.pk), {"A": 0, "B": 1})
+        self.assertEqual(self.depths("D", title=self.poems.pk), {"D": 0, "C": 1})
+
+    def test_graph_follows_edits_and_endpoint(self):
+        self.assertEqual(self.depths("D", depth=1), {"D": 0, "C": 1})
+        ProvenanceRecord.objects.create(copy=Copy.objects.get(wc_number="4"), provenance_name=self.owners["E"])
+        self.assertEqual(self.depths("D", depth=1), {"D": 0, "C": 1, "E": 1})
+
+        url = reverse('provenance_network', args=[self.owners["A"].pk])
+        data = self.client.get(url, {'depth': 1}).json()
+        a, b = self.owners["A"].pk, self.owners["B"].pk
+        self.assertEqual(data['edges'], [{'source': a, 'target': b, 'copies': 2}])
+        self.assertEqual([(n['name'], n['copies']) for n in data['nodes']], [("A", 2), ("B", 3)])
+        self.assertFalse(data['truncated'])
+        with self.assertNumQueries(2):
+            self.client.get(url, {'depth': 2})
+        missing = reverse('provenance_network', args=[max(o.pk for o in self.owners.values()) + 1])
+        self.assertEqual(self.client.get(missing).status_code, 404)
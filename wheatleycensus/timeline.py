@@ -0,0 +1,73 @@
+# wheatleycensus/timeline.py
+# Copies per year, overall and by title, for the timeline chart.
+#
+# An issue covers the years start_date..end_date, and each of its canonical copies
+# counts once in every one of those years. Copies are grouped by (title, start, end)
+# in one query; the per-year counts are then an interval sweep: add the copy count
+# at the first year and subtract it after the last, for every interval at once with
+# numpy, and take cumulative sums along the years. The result is cached under the
+# census data version; the title and year-range filters slice the cached arrays.
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count
+
+from . import versioning
+from .models import Copy, Title
+
+
+def _intervals():
+    """[(title id, first year, last year, copies)] over canonical copies of dated issues."""
+    return list(Copy.objects.filter(verification__in=('U', 'V'), issue__start_date__gt=0)
+                .order_by()
+                .values_list('issue__edition__title_id', 'issue__start_date', 'issue__end_date')
+                .annotate(n=Count('pk')))
+
+
+def sweep(starts, ends, weights, rows, row_count, first_year, last_year):
+    """
+    Per-year sums of `weights` over the closed intervals [starts, ends], one row
+    of counts per value of `rows`. Returns an array of shape (row_count, years).
+    """
+    width = last_year - first_year + 1
+    markers = np.zeros((row_count, width + 1), dtype=np.int64)
+    np.add.at(markers, (rows, starts - first_year), weights)
+    np.add.at(markers, (rows, ends - first_year + 1), -weights)
+    return np.cumsum(markers, axis=1)[:, :width]
+
+
+def compute():
+    """The full timeline: {'years': [...], 'total': [...], 'titles': [{id, title, counts}]}."""
+    intervals = _intervals()
+    if not intervals:
+        return {'years': [], 'total': [], 'titles': []}
+    titles, starts, ends, weights = (np.array(column, dtype=np.int64) for column in zip(*intervals))
+    # Issues with no (or an earlier) end year cover their start year only.
+    ends = np.maximum(ends, starts)
+    title_ids, rows = np.unique(titles, return_inverse=True)
+    first_year, last_year = int(starts.min()), int(ends.max())
+    counts = sweep(starts, ends, weights, rows, len(title_ids), first_year, last_year)
+    names = dict(Title.objects.filter(pk__in=title_ids.tolist()).values_list('pk', 'title'))
+    return {
+        'years': list(range(first_year, last_year + 1)),
+        'total': counts.sum(axis=0).tolist(),
+        'titles': [{'id': pk, 'title': names.get(pk, ''), 'counts': row}
+                   for pk, row in zip(title_ids.tolist(), counts.tolist())],
+    }
+
+
+def timeline(title=None, start=None, end=None):
+    """The cached timeline, optionally for one title and a range of years."""
+    key = versioning.versioned_key('census', 'timeline')
+    data = cache.get_or_set(key, compute, versioning.CACHE_TIMEOUT)
+    years, total, titles = data['years'], data['total'], data['titles']
+    if title is not None:
+        titles = [t for t in titles if t['id'] == title]
+        total = titles[0]['counts'] if titles else [0] * len(years)
+    if years and (start is not None or end is not None):
+        lo = max(0, (start if start is not None else years[0]) - years[0])
+        hi = max(lo, min(len(years), (end if end is not None else years[-1]) - years[0] + 1))
+        years, total = years[lo:hi], total[lo:hi]
+        titles = [{**t, 'counts': t['counts'][lo:hi]} for t in titles]
+    return {'years': years, 'total': total,
+            'titles': [t for t in titles if any(t['counts'])]}
@@ -20,8 +20,10 @@ urlpatterns = [
     path('title/<int:id>/',         views.issue_list,      name='issue_list'),
     path('issue/<int:id>/',         views.copy_list,       name='copy_list'),
     path('copydata/<int:copy_id>/', views.copy_data,       name='copy_data'),
+    path('copydata/batch/',         views.copy_data_batch, name='copy_data_batch'),
     path('copy/<int:census_id>/',   views.cen_copy_modal,  name='cen_copy_modal'),
     path('wc/<int:wc_number>/',     views.copy_page,       name='copy_page'),
+    path('copies/',                 views.all_copies_list, name='all_copies_list'),
     path('about/',                  views.about,           name='about'),
     path('about/advisoryboard/',    views.about,           {'viewname': 'advisoryboard'}, name='advisoryboard'),
     path('about/references/',       views.about,           name='references'),
@@ -43,6 +45,24 @@ urlpatterns = [
     path('location_copy_count_csv_export/',   views.location_copy_count_csv_export,  name='location_copy_count_csv_export'),
     path('year_issue_copy_count_csv_export/', views.year_issue_copy_count_csv_export, name='year_issue_copy_count_csv_export'),
     path('export/<str:groupby>/<str:column>/<str:aggregate>/', views.export, name='export'),
+    path('dump/',                             views.census_dump,                    name='census_dump'),
+
+    # --- Map data ---
+    # Clustered GeoJSON of holding locations and nearby-location lookups (see geo.py).
+    path('map/data/',                         views.map_data,                       name='map_data'),
+    path('near/',                             views.near_locations,                 name='near_locations'),
+
+    # --- Timeline ---
+    # Copies per year, overall and by title (see timeline.py).
+    path('timeline/',                         views.year_timeline,                  name='year_timeline'),
+
+    # --- Provenance network ---
+    # Owners who held copies alongside a given owner (see provenance_graph.py).
+    path('provenance/<int:owner_id>/network/', views.provenance_network,                name='provenance_network'),
+
+    # --- Monitoring ---
+    # Staff-only request timing histograms (see metrics.py and middleware.py).
+    path('metrics/',                          views.metrics_view,                   name='metrics'),
 
     # --- Authentication URLs ---
     # These URLs handle user login, logout, and admin access.
@@ -0,0 +1,156 @@
+# wheatleycensus/versioning.py
+# Data-version counters used to key and invalidate cached results.
+# Each namespace holds a number that is bumped by the signal handlers in signals.py
+# whenever the data it covers is written; cache keys embed the current version, so
+# stale entries are simply never read again and expire on their own.
+#
+# Versions are microsecond timestamps (kept strictly increasing), so a version also
+# says roughly when its data last changed. They are stored in a table of the
+# primary database (DataVersion), written in the same transaction as the change
+# they record, and read through the default cache: the whole set of versions is
+# kept there for VERSION_MAX_AGE seconds, and a bump deletes it. With a shared
+# cache backend every worker sees a bump at once; with the per-process local
+# memory cache, other workers see it within VERSION_MAX_AGE. Either way requests
+# normally read versions without touching the database, and a request sees the
+# same versions throughout.
+#
+# Data read from the local read snapshot (snapshot.py) only changes when the
+# snapshot is rebuilt: while a request reads the snapshot, its build time stands
+# in for every version, in cache keys and in the page ETag (http_cache.py), and
+# the primary database is not consulted at all.
+#
+# While `migrate` runs the table may not exist yet, so bumps are skipped and every
+# namespace is bumped once the migrations are done instead.
+
+import contextvars
+import time
+
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_migrate, pre_migrate
+from django.dispatch import receiver
+
+from .models import DataVersion
+
+# Lifetime of entries stored under versioned keys; a version bump makes them
+# unreachable long before this.
+CACHE_TIMEOUT = 60 * 60 * 24
+# Seconds a worker may go on using the versions it read before reading them again.
+VERSION_MAX_AGE = 2
+_VERSIONS_KEY = 'wheatleycensus:versions'
+
+# {namespace: version} read by the current request; None outside a request.
+_request_versions = contextvars.ContextVar('wheatleycensus_versions', default=None)
+# Build time (microseconds) of the read snapshot the current request reads from.
+_snapshot_build = contextvars.ContextVar('wheatleycensus_snapshot_build', default=None)
+_migrating = False
+
+
+def _now():
+    return time.time_ns() // 1000
+
+
+def _versions():
+    # Never routed to the read snapshot: versions must be the primary's.
+    return DataVersion.objects.using(DEFAULT_DB_ALIAS)
+
+
+@receiver(request_started)
+def start_request(sender, **kwargs):
+    _request_versions.set({})
+
+
+@receiver(request_finished)
+def finish_request(sender, **kwargs):
+    _request_versions.set(None)
+
+
+@receiver(pre_migrate)
+def start_migrate(sender, **kwargs):
+    global _migrating
+    _migrating = True
+
+
+@receiver(post_migrate)
+def finish_migrate(sender, using, **kwargs):
+    global _migrating
+    _migrating = False
+    if using == DEFAULT_DB_ALIAS and DataVersion._meta.db_table in connections[using].introspection.table_names():
+        _versions().update(version=Greatest(Value(_now()), F('version') + 1))
+        cache.delete(_VERSIONS_KEY)
+
+
+def _read_versions():
+    versions = cache.get(_VERSIONS_KEY)
+    if versions is None:
+        versions = dict(_versions().values_list('namespace', 'version'))
+        cache.set(_VERSIONS_KEY, versions, VERSION_MAX_AGE)
+    return versions
+
+
+def _forget_versions():
+    cache.delete(_VERSIONS_KEY)
+    versions = _request_versions.get()
+    if versions:
+        versions.clear()  # re-read on the next lookup
+
+
+def get_version(namespace):
+    """Return the current version of a namespace, initialising it on first use."""
+    build = _snapshot_build.get()
+    if build is not None:
+        return build
+    versions = _request_versions.get()
+    if versions is None:
+        versions = {}
+    if not versions:
+        versions.update(_read_versions())
+    if namespace not in versions:
+        _versions().bulk_create([DataVersion(namespace=namespace, version=_now())],
+                                ignore_conflicts=True)
+        cache.delete(_VERSIONS_KEY)
+        versions[namespace] = _versions().get(namespace=namespace).version
+    return versions[namespace]
+
+
+def bump_version(*namespaces):
+    """Advance the given namespaces so that results cached under them are discarded."""
+    if _migrating:
+        return
+    for namespace in namespaces:
+        now = _now()
+        if not _versions().filter(namespace=namespace).update(
+                version=Greatest(Value(now), F('version') + 1)):
+            _versions().bulk_create([DataVersion(namespace=namespace, version=now)],
+                                    ignore_conflicts=True)
+    _forget_versions()
+    # Again once committed, in case another worker re-read the old versions meanwhile.
+    transaction.on_commit(_forget_versions, using=DEFAULT_DB_ALIAS)
+
+
+def snapshot_build():
+    """Build time of the read snapshot being read, in microseconds; None when reading the primary."""
+    return _snapshot_build.get()
+
+
+def set_snapshot_build(built_at):
+    """Record the snapshot the current context reads (see snapshot.reading); returns a reset token."""
+    return _snapshot_build.set(built_at)
+
+
+def reset_snapshot_build(token):
+    _snapshot_build.reset(token)
+
+
+def version_tag(namespace):
+    """The current version of `namespace` as text, or the snapshot build being read."""
+    build = snapshot_build()
+    return f'snapshot{build}' if build is not None else str(get_version(namespace))
+
+
+def versioned_key(namespace, *parts):
+    """Build a cache key that embeds the current version of `namespace`."""
+    return ':'.join(['wheatleycensus', namespace, version_tag(namespace)] + [str(p) for p in parts])
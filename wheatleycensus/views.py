@@ -3,15 +3,24 @@
 # Each section is grouped by functionality: helpers, homepage/search, copy listings, static pages, CSV exports, autocomplete endpoints, and authentication.
 
 from django.conf import settings
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, Http404
+from django.http import HttpResponse, JsonResponse, HttpResponseRedirect, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.template import loader
 from django.contrib.auth import logout, authenticate, login
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count, Sum
-from django.core.paginator import Paginator
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db.models import Q, F, Count, Sum, Prefetch
+from django.db.models.functions import Lower
+from django.template.loader import render_to_string
+from django.core.cache import cache
 from .constants import US_STATES, WORLD_COUNTRIES
-from .models import Copy, Issue, Title, Location, ProvenanceName, StaticPageText  
+from .models import Copy, Issue, Title, Location, ProvenanceName, ProvenanceRecord, StaticPageText
+from . import (autocomplete, copy_collections, db, dump, facets, geo, metrics, provenance_graph,
+               search_index, timeline, versioning)
+from .http_cache import census_cached
+from .sorting import strip_article
+from .pagination import KeysetPaginator
+from .stats import census_statistics
 from datetime import datetime
 import csv
 from django.urls import reverse
@@ -39,15 +48,6 @@ def get_icon_path(title):
 # Helpers
 # ------------------------------------------------------------------------------
 # Utility functions for string manipulation, sorting, and year range parsing.
-def strip_article(s):
-    """Remove leading articles from a string."""
-    articles = ['a ', 'A ', 'an ', 'An ', 'the ', 'The ']
-    for a in articles:
-        if s.startswith(a):
-            return s.replace(a, '', 1)
-    return s
-
-
 def convert_year_range(year):
     """Convert a year range string to start and end years."""
     if '-' in year:
@@ -68,67 +68,72 @@ def title_sort_key(title_object):
     return strip_article(title)
 
 
-def copy_sort_key(c):
-    """Sort key for copies based on location and shelfmark."""
-    census_id_a, census_id_b = copy_census_id_sort_key(c)
-    return (copy_location_sort_key(c),
-            copy_shelfmark_sort_key(c),
-            census_id_a,
-            census_id_b)
+# Database orderings for copy listings, served by the indexes on Copy's persisted
+# sort columns (see sorting.py). Issues carry no STC/Wing number, so 'stc' orders
+# by title.
+COPY_ORDERINGS = {
+    'date':     ('sort_year', 'sort_title', 'sort_location', 'id'),
+    'title':    ('sort_title', 'sort_year', 'sort_location', 'id'),
+    'location': ('sort_location', 'sort_year', 'sort_title', 'id'),
+    'stc':      ('sort_title', 'sort_year', 'sort_location', 'id'),
+}
+COPY_LIST_ORDERING = ('sort_wc_number', 'sort_location', 'id')
+ALL_COPIES_ORDERING = ('sort_year', 'sort_location', 'sort_wc_number', 'id')
 
 
-def copy_census_id_sort_key(c):
-    """Sort key for census IDs, handling numeric and alphanumeric formats."""
-    wc_number = c.wc_number if hasattr(c, 'wc_number') and c.wc_number is not None else ''
-    wc_number_a = 0
-    wc_number_b = 0
-    try:
-        if '.' in wc_number:
-            wc_number_a, wc_number_b = wc_number.split('.')
-            wc_number_a, wc_number_b = int(wc_number_a), int(wc_number_b)
-        else:
-            wc_number_a = int(wc_number)
-    except ValueError:
-        pass
-    return (wc_number_a, wc_number_b)
+# Largest number of copies the batch modal endpoint renders in one request
+# (one copy_list page).
+COPY_DATA_BATCH_LIMIT = 100
 
 
-def copy_location_sort_key(c):
-    """Sort key for copy locations."""
-    if c.location is not None:
-        name = getattr(c.location, 'name_of_library_collection', '')
-    else:
-        name = ''
-    return strip_article(name if name else '')
+# Most locations a nearby-locations request returns.
+NEAR_LOCATIONS_LIMIT = 100
+
 
+def copy_detail_queryset():
+    """Copies with everything copy_modal.html touches loaded up front (two queries in all)."""
+    return Copy.objects.select_related(
+        'issue__edition__title', 'location', 'created_by'
+    ).prefetch_related(Prefetch(
+        'provenance_records',
+        queryset=ProvenanceRecord.objects.select_related('provenance_name').order_by('pk'),
+    ))
 
-def copy_shelfmark_sort_key(c):
-    """Sort key for copy shelfmarks."""
-    sm = c.shelfmark
-    return sm if sm else ''
+
+def copy_rows_json(request, rows_template, page_obj, context=None):
+    """
+    Infinite-scroll payload for a keyset page: the rendered table rows plus the
+    URL of the following page (None on the last page).
+    """
+    next_url = None
+    if page_obj.has_next():
+        params = request.GET.copy()
+        params['cursor'] = page_obj.next_cursor
+        params.pop('format', None)
+        next_url = request.path + '?' + params.urlencode()
+    context = dict(context or {}, page_obj=page_obj)
+    return JsonResponse({
+        'rows': render_to_string(rows_template, context, request=request),
+        'next_url': next_url,
+    })
 
 
 # ------------------------------------------------------------------------------
 # Homepage & Search
 # ------------------------------------------------------------------------------
 # homepage: Renders the front page with a grid of titles.
+@census_cached
 def homepage(request):
     """Display the homepage with a grid of titles."""
     gridwidth = 5
-    titlelist = list(Title.objects.all())
-    # Sort by earliest issue year (ascending), then alphabetically
-    def sort_key(title):
-        years = []
-        for ed in title.edition_set.all():
-            for issue in ed.issue_set.all():
-                try:
-                    y = int(issue.year)
-                    years.append(y)
-                except Exception:
-                    continue
-        min_year = min(years) if years else 9999
-        return (min_year, title.title.lower())
-    titlelist = sorted(titlelist, key=sort_key)
+    # Sorted by earliest issue year, then title ignoring case, from the summary
+    # columns kept on Title; the whole list is cached until a title, edition or
+    # issue changes (in any worker: versions are shared, see versioning.py).
+    titlelist = cache.get_or_set(
+        versioning.versioned_key('titles', 'homepage'),
+        lambda: list(Title.objects.order_by('earliest_year', Lower('title'), 'pk')),
+        versioning.CACHE_TIMEOUT,
+    )
     titlerows = [titlelist[i: i + gridwidth]
                  for i in range(0, len(titlelist), gridwidth)]
     return render(request, 'census/frontpage.html', {
@@ -140,6 +145,7 @@ def homepage(request):
 
 
 # search: Unified search endpoint for filtering copies by location, keyword, provenance, gender, or census ID.
+@census_cached
 def search(request, field=None, value=None, order=None):
     """Search for copies based on various criteria."""
     field = field or request.GET.get('field')
@@ -164,12 +170,17 @@ def search(request, field=None, value=None, order=None):
         if field == 'keyword' or field is None and value:
             field = 'keyword'
             display_field = 'Keyword Search'
-            query = (Q(marginalia__icontains=value) |
-                     Q(binding__icontains=value) |
-                     Q(prov_info__icontains=value) |
-                     Q(bibliography__icontains=value) |
-                     Q(provenance_search_names__name__icontains=value))
-            result_list = copy_list.filter(query)
+            result_list = search_index.keyword_filter(copy_list, value)
+            if result_list is None:
+                # No full-text index on this database: fall back to substring scans.
+                query = (Q(marginalia__icontains=value) |
+                         Q(binding__icontains=value) |
+                         Q(prov_info__icontains=value) |
+                         Q(bibliography__icontains=value) |
+                         Q(provenance_records__provenance_name__name__icontains=value))
+                result_list = copy_list.filter(query)
+            elif order is None:
+                order = 'relevance'
         elif field == 'stc' and value:
             display_field = 'STC / Wing'
             result_list = copy_list.filter(issue__stc_wing__icontains=value)
@@ -181,7 +192,11 @@ def search(request, field=None, value=None, order=None):
             year_range = convert_year_range(value)
             if year_range:
                 start, end = year_range
-                result_list = copy_list.filter(issue__start_date__lte=end, issue__end_date__gte=start)
+                # As in the timeline, an issue with no (or an earlier) end year covers its start year only.
+                result_list = copy_list.filter(
+                    Q(issue__end_date__gte=start) | Q(issue__end_date__lt=F('issue__start_date'),
+                                                      issue__start_date__gte=start),
+                    issue__start_date__lte=end)
             else:
                 result_list = copy_list.filter(issue__year__icontains=value)
         elif field == 'location' and value:
@@ -189,7 +204,20 @@ def search(request, field=None, value=None, order=None):
             result_list = copy_list.filter(location__name_of_library_collection__icontains=value)
         elif field == 'provenance_name' and value:
             display_field = 'Provenance Name'
-            result_list = copy_list.filter(provenance_search_names__name__icontains=value)
+            result_list = copy_list.filter(provenance_records__provenance_name__name__icontains=value)
+        elif field == 'gender' and value:
+            # Copies with an owner of the given gender, by code ('F') or label ('Female').
+            display_field = 'Provenance Gender'
+            codes = [code for code, label in ProvenanceName.GENDER_CHOICES
+                     if value.lower() in (code.lower(), label.lower())]
+            result_list = copy_list.filter(provenance_records__provenance_name__gender__in=codes)
+        elif field == 'near' and value:
+            display_field = 'Near'
+            radius = _radius_param(request)
+            display_value = f"{value} (within {radius:g} km)"
+            lat, lon = geo.parse_point(value)
+            found = geo.within(lat, lon, radius)
+            result_list = copy_list.filter(location_id__in=[pk for pk, _ in found])
         elif field == 'unverified':
             display_field = 'Unverified'
             display_value = 'All'
@@ -210,45 +238,32 @@ def search(request, field=None, value=None, order=None):
         display_field = field or "Unknown"
         display_value = value or "None"
 
-    # Remove duplicates
+    # Remove duplicates, then apply any facet values the user picked
     result_list = result_list.distinct()
+    selection = facets.selected(request.GET)
+    result_list = facets.narrow(result_list, selection)
     
-    # Apply sorting
-    if order == 'date':
-        result_list = sorted(result_list, key=lambda c: (
-            int(c.issue.start_date),
-            title_sort_key(c.issue.edition.title),
-            copy_location_sort_key(c)
-        ))
-    elif order == 'title':
-        result_list = sorted(result_list, key=lambda c: (
-            title_sort_key(c.issue.edition.title),
-            int(c.issue.start_date),
-            copy_location_sort_key(c)
-        ))
-    elif order == 'location':
-        result_list = sorted(result_list, key=lambda c: (
-            copy_location_sort_key(c),
-            int(c.issue.start_date),
-            title_sort_key(c.issue.edition.title)
-        ))
-    elif order == 'stc':
-        result_list = sorted(result_list, key=lambda c: (
-            c.issue.stc_wing,
-            copy_location_sort_key(c)
-        ))
-    else:  # Default to date sorting
-        result_list = sorted(result_list, key=lambda c: (
-            int(c.issue.start_date),
-            title_sort_key(c.issue.edition.title),
-            copy_location_sort_key(c)
-        ))
-
-    # Pagination
-    paginator = Paginator(result_list, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
+    # Apply sorting and fetch one keyset page
+    if order == 'relevance':
+        ordering = ('-search_rank', 'id')
+    else:
+        ordering = COPY_ORDERINGS.get(order, COPY_ORDERINGS['date'])
+    page_obj = KeysetPaginator(result_list, ordering, per_page=20).page(request.GET.get('cursor'))
+
+    # Highlight the matched text for the copies on this page only
+    if field == 'keyword' and value:
+        found = search_index.snippets([c.pk for c in page_obj.object_list], value,
+                                      using=copy_list.db)
+        for c in page_obj.object_list:
+            c.snippet = found.get(c.pk)
+
+    if request.GET.get('format') == 'json':
+        return copy_rows_json(request, 'census/search-result-rows.html', page_obj)
+
+    # Everything that narrows result_list identifies its counts; for 'near' that
+    # includes the radius.
+    search_parts = (field, value, _radius_param(request) if field == 'near' else None)
+    facet_counts = facets.counts(result_list, (*search_parts, sorted(selection.items())))
     return render(request, 'census/search-results.html', {
         'icon_path': 'census/images/generic-title-icon.png',
         'value': value,
@@ -256,7 +271,8 @@ def search(request, field=None, value=None, order=None):
         'display_value': display_value,
         'display_field': display_field,
         'page_obj': page_obj,
-        'copy_count': len(result_list)
+        'copy_count': result_list.count(),
+        'facets': facets.present(facet_counts, request.GET, request.path),
     })
 
 
@@ -264,27 +280,23 @@ def search(request, field=None, value=None, order=None):
 # Copy listings & detail modals
 # ------------------------------------------------------------------------------
 # copy_list: Shows all copies for a given Issue.
+@census_cached
 def copy_list(request, id):
     """Display all copies for a given issue."""
     selected_issue = get_object_or_404(Issue, pk=id)
     all_copies = Copy.objects.select_related(
         'location', 'issue__edition__title'
     ).filter(canonical_query & Q(issue=id))
+    page_obj = KeysetPaginator(all_copies, COPY_LIST_ORDERING, per_page=100).page(
+        request.GET.get('cursor'))
 
-    def sort_key(c):
-        try:
-            wc_num = int(c.wc_number)
-        except (ValueError, TypeError):
-            wc_num = float('inf')
-        loc = getattr(c.location, 'name_of_library_collection', '') if c.location else ''
-        shelf = c.shelfmark or ''
-        return (wc_num, loc.lower(), shelf.lower())
-
-    all_copies = sorted(all_copies, key=sort_key)
+    if request.GET.get('format') == 'json':
+        return copy_rows_json(request, 'census/copy-list-rows.html', page_obj)
 
     return render(request, 'census/copy_list.html', {
-        'all_copies': all_copies,
-        'copy_count': len(all_copies),
+        'all_copies': page_obj.object_list,
+        'page_obj': page_obj,
+        'copy_count': all_copies.count(),
         'selected_issue': selected_issue,
         'icon_path': 'census/images/generic-title-icon.png',
         'title': selected_issue.edition.title
@@ -292,18 +304,32 @@ def copy_list(request, id):
 
 
 # copy_data: Renders modal with details for a single copy.
+@census_cached
 def copy_data(request, copy_id):
     """Display detailed information for a single copy."""
-    selected_copy = get_object_or_404(Copy, pk=copy_id)
+    selected_copy = get_object_or_404(copy_detail_queryset(), pk=copy_id)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return render(request, 'census/copy_modal.html', {'copy': selected_copy})
-    return render(request, 'census/copy_detail.html', {'copy': selected_copy})
+    return render(request, 'census/copy_page.html', {'copy': selected_copy})
+
+
+# copy_data_batch: Modal HTML for several copies at once, keyed by copy id.
+@census_cached
+def copy_data_batch(request):
+    """Render the detail modals for ?ids=1,2,3 so the page can open them without a round trip."""
+    ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip().isdigit()]
+    copies = copy_detail_queryset().filter(pk__in=ids[:COPY_DATA_BATCH_LIMIT])
+    return JsonResponse({'modals': {
+        str(copy.pk): render_to_string('census/copy_modal.html', {'copy': copy}, request=request)
+        for copy in copies
+    }})
 
 
 # copy_page: Standalone page for a copy, looked up by WC number.
+@census_cached
 def copy_page(request, wc_number):
     try:
-        copy = Copy.objects.get(wc_number=wc_number)
+        copy = copy_detail_queryset().get(wc_number=wc_number)
     except Copy.DoesNotExist:
         return render(request, '404.html', status=404)
     return render(request, 'census/copy_page.html', {'copy': copy})
@@ -328,16 +354,17 @@ def cen_copy_modal(request, wc_number):
 # Issue list (per title)
 # ------------------------------------------------------------------------------
 # issue_list: Shows all issues for a given title, with edition and copy counts.
+@census_cached
 def issue_list(request, id):
     """Display all issues for a given title."""
     selected_title = get_object_or_404(Title, pk=id)
     editions = selected_title.edition_set.all()
     issues = [issue for ed in editions for issue in ed.issue_set.all()]
     issues.sort(key=lambda i: (
-        int(i.edition.edition_number) if i.edition.edition_number.isdigit() else float('inf'),
+        int(i.edition.edition_number) if (i.edition.edition_number or '').isdigit() else float('inf'),
         i.start_date,
         i.end_date,
-        i.stc_wing
+        i.pk
     ))
     # Sort editions for display (if used in play-title icons)
     editions = sorted(editions, key=lambda ed: title_sort_key(ed.title))
@@ -368,30 +395,12 @@ def about(request, viewname='about'):
         return render(request, 'census/advisoryboard.html')
 
     template = loader.get_template('census/about.html')
-    copy_count = models.Copy.objects.filter(canonical_query & Q(fragment=False)).count()
-    fragment_copy_count = models.Copy.objects.filter(fragment=True).count()
-    facsimile_copy_count = models.Copy.objects.filter(
-        ~Q(digital_facsimile_url=None) & ~Q(digital_facsimile_url='')
-    ).count()
-    if copy_count > 0:
-        facsimile_copy_percent = round(100 * facsimile_copy_count / copy_count)
-    else:
-        facsimile_copy_percent = 0
+    texts = [s.content for s in models.StaticPageText.objects.filter(viewname=viewname)]
 
     # Robust context for all likely-used placeholders in StaticPageText/about
     pre_render_context = {
-        'copy_count': str(copy_count),
-        'verified_copy_count': str(models.Copy.objects.filter(verified_query).count()),
-        'unverified_copy_count': str(models.Copy.objects.filter(unverified_query).count()),
         'current_date': '{d:%d %B %Y}'.format(d=datetime.now()),
         'today': '{d:%d %B %Y}'.format(d=datetime.now()),  # alias for {today}
-        'fragment_copy_count': str(fragment_copy_count),
-        'facsimile_copy_count': str(facsimile_copy_count),
-        'facsimile_count': str(facsimile_copy_count),  # alias for {facsimile_count}
-        'facsimile_copy_percent': '{}%'.format(facsimile_copy_percent),
-        'facsimile_percent': '{}%'.format(facsimile_copy_percent),  # alias for {facsimile_percent}
-        'estc_copy_count': str(models.Copy.objects.filter(from_estc=True).count()),
-        'non_estc_copy_count': str(models.Copy.objects.filter(from_estc=False).count()),
         'search_url': reverse('search') + '?field=unverified',  
         'csv_url': reverse('location_copy_count_csv_export'),
         'homepage_url': reverse('homepage'),
@@ -403,8 +412,29 @@ def about(request, viewname='about'):
         # Add more keys here as needed for future static text placeholders
     }
 
-    content = [s.content.format(**pre_render_context)
-               for s in models.StaticPageText.objects.filter(viewname=viewname)]
+    # Census counts are only looked up when the page text uses one of them
+    if any('_count' in t or '_percent' in t for t in texts if t):
+        stats = census_statistics()
+        copy_count = stats['copy_count']
+        facsimile_copy_count = stats['facsimile_copy_count']
+        if copy_count > 0:
+            facsimile_copy_percent = round(100 * facsimile_copy_count / copy_count)
+        else:
+            facsimile_copy_percent = 0
+        pre_render_context.update({
+            'copy_count': str(copy_count),
+            'verified_copy_count': str(stats['verified_copy_count']),
+            'unverified_copy_count': str(stats['unverified_copy_count']),
+            'fragment_copy_count': str(stats['fragment_copy_count']),
+            'facsimile_copy_count': str(facsimile_copy_count),
+            'facsimile_count': str(facsimile_copy_count),  # alias for {facsimile_count}
+            'facsimile_copy_percent': '{}%'.format(facsimile_copy_percent),
+            'facsimile_percent': '{}%'.format(facsimile_copy_percent),  # alias for {facsimile_percent}
+            'estc_copy_count': str(stats['estc_copy_count']),
+            'non_estc_copy_count': str(stats['non_estc_copy_count']),
+        })
+
+    content = [t.format(**pre_render_context) for t in texts if t is not None]
     context = {
         'content': content,
     }
@@ -413,84 +443,205 @@ def about(request, viewname='about'):
 # ------------------------------------------------------------------------------
 # CSV exports
 # ------------------------------------------------------------------------------
+# Exports are streamed: each is one grouped aggregate query read in chunks and
+# written row by row, so memory use stays flat however many rows there are.
+class Echo:
+    """Pseudo-buffer whose write() hands back the line, so csv.writer can feed a generator."""
+    def write(self, value):
+        return value
+
+
+def stream_csv(filename, header, rows):
+    """StreamingHttpResponse that writes `header` and then each row of the `rows` iterable."""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    resp = StreamingHttpResponse(lines(), content_type='text/csv')
+    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return resp
+
+
 # location_copy_count_csv_export: Exports a CSV of locations and their copy counts.
 def location_copy_count_csv_export(request):
-    qs = Copy.objects.values('location').annotate(total=Count('location'))
-    resp = HttpResponse(content_type='text/csv')
-    resp['Content-Disposition'] = 'attachment; filename="census_location_copy_count.csv"'
-    w = csv.writer(resp)
-    w.writerow(['Location', 'Number of Copies'])
-    for row in qs:
-        loc = Location.objects.filter(pk=row['location']).first()
-        w.writerow([loc.name_of_library_collection if loc else 'Unknown', row['total']])
-    return resp
+    qs = (Copy.objects
+          .values('location', 'location__name_of_library_collection')
+          .annotate(total=Count('location'))
+          .order_by('location__name_of_library_collection', 'location'))
+    rows = ([row['location__name_of_library_collection'] if row['location'] else 'Unknown', row['total']]
+            for row in qs.iterator(chunk_size=2000))
+    return stream_csv('census_location_copy_count.csv', ['Location', 'Number of Copies'], rows)
 
 
 # year_issue_copy_count_csv_export: Exports a CSV of issues and their copy counts.
 def year_issue_copy_count_csv_export(request):
-    qs = Copy.objects.values('issue').annotate(total=Count('issue'))
-    resp = HttpResponse(content_type='text/csv')
-    resp['Content-Disposition'] = 'attachment; filename="census_year_issue_copy_count.csv"'
-    w = csv.writer(resp)
-    w.writerow(['Year', 'Title', 'Number of Copies'])
-    for row in qs:
-        iss = Issue.objects.filter(pk=row['issue']).first()
-        if iss:
-            w.writerow([iss.start_date, iss.edition.title.title, row['total']])
-    return resp
+    qs = (Copy.objects
+          .filter(issue__isnull=False)
+          .values('issue', 'issue__start_date', 'issue__edition__title__title')
+          .annotate(total=Count('issue'))
+          .order_by('issue__start_date', 'issue__edition__title__title', 'issue'))
+    rows = ([row['issue__start_date'], row['issue__edition__title__title'], row['total']]
+            for row in qs.iterator(chunk_size=2000))
+    return stream_csv('census_year_issue_copy_count.csv', ['Year', 'Title', 'Number of Copies'], rows)
 
 
 # export: Generic CSV export for groupby/aggregate queries.
 def export(request, groupby, column, aggregate):
     agg = Sum if aggregate == 'sum' else Count
+    # Never group or aggregate through the user accounts attached to copies.
+    if 'created_by' in groupby or 'created_by' in column:
+        raise Http404("Invalid groupby or aggregate")
     try:
         qs = Copy.objects.values(groupby).annotate(agg=agg(column)).order_by(groupby)
     except Exception:
         raise Http404("Invalid groupby or aggregate")
     fn = f"census_{aggregate}_of_{column}_for_each_{groupby}.csv"
-    resp = HttpResponse(content_type='text/csv')
-    resp['Content-Disposition'] = f'attachment; filename="{fn}"'
-    w = csv.writer(resp)
-    w.writerow([groupby, f"{aggregate} of {column}"])
-    for row in qs:
-        w.writerow([row[groupby], row['agg']])
+    rows = ([row[groupby], row['agg']] for row in qs.iterator(chunk_size=2000))
+    return stream_csv(fn, [groupby, f"{aggregate} of {column}"], rows)
+
+
+# census_dump: Staff-only streaming download of the whole census, one row per copy.
+@staff_member_required
+def census_dump(request):
+    fmt = request.GET.get('format', 'ndjson')
+    rows = dump.iter_rows()
+    if fmt == 'parquet':
+        try:
+            resp = StreamingHttpResponse(dump.iter_parquet(rows),
+                                         content_type='application/vnd.apache.parquet')
+        except ImportError as exc:
+            return HttpResponse(str(exc), status=501, content_type='text/plain')
+        filename = 'wheatley_census.parquet'
+    elif fmt == 'ndjson':
+        resp = StreamingHttpResponse(dump.iter_ndjson_gz(rows), content_type='application/gzip')
+        filename = 'wheatley_census.ndjson.gz'
+    else:
+        raise Http404("Unknown dump format")
+    resp['Content-Disposition'] = f'attachment; filename="{filename}"'
     return resp
 
 
+# metrics: Staff-only per-view request histograms and database pool statistics in Prometheus text format.
+@staff_member_required
+def metrics_view(request):
+    return HttpResponse(metrics.render(db.pool_stats()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# ------------------------------------------------------------------------------
+# Map data
+# ------------------------------------------------------------------------------
+def _int_param(request, name):
+    value = request.GET.get(name, '')
+    return int(value) if value.isdigit() else None
+
+
+def _radius_param(request):
+    """?radius=<km>, defaulting to geo.DEFAULT_RADIUS_KM; at most half the globe."""
+    try:
+        radius = float(request.GET.get('radius', geo.DEFAULT_RADIUS_KM))
+    except ValueError:
+        radius = geo.DEFAULT_RADIUS_KM
+    if not radius > 0:
+        radius = geo.DEFAULT_RADIUS_KM
+    return min(radius, geo.HALF_CIRCUMFERENCE_KM)
+
+
+# map_data: Clustered GeoJSON of holding locations with canonical copy counts (see geo.py).
+@census_cached
+def map_data(request):
+    """?zoom=<0-18> plus optional title=<id>, issue=<id> or collection=<slug> filters."""
+    collection = request.GET.get('collection') or None
+    if collection is not None and copy_collections.get(collection) is None:
+        raise Http404('Unknown collection')
+    zoom = _int_param(request, 'zoom')
+    data = geo.feature_collection(
+        geo.DEFAULT_ZOOM if zoom is None else zoom,
+        title=_int_param(request, 'title'),
+        issue=_int_param(request, 'issue'),
+        collection=collection,
+    )
+    return JsonResponse(data, content_type='application/geo+json')
+
+
+# near_locations: Locations within ?radius= km of ?point=, or the ?k= nearest ones.
+@census_cached
+def near_locations(request):
+    """Nearby holding locations, optionally only those with copies of ?issue= or ?title=."""
+    try:
+        lat, lon = geo.parse_point(request.GET.get('point', ''))
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    issue, title = _int_param(request, 'issue'), _int_param(request, 'title')
+    k = _int_param(request, 'k')
+    if k:
+        found = geo.nearest(lat, lon, min(k, NEAR_LOCATIONS_LIMIT), issue=issue, title=title)
+    else:
+        found = geo.within(lat, lon, _radius_param(request), issue=issue, title=title)
+    return JsonResponse({'locations': geo.describe(found[:NEAR_LOCATIONS_LIMIT], issue=issue, title=title)})
+
+
+# ------------------------------------------------------------------------------
+# Timeline
+# ------------------------------------------------------------------------------
+# year_timeline: Canonical copies per year, in total and by title (see timeline.py).
+@census_cached
+def year_timeline(request):
+    """Optional ?title=<id>, ?start=<year> and ?end=<year> narrow the timeline."""
+    data = timeline.timeline(title=_int_param(request, 'title'),
+                             start=_int_param(request, 'start'),
+                             end=_int_param(request, 'end'))
+    # A year's copies are listed by the year search.
+    data['search_url'] = f"{reverse('search')}?field=year&value="
+    return JsonResponse(data)
+
+
+# ------------------------------------------------------------------------------
+# Provenance network
+# ------------------------------------------------------------------------------
+# provenance_network: Owners linked to a provenance name through shared copies (see provenance_graph.py).
+@census_cached
+def provenance_network(request, owner_id):
+    """?depth=<0-4> steps (default 2), optionally only through copies of ?title=<id>."""
+    if not ProvenanceName.objects.filter(pk=owner_id).exists():
+        raise Http404('Unknown provenance name')
+    depth = _int_param(request, 'depth')
+    return JsonResponse(provenance_graph.neighborhood(
+        owner_id,
+        depth=provenance_graph.DEFAULT_DEPTH if depth is None else depth,
+        title=_int_param(request, 'title'),
+    ))
+
+
 # ------------------------------------------------------------------------------
 # Autocomplete endpoints
 # ------------------------------------------------------------------------------
 # autofill_location: Returns location suggestions for autocomplete.
+@db.retry_on_disconnect
 def autofill_location(request, query=None):
     """Autocomplete endpoint for locations."""
-    if query is not None:
-        location_matches = Location.objects.filter(name__icontains=query)
-        match_object = {'matches': [m.name for m in location_matches]}
-    else:
-        match_object = {'matches': []}
-    return JsonResponse(match_object)
+    matches = autocomplete.locations.search(query) if query is not None else []
+    return JsonResponse({'matches': matches})
 
 
 # autofill_provenance: Returns provenance name suggestions for autocomplete.
+@db.retry_on_disconnect
 def autofill_provenance(request, query=None):
     """Autocomplete endpoint for provenance names."""
-    if query is not None:
-        prov_matches = ProvenanceName.objects.filter(name__icontains=query)
-        match_object = {'matches': [m.name for m in prov_matches]}
-    else:
-        match_object = {'matches': []}
-    return JsonResponse(match_object)
+    matches = autocomplete.provenance_names.search(query) if query is not None else []
+    return JsonResponse({'matches': matches})
 
 
-# autofill_collection: Returns static collection choices for autocomplete.
+# autofill_collection: Returns the browse collections, with copy counts, for autocomplete.
+@db.retry_on_disconnect
 def autofill_collection(request, query=None):
     """Autocomplete endpoint for collections."""
+    counts = copy_collections.counts()
     collection = [
-        {'label': 'With known early provenance (before 1700)', 'value': 'earlyprovenance'},
-        {'label': 'With a known woman owner', 'value': 'womanowner'},
-        {'label': 'With a known woman owner before 1800', 'value': 'earlywomanowner'},
-        {'label': 'Includes marginalia', 'value': 'marginalia'},
-        {'label': 'In an early sammelband', 'value': 'earlysammelband'}
+        {'label': c.label, 'value': c.slug, 'count': counts[c.slug]}
+        for c in copy_collections.COLLECTIONS
     ]
     return JsonResponse({'matches': collection})
 
@@ -498,26 +649,10 @@ def autofill_collection(request, query=None):
 # get_collection: Helper to filter queryset by collection type.
 def get_collection(copy_list, coll_name):
     """Get a filtered collection of copies based on collection name."""
-    if coll_name == 'earlyprovenance':
-        results = copy_list.filter(provenance_search_names__start_century='17')
-        display = 'Copies with known early provenance (before 1700)'
-    elif coll_name == 'womanowner':
-        results = copy_list.filter(provenance_search_names__gender='F')
-        display = 'Copies with a known woman owner'
-    elif coll_name == 'earlywomanowner':
-        results = copy_list.filter(
-            Q(provenance_search_names__gender='F') &
-            (Q(provenance_search_names__start_century='17') |
-             Q(provenance_search_names__start_century='18'))
-        )
-        display = 'Copies with a known woman owner before 1800'
-    elif coll_name == 'marginalia':
-        results = copy_list.exclude(Q(marginalia='') | Q(marginalia=None))
-        display = 'Copies that include marginalia'
-    elif coll_name == 'earlysammelband':
-        results = copy_list.filter(in_early_sammelband=True)
-        display = 'Copies in an early sammelband'
-    return results, display
+    collection = copy_collections.get(coll_name)
+    if collection is None:
+        return copy_list.none(), 'Unknown collection'
+    return copy_collections.members(copy_list, coll_name), collection.display
 
 
 # ------------------------------------------------------------------------------
@@ -567,8 +702,8 @@ def detail(request, id):
 
 def copy(request, id):
     selected_issue = get_object_or_404(Issue, pk=id)
-    all_copies = Copy.objects.filter(issue__id=id).order_by('location__name', 'Shelfmark')
-    all_copies = sorted(all_copies, key=copy_sort_key)
+    all_copies = Copy.objects.select_related('location').filter(issue__id=id).order_by(
+        'sort_location', 'shelfmark', 'sort_wc_number')
     context = {
         'all_copies': all_copies,
         'selected_issue': selected_issue,
@@ -592,21 +727,19 @@ def issue_sort_key(issue):
         getattr(issue, 'stc_wing', '')
     )
 
+@census_cached
 def all_copies_list(request):
-    """Display all copies across all issues, sorted by year, location, shelfmark."""
-    all_copies = Copy.objects.select_related('location', 'issue__edition__title').all()
-    def sort_key(c):
-        year_str = getattr(c.issue, 'year', None)
-        try:
-            year = int(year_str)
-        except (TypeError, ValueError):
-            year = 9999  # Put missing/invalid years at the end
-        loc = getattr(c.location, 'name_of_library_collection', '') if c.location else ''
-        shelf = c.shelfmark or ''
-        return (year, loc.lower(), shelf.lower())
-    all_copies = sorted(all_copies, key=sort_key)
+    """Display all copies across all issues, sorted by year, location and WC number."""
+    all_copies = Copy.objects.select_related('location', 'issue__edition__title')
+    page_obj = KeysetPaginator(all_copies, ALL_COPIES_ORDERING, per_page=100).page(
+        request.GET.get('cursor'))
+
+    if request.GET.get('format') == 'json':
+        return copy_rows_json(request, 'census/search-result-rows.html', page_obj)
+
     return render(request, 'census/all_copies_list.html', {
-        'all_copies': all_copies,
-        'copy_count': len(all_copies),
+        'all_copies': page_obj.object_list,
+        'page_obj': page_obj,
+        'copy_count': all_copies.count(),
         'icon_path': 'census/images/generic-title-icon.png',
     })
\ No newline at end of file